@@ -1,5 +1,17 @@
-from app.gui.main import main
+import sys
+
+
+def _main() -> int:
+    # Headless subcommands skip the GUI (and its PySide6 import) entirely.
+    if len(sys.argv) > 1 and sys.argv[1] in ("chunk", "validate", "diff", "classify", "export"):
+        from app.cli import main as cli_main
+
+        return cli_main(sys.argv[1:])
+
+    from app.gui.main import main
+
+    return main()
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(_main())
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+# Headless entry point for scripted runs and CI.
+#
+# This module must stay Qt-free: it only imports `app.core` modules, and the
+# Snowflake connector is imported lazily by the export path when it connects.
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.core.csv_chunker import CsvChunkerError, chunk_csv
+from app.core.csv_validator import CsvValidationError, validate_csv
+from app.core.dedupe import DEDUPE_MEMORY_MB
+from app.core.output_codec import DEFAULT_LEVEL, OUTPUT_CODECS
+from app.core.priority_rules import PriorityRulesError, evaluate_skuextract
+from app.core.row_sort import SORT_MEMORY_MB
+from app.core.snapshot_diff import MAX_INDEX_ROWS, SnapshotDiffError, diff_snapshots
+from app.core.snowflake_export import DEFAULT_QUERY, SnowflakeExportError, export_query_to_chunked_csv
+
+
+class CliError(RuntimeError):
+    pass
+
+
+def _log_to_stderr(quiet: bool):
+    if quiet:
+        return None
+
+    def log(msg: str) -> None:
+        print(msg, file=sys.stderr, flush=True)
+
+    return log
+
+
+def _spool_stdin() -> Path:
+    """Copy CSV bytes from stdin into a system temp file (not the upload folder) so the chunker can stream it."""
+    fd, name = tempfile.mkstemp(prefix="locpriority-stdin-", suffix=".csv")
+    with open(fd, "wb") as fp:
+        shutil.copyfileobj(sys.stdin.buffer, fp, 1024 * 1024)
+    return Path(name)
+
+
+def _read_query(args: argparse.Namespace) -> str:
+    if args.query is not None:
+        return args.query
+    if args.query_file == "-":
+        return sys.stdin.read()
+    if args.query_file:
+        try:
+            return Path(args.query_file).read_text(encoding="utf-8")
+        except OSError as exc:
+            raise CliError(f"Failed to read query file: {exc}") from exc
+    return DEFAULT_QUERY
+
+
+def _cmd_chunk(args: argparse.Namespace) -> dict:
+    spooled = None
+    input_csv = args.input
+    try:
+        if input_csv == "-":
+            if not Path(args.output_dir).is_dir():
+                raise CliError(f"Output folder not found: {args.output_dir}")
+            spooled = _spool_stdin()
+            input_csv = str(spooled)
+        return chunk_csv(
+            input_csv=input_csv,
+            output_dir=args.output_dir,
+            base_name=args.base_name,
+            max_rows=args.max_rows,
+            max_parts=args.max_parts,
+            include_header=not args.no_header,
+            plain_single_file=not args.numbered,
+            writers=args.writers,
+            reader=args.reader,
+            validate_required_columns=not args.no_validate,
+            check_values=args.check_values,
+            dedupe=args.dedupe,
+            dedupe_memory_mb=args.dedupe_memory_mb,
+            sort=args.sort,
+            sort_memory_mb=args.sort_memory_mb,
+            pack=args.pack_locs,
+            codec=args.codec,
+            compress_level=args.compress_level,
+            trace=args.trace,
+            on_progress=None,
+            on_log=_log_to_stderr(args.quiet),
+        )
+    finally:
+        if spooled is not None:
+            try:
+                spooled.unlink()
+            except OSError:
+                pass
+
+
+def _cmd_validate(args: argparse.Namespace) -> dict:
+    return validate_csv(
+        input_csv=args.input,
+        workers=args.workers,
+        max_examples=args.max_examples,
+        on_log=_log_to_stderr(args.quiet),
+    )
+
+
+def _cmd_diff(args: argparse.Namespace) -> dict:
+    return diff_snapshots(
+        previous_csv=args.previous,
+        current_csv=args.current,
+        output_dir=args.output_dir,
+        base_name=args.base_name,
+        max_rows=args.max_rows,
+        max_parts=args.max_parts,
+        include_header=not args.no_header,
+        plain_single_file=not args.numbered,
+        writers=args.writers,
+        max_index_rows=args.max_index_rows,
+        on_log=_log_to_stderr(args.quiet),
+    )
+
+
+def _cmd_classify(args: argparse.Namespace) -> dict:
+    return evaluate_skuextract(
+        input_csv=args.input,
+        output_dir=args.output_dir,
+        base_name=args.base_name,
+        max_rows=args.max_rows,
+        max_parts=args.max_parts,
+        include_header=not args.no_header,
+        plain_single_file=not args.numbered,
+        writers=args.writers,
+        engine=args.engine,
+        on_log=_log_to_stderr(args.quiet),
+    )
+
+
+def _cmd_export(args: argparse.Namespace) -> dict:
+    return export_query_to_chunked_csv(
+        email=args.email,
+        query=_read_query(args),
+        output_dir=args.output_dir,
+        base_name=args.base_name,
+        max_rows=args.max_rows,
+        max_parts=args.max_parts,
+        include_header=not args.no_header,
+        plain_single_file=not args.numbered,
+        writers=args.writers,
+        arrow=args.arrow,
+        prefetch=args.prefetch,
+        fetch_size=args.fetch_size,
+        async_query=args.async_query,
+        query_state_dir=args.query_state_dir,
+        cache=args.cache,
+        cache_dir=args.cache_dir,
+        refresh_cache=args.refresh_cache,
+        sort=args.sort,
+        sort_memory_mb=args.sort_memory_mb,
+        pack=args.pack_locs,
+        codec=args.codec,
+        compress_level=args.compress_level,
+        trace=args.trace,
+        insecure_mode=not args.secure,
+        account=args.account,
+        authenticator=args.authenticator,
+        on_log=_log_to_stderr(args.quiet),
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli",
+        description="Headless LOCPRIORITY upload builder. Prints a JSON result on stdout.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_output_args(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--output-dir", required=True, help="Folder to write the upload file(s) into.")
+        p.add_argument("--base-name", default="LOCPRIORITY_UPLOAD", help="Base file name for the output.")
+        p.add_argument("--max-rows", type=int, default=60000, help="Maximum data rows per file.")
+        p.add_argument("--max-parts", type=int, default=None, help="Fail if more than this many files are needed.")
+        p.add_argument(
+            "--numbered", action="store_true", help="Always name files <base>_001.csv, even for a single file."
+        )
+        p.add_argument("--writers", type=int, default=2, help="Part-writer threads (0 writes inline).")
+        p.add_argument("--no-header", action="store_true", help="Do not write a header row.")
+        p.add_argument("--quiet", action="store_true", help="Do not write log lines to stderr.")
+
+    def add_sort_args(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--sort", action="store_true", help="Order rows by loc, then item, before writing.")
+        p.add_argument(
+            "--sort-memory-mb",
+            type=int,
+            default=None,
+            help=f"Memory for in-memory sort runs before --sort/--pack-locs spill to disk (default {SORT_MEMORY_MB}).",
+        )
+        p.add_argument(
+            "--pack-locs",
+            action="store_true",
+            help="Keep each loc's rows in one file, packing whole locs into as few files as fit (implies --sort).",
+        )
+
+    def add_codec_args(p: argparse.ArgumentParser) -> None:
+        p.add_argument(
+            "--codec",
+            choices=OUTPUT_CODECS,
+            default="none",
+            help="Compress the output: gzip (<part>.csv.gz) or zip (all parts in <base>.zip).",
+        )
+        p.add_argument("--compress-level", type=int, default=DEFAULT_LEVEL, help="Compression level, 0-9.")
+
+    p_chunk = sub.add_parser("chunk", help="Split an input CSV into upload files.")
+    p_chunk.add_argument("--input", required=True, help="Input CSV path, or '-' to read from stdin.")
+    p_chunk.add_argument("--no-validate", action="store_true", help="Skip the item/loc/locpriority check.")
+    p_chunk.add_argument(
+        "--reader", default="auto", choices=("auto", "arrow", "numpy", "csv", "bytes"), help="Input CSV reader backend."
+    )
+    p_chunk.add_argument(
+        "--check-values", action="store_true", help="Fail on bad item/loc/locpriority values before writing."
+    )
+    p_chunk.add_argument("--dedupe", action="store_true", help="Drop duplicate item/loc/locpriority rows.")
+    p_chunk.add_argument(
+        "--dedupe-memory-mb",
+        type=int,
+        default=None,
+        help=f"Memory for seen keys before --dedupe spills to disk (default {DEDUPE_MEMORY_MB}).",
+    )
+    p_chunk.add_argument("--trace", action="store_true", help="Also write timings to <base>.trace.json.")
+    add_sort_args(p_chunk)
+    add_output_args(p_chunk)
+    add_codec_args(p_chunk)
+    p_chunk.set_defaults(handler=_cmd_chunk)
+
+    p_validate = sub.add_parser("validate", help="Check an input CSV's item/loc/locpriority values.")
+    p_validate.add_argument("--input", required=True, help="Input CSV path.")
+    p_validate.add_argument("--workers", type=int, default=None, help="Checker processes (default: one per CPU).")
+    p_validate.add_argument("--max-examples", type=int, default=20, help="Offending lines to report.")
+    p_validate.add_argument("--quiet", action="store_true", help="Do not write log lines to stderr.")
+    p_validate.set_defaults(handler=_cmd_validate)
+
+    p_diff = sub.add_parser("diff", help="Write the week-over-week changes between two snapshot CSVs.")
+    p_diff.add_argument("--previous", required=True, help="Last week's item/loc/locpriority snapshot.")
+    p_diff.add_argument("--current", required=True, help="This week's snapshot.")
+    p_diff.add_argument(
+        "--max-index-rows",
+        type=int,
+        default=MAX_INDEX_ROWS,
+        help="Above this many (item, loc) pairs, sort to disk and merge-join instead.",
+    )
+    add_output_args(p_diff)
+    p_diff.set_defaults(handler=_cmd_diff)
+
+    p_classify = sub.add_parser(
+        "classify", help="Apply the v_LOCPRIORITY_UPLOAD rules to a skuextract CSV and write upload files."
+    )
+    p_classify.add_argument("--input", required=True, help="skuextract CSV (item, loc, udc_source_1/2/3, ...).")
+    p_classify.add_argument(
+        "--engine", default="auto", choices=("auto", "arrow", "python"), help="Vectorized (arrow) or row engine."
+    )
+    add_output_args(p_classify)
+    p_classify.set_defaults(handler=_cmd_classify)
+
+    p_export = sub.add_parser("export", help="Run a Snowflake query and write upload files.")
+    p_export.add_argument("--email", required=True, help="HD Supply email used for SSO.")
+    q = p_export.add_mutually_exclusive_group()
+    q.add_argument("--query", help="SQL text to run (defaults to the built-in weekly query).")
+    q.add_argument("--query-file", help="File holding the SQL to run, or '-' to read it from stdin.")
+    p_export.add_argument("--account", default="HDSUPPLY-DATA")
+    p_export.add_argument("--authenticator", default="externalbrowser")
+    p_export.add_argument("--secure", action="store_true", help="Connect without insecure_mode.")
+    p_export.add_argument("--arrow", action="store_true", help="Fetch Arrow batches (needs pyarrow).")
+    p_export.add_argument(
+        "--prefetch", type=int, default=4, help="Batches fetched ahead on a background thread (0 fetches inline)."
+    )
+    p_export.add_argument(
+        "--fetch-size", type=int, default=None, help="Rows per fetch (default: adapt to the measured throughput)."
+    )
+    p_export.add_argument(
+        "--async-query",
+        action="store_true",
+        help="Submit asynchronously and save the query ID, so a re-run re-attaches to the result.",
+    )
+    p_export.add_argument(
+        "--query-state-dir", default=None, help="Saved query ID folder (default: next to the result cache)."
+    )
+    p_export.add_argument(
+        "--cache", action="store_true", help="Reuse today's result of the same query from the local result cache."
+    )
+    p_export.add_argument("--cache-dir", default=None, help="Result cache folder (default: the user cache folder).")
+    p_export.add_argument(
+        "--refresh-cache", action="store_true", help="With --cache, query Snowflake anyway and replace today's entry."
+    )
+    p_export.add_argument("--trace", action="store_true", help="Also write timings to <base>.trace.json.")
+    add_sort_args(p_export)
+    add_output_args(p_export)
+    add_codec_args(p_export)
+    p_export.set_defaults(handler=_cmd_export)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        result = args.handler(args)
+    except (CliError, CsvChunkerError, CsvValidationError, PriorityRulesError, SnapshotDiffError, SnowflakeExportError) as exc:
+        payload = {"ok": False, "command": args.command, "error": str(exc)}
+        code = 1
+    except Exception as exc:  # noqa: BLE001
+        payload = {"ok": False, "command": args.command, "error": f"{type(exc).__name__}: {exc}"}
+        code = 1
+    else:
+        # A validation report with errors is a result, but still a failed run.
+        ok = not result.get("error_count")
+        payload = {"ok": ok, "command": args.command, **result}
+        code = 0 if ok else 1
+    payload["elapsed_s"] = round(time.perf_counter() - started, 3)
+
+    print(json.dumps(payload, default=str))
+    return code
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+# Optional columnar (Apache Arrow) helpers.
+#
+# pyarrow is not a hard dependency: it is imported lazily, and callers fall
+# back to the row-based path when it is not installed.
+
+import csv
+import io
+from typing import BinaryIO, Iterator, Sequence
+
+
+def load_pyarrow():
+    """Return `(pyarrow, pyarrow.csv)`; raises ImportError when unavailable."""
+    import pyarrow  # type: ignore
+    import pyarrow.csv as pacsv  # type: ignore
+
+    return pyarrow, pacsv
+
+
+def pyarrow_available() -> bool:
+    try:
+        load_pyarrow()
+    except Exception:  # noqa: BLE001
+        return False
+    return True
+
+
+def header_bytes(header: Sequence[str]) -> bytes:
+    """Header line encoded exactly as the csv-module writer would emit it."""
+    buf = io.StringIO()
+    csv.writer(buf).writerow(header)
+    return buf.getvalue().encode("utf-8")
+
+
+def needs_quoting(table) -> bool:  # noqa: ANN001
+    """True if the csv module would quote any field of this table/batch."""
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+
+    if table.num_columns == 1:
+        # The csv module quotes a lone empty field; leave that case to it.
+        return True
+    for col in table.columns:
+        if pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+            if pc.any(pc.match_substring_regex(col, '[",\r\n]')).as_py():
+                return True
+    return False
+
+
+class ArrowCsvEncoder:
+    """Part encoder for Arrow tables / record batches (see `ChunkWriter`).
+
+    Batches whose string columns need no quoting are serialized by Arrow's
+    vectorized CSV writer; the rest go through the csv module. Either way
+    string data is byte-identical to the csv-module path.
+    """
+
+    def __init__(self, indices: Sequence[int] | None = None) -> None:
+        self.indices = list(indices) if indices is not None else None
+        _, pacsv = load_pyarrow()
+        self._options = pacsv.WriteOptions(include_header=False, quoting_style="none", eol="\r\n")
+
+    def open(self, fp: BinaryIO, header: Sequence[str] | None) -> "_ArrowCsvSink":
+        return _ArrowCsvSink(fp, header, self)
+
+
+class _ArrowCsvSink:
+    def __init__(self, fp: BinaryIO, header: Sequence[str] | None, encoder: ArrowCsvEncoder) -> None:
+        _, self._pacsv = load_pyarrow()
+        self._encoder = encoder
+        self._fp = fp
+        if header is not None:
+            self._fp.write(header_bytes(header))
+
+    def write(self, table) -> None:  # noqa: ANN001
+        if self._encoder.indices is not None:
+            table = table.select(self._encoder.indices)
+        if needs_quoting(table):
+            buf = io.StringIO()
+            csv.writer(buf).writerows(zip(*(col.to_pylist() for col in table.columns)))
+            self._fp.write(buf.getvalue().encode("utf-8"))
+        else:
+            self._pacsv.write_csv(table, self._fp, write_options=self._encoder._options)
+
+    def close(self) -> None:
+        self._fp.close()
+
+
+def iter_arrow_batches(cur) -> Iterator:  # noqa: ANN001
+    """Yield non-empty Arrow tables from a cursor's `fetch_arrow_batches()`."""
+    for table in cur.fetch_arrow_batches():
+        if table is not None and table.num_rows:
+            yield table
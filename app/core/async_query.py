@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+# Asynchronous query submission that survives an app restart.
+#
+# The query is submitted with execute_async() and its ID is saved to a
+# state file before waiting on it. State files live next to the result
+# cache (see `default_state_dir`), never in the output folder, which is
+# uploaded as is; each is named for the base name and output folder it
+# serves. A later run of the same SQL, on the same account and role and
+# the same snapshot date (the queries use current_date(), like
+# `ResultCache` keys), re-attaches to that query (running or finished)
+# instead of submitting it again; Snowflake keeps query results for 24
+# hours. Waiting polls with backoff until a deadline, and a cancel event
+# stops it early; either way the state file is kept so a later run can
+# re-attach.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+POLL_START_S = 0.5
+POLL_MAX_S = 5.0
+RESULT_TTL_S = 23 * 3600
+WAIT_TIMEOUT_S = 4 * 3600
+
+
+class AsyncQueryError(RuntimeError):
+    pass
+
+
+def default_state_dir() -> Path:
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "LocPriority-BY" / "queries"
+
+
+def state_path(output_dir: str | Path, base_name: str, state_dir: str | Path | None = None) -> Path:
+    folder = hashlib.sha256(str(Path(output_dir).resolve()).encode("utf-8")).hexdigest()[:16]
+    return Path(state_dir or default_state_dir()) / f"{base_name}-{folder}.query.json"
+
+
+def query_digest(query: str) -> str:
+    return hashlib.sha256(" ".join(query.split()).encode("utf-8")).hexdigest()
+
+
+def load_state(path: Path) -> dict | None:
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return state if isinstance(state, dict) and state.get("query_id") else None
+
+
+def save_state(path: Path, state: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def clear_state(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+def _is_error(con, status) -> bool:  # noqa: ANN001
+    is_an_error = getattr(con, "is_an_error", None)
+    if is_an_error is not None:
+        return bool(is_an_error(status))
+    return getattr(status, "name", str(status)) in ("FAILED_WITH_ERROR", "ABORTED", "ABORTING")
+
+
+def _resumable(con, state: dict | None, expected: dict, log: Callable[[str], None]) -> str | None:  # noqa: ANN001
+    if not state or state.get("query_sha256") != expected["query_sha256"]:
+        return None
+    if state.get("snapshot_date") != expected["snapshot_date"]:
+        log(
+            f"Saved query ran for snapshot {state.get('snapshot_date') or 'unknown'}, not "
+            f"{expected['snapshot_date']}; submitting the query again."
+        )
+        return None
+    if state.get("account") != expected["account"] or state.get("role") != expected["role"]:
+        log("Saved query ran on a different account or role; submitting the query again.")
+        return None
+    if time.time() - float(state.get("submitted_at", 0)) > RESULT_TTL_S:
+        log("Saved query result has expired; submitting the query again.")
+        return None
+    sfqid = state["query_id"]
+    try:
+        status = con.get_query_status(sfqid)
+    except Exception as exc:  # noqa: BLE001
+        log(f"Saved query {sfqid} is not available ({exc}); submitting the query again.")
+        return None
+    if _is_error(con, status):
+        log(f"Saved query {sfqid} did not succeed; submitting the query again.")
+        return None
+    return sfqid
+
+
+def wait_for_query(
+    con,  # noqa: ANN001
+    sfqid: str,
+    *,
+    interval: float = POLL_START_S,
+    max_interval: float = POLL_MAX_S,
+    timeout: float | None = WAIT_TIMEOUT_S,
+    cancel: threading.Event | None = None,
+) -> None:
+    """Poll until the query is no longer running, backing off up to `max_interval`.
+
+    Raises `AsyncQueryError` once `timeout` seconds pass or `cancel` is set;
+    the query itself keeps running on the server.
+    """
+    cancel = cancel or threading.Event()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        status = con.get_query_status(sfqid)
+        if not con.is_still_running(status):
+            return
+        wait = interval
+        if deadline is not None:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise AsyncQueryError(
+                    f"Query {sfqid} is still running after {timeout / 60:,.0f} min; run the export again to "
+                    "re-attach to it."
+                )
+            wait = min(wait, left)
+        if cancel.wait(wait):
+            raise AsyncQueryError(f"Stopped waiting for query {sfqid}; run the export again to re-attach to it.")
+        interval = min(max_interval, interval * 1.5)
+
+
+def run_async_query(
+    con,  # noqa: ANN001
+    cur,  # noqa: ANN001
+    query: str,
+    path: Path,
+    *,
+    account: str | None = None,
+    snapshot_date: date | None = None,
+    poll_interval: float = POLL_START_S,
+    timeout: float | None = WAIT_TIMEOUT_S,
+    cancel: threading.Event | None = None,
+    on_log: Callable[[str], None] | None = None,
+) -> tuple[str, bool]:
+    """Submit (or re-attach to) `query` and load its result into `cur`.
+
+    Returns `(query_id, resumed)`. A saved query is only re-attached for the
+    same SQL, `account`, connection role and `snapshot_date` (default:
+    today). The state file is kept until the caller clears it, so an
+    interrupted export can resume; it is removed here if the query itself
+    failed. `timeout` and `cancel` bound the wait (see `wait_for_query`).
+    """
+
+    def log(msg: str) -> None:
+        if on_log:
+            on_log(msg)
+
+    if not hasattr(cur, "execute_async"):
+        raise AsyncQueryError("This Snowflake connection does not support asynchronous queries.")
+
+    expected = {
+        "query_sha256": query_digest(query),
+        "snapshot_date": (snapshot_date or date.today()).isoformat(),
+        "account": account,
+        "role": getattr(con, "role", None),
+    }
+    sfqid = _resumable(con, load_state(path), expected, log)
+    resumed = sfqid is not None
+    if resumed:
+        log(f"Re-attaching to query {sfqid}…")
+    else:
+        sfqid = cur.execute_async(query)["queryId"]
+        save_state(
+            path,
+            {
+                "query_id": sfqid,
+                **expected,
+                "submitted_at": time.time(),
+                "submitted": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            },
+        )
+        log(f"Submitted query {sfqid}; waiting for Snowflake…")
+
+    wait_for_query(con, sfqid, interval=poll_interval, timeout=timeout, cancel=cancel)
+    if _is_error(con, con.get_query_status(sfqid)):
+        clear_state(path)
+        try:
+            cur.get_results_from_sfqid(sfqid)  # raises the query's own error where the connector can
+        except Exception as exc:  # noqa: BLE001
+            raise AsyncQueryError(f"Query {sfqid} failed: {exc}") from exc
+        raise AsyncQueryError(f"Query {sfqid} failed.")
+    cur.get_results_from_sfqid(sfqid)
+    return sfqid, resumed
@@ -0,0 +1,500 @@
+from __future__ import annotations
+
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from operator import itemgetter
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Sequence
+
+from app.core.csv_encode import encode_rows
+from app.core.output_codec import DEFAULT_LEVEL, OutputCodec
+
+# Blue Yonder rejects upload files with more data rows than this.
+MAX_ROWS_PER_FILE = 60000
+
+_DONE = object()
+
+
+class ChunkWriterError(RuntimeError):
+    pass
+
+
+def single_path(output_dir: str | Path, base_name: str, suffix: str = ".csv") -> Path:
+    return Path(output_dir) / f"{base_name}{suffix}"
+
+
+def part_path(output_dir: str | Path, base_name: str, part_index: int, suffix: str = ".csv") -> Path:
+    return Path(output_dir) / f"{base_name}_{part_index:03d}{suffix}"
+
+
+def partial_path(path: Path) -> Path:
+    """Where a part is written until the writer commits it (never ends in .csv)."""
+    return path.with_name(path.name + ".partial")
+
+
+def _fsync(path: Path) -> None:
+    with path.open("r+b") as fp:
+        os.fsync(fp.fileno())
+
+
+def _fsync_dir(path: Path) -> None:
+    if not hasattr(os, "O_DIRECTORY"):
+        return  # Windows: renames are not synced through a directory handle
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # some network filesystems cannot sync a directory
+    finally:
+        os.close(fd)
+
+
+def make_projection(indices: Sequence[int] | None, width: int | None = None) -> Callable | None:
+    """Return a callable mapping a source row to the output column order.
+
+    Returns None when `indices` is the identity over a row of `width` columns,
+    so callers can hand the source rows to the writer unchanged.
+    """
+    if indices is None:
+        return None
+    indices = tuple(indices)
+    if width is not None and indices == tuple(range(width)):
+        return None
+    if len(indices) == 1:
+        only = indices[0]
+        return lambda row: (row[only],)
+    return itemgetter(*indices)
+
+
+class CsvRowEncoder:
+    """Default part encoder: row tuples, serialized like the stdlib csv module (see `encode_rows`).
+
+    An encoder's `open(fp, header)` returns a sink with `write(batch)` and
+    `close()` that writes the part to the binary stream `fp` (a plain file,
+    or a compressing stream, see `OutputCodec`) and closes it; `header` is
+    None when no header row should be written. An encoder may also define
+    `close()`, called once all parts are written, and set `unbuffered` to
+    get the raw file for plain output.
+    """
+
+    def __init__(self, projection: Callable | None = None) -> None:
+        self.projection = projection
+
+    def open(self, fp: BinaryIO, header: Sequence[str] | None) -> "_CsvRowSink":
+        return _CsvRowSink(fp, header, self.projection)
+
+
+class _CsvRowSink:
+    def __init__(self, fp: BinaryIO, header: Sequence[str] | None, projection: Callable | None) -> None:
+        self._fp = fp
+        self._project = projection
+        if header is not None:
+            self._fp.write(encode_rows([header]))
+
+    def write(self, rows: Sequence[Sequence]) -> None:
+        project = self._project
+        self._fp.write(encode_rows(rows if project is None else list(map(project, rows))))
+
+    def close(self) -> None:
+        self._fp.close()
+
+
+class _PartJob:
+    """One output part: a bounded queue of row batches drained into one file."""
+
+    def __init__(self, path: Path, temp: Path | None, queue_depth: int) -> None:
+        self.path = path
+        self.temp = temp  # None for archive members
+        self.rows = 0
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_depth)
+        self.future: Future | None = None
+        self.sink = None
+        self.started = 0.0
+        self.seconds = 0.0
+
+
+class ChunkWriter:
+    """Stream batches of row tuples into sequential CSV part files.
+
+    Each part holds at most `max_rows` data rows; there is no limit on the
+    number of parts unless `max_parts` is given. Parts are named
+    `<base>_001.csv`, `<base>_002.csv`, ...; with `plain_single_file` (the
+    original naming) a result that fits in one part is written as
+    `<base>.csv` instead.
+
+    The layout is fixed before the first part is opened, so no file is
+    ever renamed. With `total_rows` (a preflight count) the naming and part
+    count follow from it, and a result over `max_parts` fails before
+    anything is written; a result that turns out longer than counted fails
+    rather than re-naming. Without it, the first part's batches are held
+    in memory until a row beyond `max_rows` arrives (numbered parts) or the
+    input ends (a single `<base>.csv`).
+
+    Parts are written to `<name>.partial` files (see `partial_path`) and
+    only renamed into place, after one fsync each, once `close()` has seen
+    every part written; a failed or aborted run removes them, so nothing
+    left in the folder looks like a finished upload.
+
+    With `writers > 0`, each part is handed to a pool of writer threads
+    through a bounded queue of `queue_depth` batches, so encoding and disk
+    writes for part k overlap with reading part k+1. `writers=0` writes
+    inline on the calling thread.
+
+    `projection` maps each source row to the output column order (see
+    `make_projection`); it is resolved once by the caller so no per-row
+    dicts are built. A custom `encoder` (see `CsvRowEncoder`) replaces the
+    default csv-module encoder; batches then only need `len()` and slicing.
+
+    `codec` compresses the parts as they are written (see `OutputCodec`):
+    "gzip" names them `.csv.gz`, "zip" writes them as members of one
+    `<base>.zip` (always numbered, written one after another on the calling
+    thread) and `paths` then lists just the archive.
+    """
+
+    def __init__(
+        self,
+        *,
+        output_dir: str | Path,
+        base_name: str,
+        header: Sequence[str],
+        projection: Callable | None = None,
+        encoder=None,  # noqa: ANN001
+        max_rows: int = MAX_ROWS_PER_FILE,
+        max_parts: int | None = None,
+        include_header: bool = True,
+        plain_single_file: bool = True,
+        writers: int = 2,
+        queue_depth: int = 8,
+        total_rows: int | None = None,
+        codec: str = "none",
+        compress_level: int = DEFAULT_LEVEL,
+        on_log: Callable[[str], None] | None = None,
+    ) -> None:
+        if max_rows <= 0:
+            raise ChunkWriterError("max_rows must be a positive number.")
+        if max_parts is not None and max_parts <= 0:
+            raise ChunkWriterError("max_parts must be a positive number.")
+        try:
+            self.codec = OutputCodec(codec, level=compress_level)
+        except ValueError as exc:
+            raise ChunkWriterError(str(exc)) from exc
+        if self.codec.sequential:
+            writers = 0
+        self.output_dir = Path(output_dir)
+        self.base_name = base_name
+        self.header = list(header)
+        self.encoder = encoder if encoder is not None else CsvRowEncoder(projection)
+        self.max_rows = max_rows
+        self.max_parts = max_parts
+        self.include_header = include_header
+        self.plain_single_file = plain_single_file and not self.codec.sequential
+        self.total_rows = total_rows
+        if total_rows is not None:
+            parts = math.ceil(total_rows / max_rows)
+            if max_parts is not None and parts > max_parts:
+                raise ChunkWriterError(self._too_many_rows_message(total_rows))
+            self._single: bool | None = self.plain_single_file and parts <= 1
+        else:
+            self._single = False if not self.plain_single_file else None
+        self._pending: list[Sequence[Sequence]] = []  # first-part batches while `_single` is undecided
+        self._pending_rows = 0
+        self._cut = False  # `end_part()` was called: the next row starts a new part
+        self.queue_depth = max(1, queue_depth)
+        self._on_log = on_log
+
+        self.files_written = 0
+        self.rows_written = 0
+        self.paths: list[Path] = []
+        self._jobs: list[_PartJob] = []
+        self._archive = self.codec.archive_path(self.output_dir, base_name)
+        self._current: _PartJob | None = None
+        self._pool = ThreadPoolExecutor(max_workers=writers, thread_name_prefix="chunk-writer") if writers > 0 else None
+        self._abort = threading.Event()
+        self._closed = False
+
+    def __enter__(self) -> "ChunkWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:  # noqa: ANN001
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _log(self, msg: str) -> None:
+        if self._on_log:
+            self._on_log(msg)
+
+    # ── Part writing (runs on a pool thread, or inline) ────────────
+    def _open_part(self, job: _PartJob) -> None:
+        job.started = time.perf_counter()
+        fp = self.codec.open(job.path, temp=job.temp, unbuffered=getattr(self.encoder, "unbuffered", False))
+        try:
+            job.sink = self.encoder.open(fp, self.header if self.include_header else None)
+        except BaseException:
+            fp.close()
+            raise
+
+    def _write_rows(self, job: _PartJob, rows: Sequence[Sequence]) -> None:
+        job.sink.write(rows)
+
+    def _close_part(self, job: _PartJob) -> None:
+        if job.sink is not None:
+            sink, job.sink = job.sink, None
+            sink.close()
+            job.seconds = time.perf_counter() - job.started
+
+    def _drain_part(self, job: _PartJob) -> None:
+        try:
+            self._open_part(job)
+            while True:
+                rows = job.queue.get()
+                if rows is _DONE:
+                    return
+                if not self._abort.is_set():
+                    self._write_rows(job, rows)
+        finally:
+            self._close_part(job)
+
+    def _put(self, job: _PartJob, item) -> None:  # noqa: ANN001
+        if self._pool is None:
+            try:
+                if item is _DONE:
+                    self._close_part(job)
+                else:
+                    self._write_rows(job, item)
+            except OSError as exc:
+                raise ChunkWriterError(f"Failed to write {job.path.name}: {exc}") from exc
+            return
+        while True:
+            try:
+                job.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                # A writer that died will never drain its queue.
+                if job.future is not None and job.future.done():
+                    self._raise_failed()
+                    return
+
+    def _raise_failed(self) -> None:
+        for job in self._jobs:
+            if job.future is not None and job.future.done() and job.future.exception() is not None:
+                exc = job.future.exception()
+                raise ChunkWriterError(f"Failed to write {job.path.name}: {exc}") from exc
+
+    # ── Reader side ─────────────────────────────────────────────────
+    def _too_many_rows_message(self, rows: int | None = None) -> str:
+        counted = f" ({rows:,} rows)" if rows is not None else ""
+        return (
+            f"Result exceeds {self.max_parts * self.max_rows:,} rows{counted}. This tool only outputs "
+            f"at most {self.max_parts} files of <={self.max_rows:,} rows each."
+        )
+
+    def _start_part(self) -> None:
+        if self.max_parts is not None and len(self._jobs) >= self.max_parts:
+            raise ChunkWriterError(self._too_many_rows_message())
+        if self._single and self._jobs:
+            raise ChunkWriterError(
+                f"The result has more rows than the {self.total_rows:,} counted before writing; "
+                "run it again (the source changed while it was being written)."
+            )
+        if self._current is not None:
+            self._put(self._current, _DONE)
+            self._raise_failed()
+
+        index = len(self._jobs) + 1
+        if self._single:
+            path = single_path(self.output_dir, self.base_name, self.codec.suffix)
+        else:
+            path = part_path(self.output_dir, self.base_name, index, self.codec.suffix)
+        job = _PartJob(path, None if self._archive is not None else partial_path(path), self.queue_depth)
+        self._jobs.append(job)
+        self._current = job
+        if self._pool is not None:
+            job.future = self._pool.submit(self._drain_part, job)
+        else:
+            try:
+                if index == 1 and self._archive is not None:
+                    self.codec.open_archive(partial_path(self._archive))
+                self._open_part(job)
+            except OSError as exc:
+                raise ChunkWriterError(f"Failed to write {path.name}: {exc}") from exc
+        self._log(f"Writing: {path.name}")
+
+    def write_batch(self, batch: Sequence[Sequence]) -> None:
+        if self._closed:
+            raise ChunkWriterError("ChunkWriter is already closed.")
+        if self._single is None:
+            if self._pending_rows + len(batch) <= self.max_rows:
+                self._pending.append(batch)
+                self._pending_rows += len(batch)
+                return
+            self._flush_pending(single=False)
+        if self._current is None:
+            self._start_part()
+
+        start = 0
+        n = len(batch)
+        while start < n:
+            job = self._current
+            room = self.max_rows - job.rows
+            if room <= 0 or self._cut:
+                self._cut = False
+                self._start_part()
+                job = self._current
+                room = self.max_rows
+            stop = min(n, start + room)
+            self._put(job, batch[start:stop] if (start or stop != n) else batch)
+            job.rows += stop - start
+            self.rows_written += stop - start
+            start = stop
+
+    def end_part(self) -> None:
+        """Finish the current part early: the next row starts a new part (see `LocPacker`)."""
+        if self._closed:
+            raise ChunkWriterError("ChunkWriter is already closed.")
+        if self._single is None and self._pending_rows:
+            self._flush_pending(single=False)
+        if self._current is not None and self._current.rows:
+            self._cut = True
+
+    def _flush_pending(self, *, single: bool) -> None:
+        self._single = single
+        pending, self._pending = self._pending, []
+        self._pending_rows = 0
+        for batch in pending:
+            self.write_batch(batch)
+
+    def write_batches(self, batches: Iterable[Sequence[Sequence]]) -> None:
+        for batch in batches:
+            if batch:
+                self.write_batch(batch)
+
+    def _finish_writers(self) -> None:
+        try:
+            if self._current is not None:
+                job, self._current = self._current, None
+                self._put(job, _DONE)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+            try:
+                self.codec.close()
+            except OSError as exc:
+                raise ChunkWriterError(f"Failed to write {self._archive.name}: {exc}") from exc
+            finally:
+                # Encoders that hold a source (e.g. a memory-mapped input) release it here.
+                close_encoder = getattr(self.encoder, "close", None)
+                if close_encoder is not None:
+                    close_encoder()
+
+    def _staged(self) -> list[tuple[Path, Path]]:
+        """`(temp, final)` paths of everything written so far."""
+        if self._archive is not None:
+            return [(partial_path(self._archive), self._archive)] if self._jobs else []
+        return [(job.temp, job.path) for job in self._jobs]
+
+    def _discard(self) -> None:
+        for temp, _ in self._staged():
+            try:
+                temp.unlink()
+            except OSError:
+                pass
+
+    def _commit(self) -> None:
+        """Fsync every part, then rename them all into place; on any failure, none is left in place."""
+        staged = self._staged()
+        renamed: list[Path] = []
+        try:
+            for temp, _ in staged:
+                _fsync(temp)
+            for temp, final in staged:
+                os.replace(temp, final)
+                renamed.append(final)
+        except BaseException as exc:
+            for final in renamed:
+                try:
+                    final.unlink()
+                except OSError:
+                    pass
+            self._discard()
+            if isinstance(exc, OSError):
+                raise ChunkWriterError(f"Failed to finish the output files: {exc}") from exc
+            raise
+        _fsync_dir(self.output_dir)
+
+    def abort(self) -> None:
+        """Stop all part writers after an error and remove the unfinished parts."""
+        if self._closed:
+            return
+        self._closed = True
+        self._abort.set()
+        try:
+            self._finish_writers()
+        except Exception:
+            pass
+        self._discard()
+
+    def close(self) -> dict:
+        """Wait for every part to be written and return the file/row counts.
+
+        When no data rows were written, nothing is left on disk.
+        """
+        if self._closed:
+            return self.result()
+        if self._single is None:
+            try:
+                self._flush_pending(single=True)
+            except BaseException:
+                self.abort()
+                raise
+        self._closed = True
+        try:
+            self._finish_writers()
+            self._raise_failed()
+        except BaseException:
+            self._abort.set()
+            self._discard()
+            raise
+
+        if self.rows_written == 0:
+            self._discard()
+            return self.result()
+        self._commit()
+        self.files_written = len(self._jobs)
+        self.paths = [self._archive] if self._archive is not None else [job.path for job in self._jobs]
+        return self.result()
+
+    def result(self) -> dict:
+        return {
+            "files_written": self.files_written,
+            "rows_written": self.rows_written,
+            "paths": [str(p) for p in self.paths],
+        }
+
+    def part_stats(self) -> list[dict]:
+        """Rows, bytes and throughput of each written part (open to close, on its writer thread)."""
+        stats = []
+        archive = self._archive
+        for job in self._jobs[: self.files_written]:
+            path = archive / job.path.name if archive is not None else job.path
+            size = self.codec.part_size(job.path)
+            seconds = job.seconds
+            stats.append(
+                {
+                    "path": str(path),
+                    "rows": job.rows,
+                    "bytes": size,
+                    "seconds": round(seconds, 4),
+                    "rows_per_s": round(job.rows / seconds, 1) if seconds > 0 else None,
+                    "mb_per_s": round(size / 1e6 / seconds, 2) if seconds > 0 else None,
+                }
+            )
+        return stats
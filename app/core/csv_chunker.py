@@ -1,9 +1,28 @@
 from __future__ import annotations
 
 import csv
+import time
 from pathlib import Path
 from typing import Callable, Iterable
 
+from app.core.chunk_writer import MAX_ROWS_PER_FILE, ChunkWriter, ChunkWriterError
+from app.core.csv_readers import (
+    CsvReaderError,
+    available_backends,
+    count_records,
+    data_offset,
+    iter_csv_batches,
+    open_arrow_batches,
+    open_byte_range_batches,
+    open_numpy_batches,
+    select_backend,
+)
+from app.core.loc_packing import LocPacker, LocPackingError
+from app.core.output_codec import DEFAULT_LEVEL, OutputCodec
+from app.core.progress import ProgressThrottle
+from app.core.row_sort import SORT_MEMORY_MB, LocItemSorter, RowSortError
+from app.core.timings import RunTimer, trace_path, write_trace
+
 
 REQUIRED_COLUMNS = ("item", "loc", "locpriority")
 
@@ -29,13 +48,37 @@ def _validate_required_columns(fieldnames: list[str]) -> None:
         )
 
 
+def _required_column_indices(fieldnames: list[str]) -> tuple[int, ...]:
+    """Positions of item, loc, locpriority; the last duplicate name wins, as with DictReader."""
+    lowered = [f.lower() for f in fieldnames]
+    return tuple(len(lowered) - 1 - lowered[::-1].index(c) for c in REQUIRED_COLUMNS)
+
+
+def _validate_max_rows(max_rows: int) -> None:
+    # Interpretation: 60,000 is the maximum number of DATA rows per file.
+    # If header is included, it does not count toward the limit.
+    if not 0 < max_rows <= MAX_ROWS_PER_FILE:
+        raise CsvChunkerError(f"Rows per file must be between 1 and {MAX_ROWS_PER_FILE:,}.")
+
+
+def _validate_codec(codec: str, compress_level: int) -> None:
+    try:
+        OutputCodec(codec, level=compress_level)
+    except ValueError as exc:
+        raise CsvChunkerError(str(exc)) from exc
+
+
 def _safe_base_name(name: str) -> str:
     cleaned = "".join(ch for ch in name if ch.isalnum() or ch in ("-", "_"))
     return cleaned or "LOCPRIORITY_UPLOAD"
 
 
-def _part_path(output_dir: str, base_name: str, part_index: int) -> Path:
-    return Path(output_dir) / f"{base_name}_{part_index:03d}.csv"
+def _count_csv_records(input_path: Path, width: int) -> int:
+    """Number of data rows the csv reader yields (blank lines skipped, like `iter_csv_batches`)."""
+    with input_path.open("r", newline="", encoding="utf-8-sig") as in_fp:
+        rows = csv.reader(in_fp)
+        next(rows, None)
+        return sum(len(batch) for batch in iter_csv_batches(rows, width))
 
 
 def chunk_csv(
@@ -43,9 +86,22 @@ def chunk_csv(
     input_csv: str,
     output_dir: str,
     base_name: str,
-    max_rows: int = 60000,
+    max_rows: int = MAX_ROWS_PER_FILE,
+    max_parts: int | None = None,
     include_header: bool = True,
+    plain_single_file: bool = True,
+    writers: int = 2,
+    reader: str = "auto",
     validate_required_columns: bool = True,
+    check_values: bool = False,
+    dedupe: bool = False,
+    dedupe_memory_mb: int | None = None,
+    sort: bool = False,
+    sort_memory_mb: int | None = None,
+    pack: bool = False,
+    codec: str = "none",
+    compress_level: int = DEFAULT_LEVEL,
+    trace: bool = False,
     on_progress: Callable[[int], None] | None = None,
     on_log: Callable[[str], None] | None = None,
 ) -> dict:
@@ -53,14 +109,40 @@ def chunk_csv(
 
     - Counts *data* rows only (header not counted).
     - Writes files named: <base_name>_001.csv, <base_name>_002.csv, ...
+      (any number of parts, unless capped by `max_parts`). With `max_parts`
+      (and NumPy installed) the input's records are counted first, so an
+      input that cannot fit fails before any part is written.
+    - With `plain_single_file`, a result that fits in one file is written as
+      <base_name>.csv, matching the original naming.
+    - `writers` part-writer threads overlap disk writes with reading.
+    - `on_progress` gets whole percentages of the input bytes consumed,
+      at most every 0.1 s (see `ProgressThrottle`).
+    - `reader` picks the input backend ("arrow", "numpy" or "csv"); "auto"
+      uses the fastest one installed. All three write identical bytes.
+    - With `validate_required_columns` off, "auto" uses the "bytes" backend:
+      record byte ranges are copied into the parts without parsing, keeping
+      the input's own quoting and line endings (blank lines are dropped).
+    - `check_values` checks every row's item/loc/locpriority values (in
+      parallel, see `validate_csv`) and fails before any part is written.
+    - `dedupe` drops repeated (item, loc, locpriority) rows and reports
+      (item, loc) pairs with conflicting priorities (see `DistinctFilter`),
+      spilling to the output folder once the seen keys outgrow
+      `dedupe_memory_mb`; it reads with the csv backend.
+    - `sort` orders the rows by (loc, item) before they are written, in
+      runs of at most `sort_memory_mb` spilled to the output folder and
+      merged (see `LocItemSorter`); it also reads with the csv backend.
+    - `pack` sorts as well and packs whole locs into the parts (first fit,
+      largest loc first), so no loc straddles two files unless it alone
+      holds more than `max_rows` rows (see `LocPacker`); the result's
+      `packing` reports how full each part is.
+    - `codec` ("gzip" or "zip") compresses the parts as they are written at
+      `compress_level` (see `OutputCodec`); "none" writes plain CSV.
+    - The result's `timings` holds seconds per phase (validate, read,
+      write) and per-part rows/s and MB/s; `trace` also writes them to
+      <base_name>.trace.json in the output folder.
     """
 
-    if max_rows != 60000:
-        raise CsvChunkerError("This tool enforces 60,000 rows max per file.")
-
-    # Interpretation: 60,000 is the maximum number of DATA rows per file.
-    # If header is included, it does not count toward the limit.
-    max_data_rows = 60000
+    _validate_max_rows(max_rows)
 
     input_path = Path(input_csv)
     if not input_path.exists():
@@ -71,112 +153,191 @@ def chunk_csv(
         raise CsvChunkerError(f"Output folder not found: {output_dir}")
 
     base_name = _safe_base_name(base_name)
+    _validate_codec(codec, compress_level)
+
+    progress = ProgressThrottle(on_progress)
+    input_size = input_path.stat().st_size
+
+    def on_position(pos: int) -> None:
+        progress.update(pos, input_size)
 
     def log(msg: str) -> None:
         if on_log:
             on_log(msg)
 
-    def progress(pct: int) -> None:
-        if on_progress:
-            on_progress(max(0, min(100, int(pct))))
+    timer = RunTimer()
+    with input_path.open("r", newline="", encoding="utf-8-sig") as in_fp:
+        fieldnames = _normalize_fieldnames(next(csv.reader(in_fp), None))
+
+    if validate_required_columns:
+        _validate_required_columns(fieldnames)
 
-    files_written = 0
-    rows_written = 0
+    if not fieldnames:
+        raise CsvChunkerError("Input CSV appears to have no header/columns.")
 
-    # Output naming:
-    # - If total rows <= 60,000: <base>.csv
-    # - If > 60,000: rename first to <base>_001.csv and create <base>_002.csv
-    current_part_index = 0
-    current_part_rows = 0
-    out_fp = None
-    out_writer = None
+    validation = None
+    if check_values:
+        from app.core.csv_validator import CsvValidationError, describe_errors, validate_csv
 
-    try:
-        progress(0)
+        try:
+            validation = validate_csv(input_csv=str(input_path), on_log=on_log)
+        except CsvValidationError as exc:
+            raise CsvChunkerError(str(exc)) from exc
+        if validation["error_count"]:
+            raise CsvChunkerError(describe_errors(validation))
+        log(f"Checked {validation['rows_checked']:,} rows: no invalid values.")
+    timer.add("validate", time.perf_counter() - timer.started)
+
+    width = len(fieldnames)
+
+    def csv_batches():
         with input_path.open("r", newline="", encoding="utf-8-sig") as in_fp:
-            reader = csv.DictReader(in_fp)
-            fieldnames = _normalize_fieldnames(reader.fieldnames)
-
-            if validate_required_columns:
-                _validate_required_columns(fieldnames)
-
-            if not fieldnames:
-                raise CsvChunkerError("Input CSV appears to have no header/columns.")
-
-            def open_first_file() -> Path:
-                nonlocal out_fp, out_writer, files_written, current_part_rows
-                out_file = Path(output_dir) / f"{base_name}.csv"
-                out_fp = out_file.open("w", newline="", encoding="utf-8")
-                out_writer = csv.DictWriter(out_fp, fieldnames=fieldnames, extrasaction="ignore")
-                files_written = 1
-                current_part_rows = 0
-                if include_header:
-                    out_writer.writeheader()
-                log(f"Writing: {out_file.name}")
-                return out_file
-
-            def rollover_to_second_file(first_path: Path) -> None:
-                nonlocal out_fp, out_writer, files_written, current_part_rows, current_part_index
-
-                # Close first file so we can rename on Windows.
-                if out_fp:
-                    out_fp.close()
-
-                first_renamed = _part_path(output_dir, base_name, 1)
-                # Rename <base>.csv -> <base>_001.csv
-                try:
-                    first_path.replace(first_renamed)
-                except OSError as exc:
-                    raise CsvChunkerError(f"Failed to rename output file: {exc}") from exc
-
-                out_file = _part_path(output_dir, base_name, 2)
-                out_fp = out_file.open("w", newline="", encoding="utf-8")
-                out_writer = csv.DictWriter(out_fp, fieldnames=fieldnames, extrasaction="ignore")
-                files_written = 2
-                current_part_rows = 0
-                current_part_index = 2
-
-                if include_header:
-                    out_writer.writeheader()
-
-                log(f"Writing: {out_file.name}")
-
-            first_path = open_first_file()
-
-            for row in reader:
-                if current_part_rows >= max_data_rows:
-                    if files_written == 1:
-                        rollover_to_second_file(first_path)
-                    else:
-                        raise CsvChunkerError(
-                            "Result exceeds 120,000 rows. This tool only outputs 1 file (<=60,000) "
-                            "or 2 files (<=120,000 total)."
-                        )
-
-                out_writer.writerow(row)
-                current_part_rows += 1
-                rows_written += 1
-
-            progress(100)
-
-    finally:
-        if out_fp:
-            out_fp.close()
-
-    # If input had only headers and no data rows, delete the empty output file.
-    if rows_written == 0:
-        first = Path(output_dir) / f"{base_name}.csv"
-        if first.exists():
+            rows = csv.reader(in_fp)
+            next(rows, None)
+            for batch in iter_csv_batches(rows, width):
+                on_position(in_fp.buffer.tell())
+                yield batch
+
+    def write_parts(batches, encoder) -> ChunkWriter:  # noqa: ANN001
+        batches = timer.timed_batches(batches, "read")
+        if sorter is not None and packer is None:
+            batches = sorter.sort(batches)
+        with timer.phase("write"), ChunkWriter(
+            output_dir=output_dir,
+            base_name=base_name,
+            header=fieldnames,
+            encoder=encoder,
+            max_rows=max_rows,
+            max_parts=max_parts,
+            include_header=include_header,
+            plain_single_file=plain_single_file,
+            writers=writers,
+            total_rows=records,
+            codec=codec,
+            compress_level=compress_level,
+            on_log=on_log,
+        ) as writer:
+            writer.write_batches(packer.pack(batches, writer.end_part) if packer is not None else batches)
+        return writer
+
+    records = None
+    if max_parts is not None and not dedupe and "numpy" in available_backends():
+        # Dropped duplicates could still bring a deduped input under the cap, so only plain runs count up front.
+        with timer.phase("count"):
+            try:
+                records = count_records(input_path, data_offset(input_path))
+            except CsvReaderError as exc:
+                # e.g. a stray quote in an unquoted field, which the csv reader takes as text.
+                log(f"{exc} Counting rows with the csv reader.")
+                records = _count_csv_records(input_path, width)
+        if records > max_parts * max_rows:
+            raise CsvChunkerError(
+                f"Input has {records:,} data rows. This tool only outputs "
+                f"at most {max_parts} files of <={max_rows:,} rows each."
+            )
+
+    distinct = None
+    if dedupe:
+        from app.core.dedupe import DEDUPE_MEMORY_MB, DistinctFilter
+
+        lowered = {f.lower() for f in fieldnames}
+        if not all(c in lowered for c in REQUIRED_COLUMNS):
+            raise CsvChunkerError("Removing duplicates needs the item, loc and locpriority columns.")
+        if dedupe_memory_mb is not None and dedupe_memory_mb <= 0:
+            raise CsvChunkerError("The dedupe memory budget must be a positive number of MB.")
+        distinct = DistinctFilter(
+            _required_column_indices(fieldnames),
+            memory_mb=dedupe_memory_mb or DEDUPE_MEMORY_MB,
+            spill_dir=output_dir,
+        )
+
+    sorter = None
+    packer = None
+    if sort or pack:
+        lowered = {f.lower() for f in fieldnames}
+        if not all(c in lowered for c in REQUIRED_COLUMNS):
+            step = "Packing" if pack else "Sorting"
+            raise CsvChunkerError(f"{step} by location needs the item, loc and locpriority columns.")
+        if sort_memory_mb is not None and sort_memory_mb <= 0:
+            raise CsvChunkerError("The sort memory budget must be a positive number of MB.")
+        item_index, loc_index, _ = _required_column_indices(fieldnames)
+        memory_mb = sort_memory_mb or SORT_MEMORY_MB
+        if pack:
+            packer = LocPacker(
+                loc_index, item_index, max_rows=max_rows, max_parts=max_parts, memory_mb=memory_mb, spill_dir=output_dir
+            )
+            sorter = packer.sorter
+        else:
+            sorter = LocItemSorter(loc_index, item_index, memory_mb=memory_mb, spill_dir=output_dir)
+
+    try:
+        if distinct is not None or sorter is not None:
+            if reader not in ("auto", "csv"):
+                step = "Removing duplicates" if distinct is not None else "Packing" if packer is not None else "Sorting"
+                log(f"{step} uses the csv reader instead of '{reader}'.")
+            backend = "csv"
+        elif reader == "auto" and not validate_required_columns and "numpy" in available_backends():
+            # Nothing to validate: split record byte ranges instead of parsing.
+            backend = "bytes"
+        else:
+            backend = select_backend(reader)
+        progress.start()
+        if distinct is not None:
+            writer = write_parts(distinct.filter(csv_batches()), None)
+        elif backend == "csv":
+            writer = write_parts(csv_batches(), None)
+        else:
+            offset = data_offset(input_path)
             try:
-                first.unlink()
-            except OSError:
-                pass
-        files_written = 0
-
-    return {
-        "files_written": files_written,
-        "rows_written": rows_written,
+                if backend == "bytes":
+                    writer = write_parts(*open_byte_range_batches(input_path, offset, on_position=on_position))
+                else:
+                    open_batches = open_arrow_batches if backend == "arrow" else open_numpy_batches
+                    writer = write_parts(*open_batches(input_path, offset, width, on_position=on_position))
+            except CsvReaderError as exc:
+                # e.g. ragged rows, which the csv reader pads/truncates. Parts are rewritten in full.
+                log(f"{exc} Retrying with the csv reader.")
+                backend = "csv"
+                writer = write_parts(csv_batches(), None)
+        progress.finish()
+    except (ChunkWriterError, CsvReaderError, RowSortError, LocPackingError) as exc:
+        raise CsvChunkerError(str(exc)) from exc
+
+    # The write loop includes waiting on the reader (and the sort); report only the writer's share.
+    timer.add("write", -timer.phases.get("read", 0.0))
+    if sorter is not None:
+        timer.add("sort", sorter.seconds)
+        timer.add("write", -sorter.seconds)
+        stats = sorter.result()
+        log(f"Sorted {stats['rows']:,} rows by loc, item ({stats['spilled_runs']} run(s) spilled to disk).")
+    if packer is not None:
+        timer.add("pack", packer.seconds)
+        timer.add("write", -packer.seconds)
+        log(packer.summary())
+
+    if distinct is not None:
+        stats = distinct.result()
+        log(f"Dropped {stats['duplicates_dropped']:,} duplicate row(s).")
+        if stats["conflicts"]:
+            log(f"Warning: {stats['conflicts']:,} item/loc pair(s) have more than one locpriority.")
+
+    result = {
+        "files_written": writer.files_written,
+        "rows_written": writer.rows_written,
+        "paths": writer.result()["paths"],
         "base_name": base_name,
         "max_rows": max_rows,
         "include_header": include_header,
+        "reader": backend,
+        "codec": codec,
+        "validation": validation,
+        "dedupe": distinct.result() if distinct is not None else None,
+        "sort": sorter.result() if sorter is not None else None,
+        "packing": packer.result() if packer is not None else None,
+        "timings": timer.result(writer.part_stats()),
     }
+    if trace:
+        path = trace_path(output_path, base_name)
+        write_trace(path, {"command": "chunk", "input_csv": str(input_path), **result})
+        log(f"Trace written: {path.name}")
+    return result
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+# Batch serializer for upload rows.
+#
+# Writes exactly what `csv.writer` (excel dialect: ",", '"', "\r\n", minimal
+# quoting) would. LOCPRIORITY fields are plain alphanumerics, so a batch of
+# text rows is joined in one go with the ASCII unit/record separators and
+# scanned once: only the rows holding a delimiter, quote or newline are taken
+# apart to quote the offending fields, then the separators become "," and
+# "\r\n". Other batches (numbers, None, one-column rows) go through the csv
+# module itself.
+
+import csv
+import io
+import re
+from typing import Sequence
+
+_NEEDS_QUOTES = re.compile(r'[,"\r\n]')
+_US = "\x1f"  # between fields
+_RS = "\x1e"  # between rows
+
+
+def _quote(field: str) -> str:
+    return '"' + field.replace('"', '""') + '"' if _NEEDS_QUOTES.search(field) else field
+
+
+def _quote_rows(text: str) -> str:
+    """Quote the fields that need it in US/RS-joined `text`, touching only the rows that hold them."""
+    out = []
+    pos = 0
+    for m in _NEEDS_QUOTES.finditer(text):
+        at = m.start()
+        if at < pos:
+            continue  # later match in a row already quoted
+        start = text.rfind(_RS, 0, at) + 1
+        end = text.find(_RS, at)
+        if end < 0:
+            end = len(text)
+        out.append(text[pos:start])
+        out.append(_US.join(map(_quote, text[start:end].split(_US))))
+        pos = end
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def encode_rows(rows: Sequence[Sequence]) -> bytes:
+    """UTF-8 bytes of `rows` as `csv.writer(...).writerows(rows)` would write them."""
+    if not rows:
+        return b""
+    n = len(rows)
+    try:
+        if min(map(len, rows)) >= 2:
+            text = _RS.join(map(_US.join, rows))
+            # Exact separator counts prove no field held a separator itself.
+            if text.count(_US) == sum(map(len, rows)) - n and text.count(_RS) == n - 1:
+                if '"' in text or "," in text or "\r" in text or "\n" in text:
+                    text = _quote_rows(text)
+                return (text.replace(_US, ",").replace(_RS, "\r\n") + "\r\n").encode("utf-8")
+    except TypeError:  # numbers, None, ...
+        pass
+
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue().encode("utf-8")
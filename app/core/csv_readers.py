@@ -0,0 +1,485 @@
+from __future__ import annotations
+
+# Input CSV reader backends for `chunk_csv`.
+#
+# - "arrow": pyarrow's streaming CSV reader, yielding record batches.
+# - "numpy": block reader that finds record boundaries with NumPy and passes
+#   quote-free lines through as bytes; blocks that contain quotes, stray
+#   carriage returns or ragged rows are parsed with the csv module.
+# - "csv":   the stdlib csv module, one list per row.
+# - "bytes": zero-parse splitting; record byte ranges of a memory-mapped input
+#   are copied into the parts as-is (no validation or re-serialization).
+#
+# Every backend yields batches that `ChunkWriter` can slice, paired with a
+# matching part encoder. arrow/numpy/csv produce byte-identical output;
+# "bytes" keeps the input's own quoting and line endings.
+
+import csv
+import io
+import mmap
+import os
+from itertools import islice
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator
+
+from app.core.arrow_csv import ArrowCsvEncoder, header_bytes, load_pyarrow
+from app.core.csv_encode import encode_rows
+
+READER_BACKENDS = ("arrow", "numpy", "csv", "bytes")
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class CsvReaderError(RuntimeError):
+    """The selected backend cannot parse this input (the csv backend can)."""
+
+
+def load_numpy():
+    import numpy  # type: ignore
+
+    return numpy
+
+
+def available_backends() -> list[str]:
+    found = []
+    for name, loader in (("arrow", load_pyarrow), ("numpy", load_numpy)):
+        try:
+            loader()
+        except Exception:  # noqa: BLE001
+            continue
+        found.append(name)
+    found.append("csv")
+    return found
+
+
+def select_backend(requested: str = "auto") -> str:
+    """Resolve "auto" to the fastest installed backend; validate explicit names."""
+    available = available_backends()
+    if requested == "auto":
+        return available[0]
+    if requested not in READER_BACKENDS:
+        raise CsvReaderError(f"Unknown reader backend: {requested} (choose from auto, {', '.join(READER_BACKENDS)}).")
+    if requested == "bytes" and "numpy" in available:
+        return requested
+    if requested not in available:
+        raise CsvReaderError(f"Reader backend '{requested}' is not installed.")
+    return requested
+
+
+def fit_rows(batch: list[list[str]], width: int) -> list[list[str]]:
+    """Pad/truncate rows to `width` and drop blank rows, like csv.DictReader/DictWriter."""
+    if set(map(len, batch)) == {width}:
+        return batch
+    return [(row + [""] * width)[:width] for row in batch if row]
+
+
+def iter_csv_batches(reader: Iterable[list[str]], width: int, batch_size: int = 10000) -> Iterator[list[list[str]]]:
+    """Yield lists of rows from a csv.reader, each padded/truncated to `width`.
+
+    Matches csv.DictReader/DictWriter(extrasaction="ignore") semantics without
+    building a dict per row: blank lines are skipped, short rows are padded
+    with empty fields and extra fields are dropped.
+    """
+    while True:
+        batch = list(islice(reader, batch_size))
+        if not batch:
+            return
+        batch = fit_rows(batch, width)
+        if batch:
+            yield batch
+
+
+def data_offset(path: str | Path) -> int:
+    """Byte offset of the first data record (just past the header record)."""
+    with open(path, "rb") as fp:
+        head = fp.read(1024 * 1024)
+    pos = 3 if head.startswith(b"\xef\xbb\xbf") else 0
+    in_quotes = False
+    n = len(head)
+    while pos < n:
+        ch = head[pos]
+        if ch == 0x22:
+            in_quotes = not in_quotes
+        elif not in_quotes and ch in (0x0A, 0x0D):
+            if ch == 0x0D and pos + 1 < n and head[pos + 1] == 0x0A:
+                pos += 1
+            return pos + 1
+        pos += 1
+    return n
+
+
+# ── arrow ───────────────────────────────────────────────────────────
+def open_arrow_batches(
+    path: str | Path,
+    offset: int,
+    width: int,
+    block_size: int = BLOCK_SIZE,
+    on_position: Callable[[int], None] | None = None,
+):
+    """Return `(record batch iterator, encoder)` for the data records after `offset`.
+
+    Every backend calls `on_position` with the input bytes consumed so far
+    before it yields a batch.
+    """
+    pa, pacsv = load_pyarrow()
+    names = [f"f{i}" for i in range(width)]
+
+    def batches():
+        with open(path, "rb") as fp:
+            fp.seek(offset)
+            try:
+                reader = pacsv.open_csv(
+                    fp,
+                    read_options=pacsv.ReadOptions(column_names=names, block_size=block_size),
+                    parse_options=pacsv.ParseOptions(newlines_in_values=True),
+                    convert_options=pacsv.ConvertOptions(
+                        column_types={n: pa.string() for n in names},
+                        strings_can_be_null=False,
+                        quoted_strings_can_be_null=False,
+                    ),
+                )
+                # The reader reads ahead of what it has parsed, so fp.tell() runs early; each
+                # batch is one block of input.
+                consumed = offset
+                for batch in reader:
+                    consumed += block_size
+                    if batch.num_rows:
+                        if on_position:
+                            on_position(min(consumed, fp.tell()))
+                        yield batch
+            except pa.ArrowInvalid as exc:
+                raise CsvReaderError(f"Arrow CSV reader rejected the input: {exc}") from exc
+
+    return batches(), ArrowCsvEncoder()
+
+
+# ── numpy ───────────────────────────────────────────────────────────
+class _Lines(list):
+    """Batch of already-encoded records (bytes, no line terminator)."""
+
+    def __getitem__(self, key):  # noqa: ANN001
+        result = super().__getitem__(key)
+        return _Lines(result) if isinstance(key, slice) else result
+
+
+def record_ends(np, arr):  # noqa: ANN001
+    """Positions just past each newline that ends a record, or None.
+
+    Uses quote parity, which matches the csv module as long as quotes are
+    regular: every quote that opens a quoted section starts a field and every
+    closing quote ends one (or is half of a doubled quote). A bare quote inside
+    an unquoted field (`a"b`) makes parity meaningless, so None is returned.
+    """
+    nl = np.flatnonzero(arr == 0x0A)
+    quotes = np.flatnonzero(arr == 0x22)
+    if quotes.size == 0:
+        return nl + 1
+    n = arr.size
+    separators = (0x2C, 0x0A, 0x0D, 0x22)
+    opening = quotes[0::2]
+    before = arr[np.maximum(opening - 1, 0)]
+    if not bool((np.isin(before, separators) | (opening == 0)).all()):
+        return None
+    closing = quotes[1::2]
+    after = arr[np.minimum(closing + 1, n - 1)]
+    if not bool((np.isin(after, separators) | (closing == n - 1)).all()):
+        return None
+    parity = np.cumsum(arr == 0x22, dtype=np.int64)[nl] & 1
+    return nl[parity == 0] + 1
+
+
+def _fast_lines(np, block: bytes, width: int) -> _Lines | None:
+    """Split a quote-free block into lines, or None if it needs the csv module."""
+    if b'"' in block:
+        return None
+    if b"\r" in block:
+        if block.count(b"\r") != block.count(b"\r\n"):
+            return None
+        block = block.replace(b"\r\n", b"\n")
+    while b"\n\n" in block:
+        block = block.replace(b"\n\n", b"\n")
+    block = block.lstrip(b"\n")
+    if not block:
+        return _Lines()
+    if not block.endswith(b"\n"):
+        block += b"\n"
+    arr = np.frombuffer(block, dtype=np.uint8)
+    commas = np.cumsum(arr == 0x2C, dtype=np.int64)[np.flatnonzero(arr == 0x0A)]
+    per_line = np.diff(commas, prepend=0)
+    if per_line.size and not bool((per_line == width - 1).all()):
+        return None
+    return _Lines(block[:-1].split(b"\n"))
+
+
+def _parse_block(block: bytes, width: int) -> list[list[str]]:
+    return fit_rows(list(csv.reader(io.StringIO(block.decode("utf-8"), newline=""))), width)
+
+
+def open_numpy_batches(
+    path: str | Path,
+    offset: int,
+    width: int,
+    block_size: int = BLOCK_SIZE,
+    on_position: Callable[[int], None] | None = None,
+):
+    """Return `(batch iterator, encoder)` for the data records after `offset`.
+
+    Blocks are cut at record boundaries found with NumPy. Quote-free blocks
+    are passed through as lines; blocks with quotes are parsed with the csv
+    module. If quoting turns out to be irregular, the rest of the file is
+    streamed through the csv module from the last known record boundary.
+    """
+    np = load_numpy()
+
+    def batches():
+        with open(path, "rb") as fp:
+            fp.seek(offset)
+            carry = b""
+            while True:
+                chunk = fp.read(block_size)
+                data = carry + chunk if carry else chunk
+                if not data:
+                    return
+                if chunk:
+                    ends = record_ends(np, np.frombuffer(data, dtype=np.uint8))
+                    if ends is None:
+                        fp.seek(fp.tell() - len(data))
+                        text = io.TextIOWrapper(fp, encoding="utf-8", newline="")
+                        for rows in iter_csv_batches(csv.reader(text), width):
+                            if on_position:
+                                on_position(fp.tell())
+                            yield rows
+                        text.detach()
+                        return
+                    if ends.size == 0:
+                        carry = data
+                        continue
+                    cut = int(ends[-1])
+                    block, carry = data[:cut], data[cut:]
+                else:
+                    block, carry = data, b""
+
+                if on_position:
+                    on_position(fp.tell() - len(carry))
+                lines = _fast_lines(np, block, width)
+                if lines is None:
+                    rows = _parse_block(block, width)
+                    if rows:
+                        yield rows
+                elif lines:
+                    yield lines
+
+    return batches(), LineBatchEncoder()
+
+
+class LineBatchEncoder:
+    """Part encoder for numpy-backend batches: pre-encoded lines or csv rows."""
+
+    def open(self, fp: BinaryIO, header) -> "_LineBatchSink":  # noqa: ANN001
+        return _LineBatchSink(fp, header)
+
+
+class _LineBatchSink:
+    def __init__(self, fp: BinaryIO, header) -> None:  # noqa: ANN001
+        self._fp = fp
+        if header is not None:
+            self._fp.write(header_bytes(header))
+
+    def write(self, batch) -> None:  # noqa: ANN001
+        if isinstance(batch, _Lines):
+            self._fp.write(b"\r\n".join(batch))
+            self._fp.write(b"\r\n")
+            return
+        self._fp.write(encode_rows(batch))
+
+    def close(self) -> None:
+        self._fp.close()
+
+
+# ── bytes ───────────────────────────────────────────────────────────
+SCAN_WINDOW = 64 * 1024 * 1024
+_COPY_CHUNK = 16 * 1024 * 1024
+_RANGE_BATCH = 100_000
+
+
+class _ByteRanges:
+    """Batch of records as absolute `[start, end)` byte ranges of the input."""
+
+    def __init__(self, starts, ends) -> None:  # noqa: ANN001
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, key: slice) -> "_ByteRanges":
+        return _ByteRanges(self.starts[key], self.ends[key])
+
+    def runs(self):
+        """Merge adjacent records into contiguous `(start, end)` copy ranges."""
+        if not len(self.starts):
+            return []
+        np = load_numpy()
+        breaks = np.flatnonzero(self.starts[1:] != self.ends[:-1]) + 1
+        run_starts = self.starts[np.concatenate(([0], breaks))]
+        run_ends = self.ends[np.concatenate((breaks - 1, [len(self.ends) - 1]))]
+        return zip(run_starts.tolist(), run_ends.tolist())
+
+
+def _scan_window(np, arr, base: int, final: bool):
+    """Return `(starts, ends, consumed)` of the non-blank records in `arr`.
+
+    `arr` must start at a record boundary; `base` is its absolute offset.
+    """
+    cr = np.flatnonzero(arr == 0x0D)
+    if cr.size:
+        # A CR as the very last byte is checked again with the next window (or is harmless at EOF).
+        nxt = np.minimum(cr + 1, arr.size - 1)
+        lone = (arr[nxt] != 0x0A) & (cr + 1 < arr.size)
+        if bool(lone.any()):
+            raise CsvReaderError("Input uses bare carriage-return line endings; byte splitting needs LF or CRLF.")
+    ends = record_ends(np, arr)
+    if ends is None:
+        raise CsvReaderError("Input has quotes inside unquoted fields; byte splitting cannot find record boundaries.")
+    consumed = int(ends[-1]) if ends.size else 0
+    if final and consumed < arr.size:
+        ends = np.append(ends, arr.size)
+        consumed = arr.size
+    starts = np.concatenate(([0], ends[:-1])) if ends.size else ends
+    lengths = ends - starts
+    first = arr[np.minimum(starts, arr.size - 1)] if ends.size else ends
+    blank = (lengths == 1) & (first == 0x0A) | (lengths == 2) & (first == 0x0D)
+    if bool(blank.any()):
+        keep = ~blank
+        starts, ends = starts[keep], ends[keep]
+    return starts.astype(np.int64) + base, ends.astype(np.int64) + base, consumed
+
+
+def _copy_range(src_fd: int, mm, dst_fp, start: int, end: int) -> None:  # noqa: ANN001
+    """Copy `[start, end)` of the source into `dst_fp` at its current position.
+
+    Uses copy_file_range / sendfile where the OS supports them for file-to-file
+    copies, and plain writes from the memory map otherwise (e.g. on Windows,
+    or when `dst_fp` compresses).
+    """
+    names = ("copy_file_range", "sendfile") if isinstance(dst_fp, io.FileIO) else ()
+    dst_fd = dst_fp.fileno() if names else -1
+    for name in names:
+        fn = getattr(os, name, None)
+        if fn is None:
+            continue
+        pos = start
+        try:
+            while pos < end:
+                if name == "copy_file_range":
+                    copied = fn(src_fd, dst_fd, min(end - pos, _COPY_CHUNK), pos)
+                else:
+                    copied = fn(dst_fd, src_fd, pos, min(end - pos, _COPY_CHUNK))
+                if copied <= 0:
+                    break
+                pos += copied
+        except OSError:
+            pass
+        if pos == end:
+            return
+        start = pos
+    while start < end:
+        stop = min(end, start + _COPY_CHUNK)
+        dst_fp.write(mm[start:stop])
+        start = stop
+
+
+class ByteRangeEncoder:
+    """Part encoder for `_ByteRanges` batches; owns the memory-mapped input."""
+
+    unbuffered = True
+
+    def __init__(self, path: str | Path, header_line: bytes) -> None:
+        self.header_line = header_line
+        self._fp = open(path, "rb")
+        size = os.fstat(self._fp.fileno()).st_size
+        self.mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def open(self, fp: BinaryIO, header) -> "_ByteRangeSink":  # noqa: ANN001
+        return _ByteRangeSink(fp, self.header_line if header is not None else None, self)
+
+    def close(self) -> None:
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self._fp.close()
+
+
+class _ByteRangeSink:
+    def __init__(self, fp: BinaryIO, header_line: bytes | None, encoder: ByteRangeEncoder) -> None:
+        self._encoder = encoder
+        self._fp = fp
+        if header_line is not None:
+            self._fp.write(header_line)
+
+    def write(self, batch: _ByteRanges) -> None:
+        enc = self._encoder
+        for start, end in batch.runs():
+            _copy_range(enc._fp.fileno(), enc.mm, self._fp, start, end)
+
+    def close(self) -> None:
+        self._fp.close()
+
+
+def open_byte_range_batches(
+    path: str | Path,
+    offset: int,
+    window: int = SCAN_WINDOW,
+    on_position: Callable[[int], None] | None = None,
+):
+    """Return `(batch iterator, encoder)` that copies data records without parsing.
+
+    Record boundaries are found with quote-aware newline scanning over the
+    memory-mapped input; blank lines are dropped. Each part gets the input's
+    header line (without BOM) and its records byte-for-byte.
+    """
+    np = load_numpy()
+    with open(path, "rb") as fp:
+        head = fp.read(offset)
+    header_line = head[3:] if head.startswith(b"\xef\xbb\xbf") else head
+    if header_line and not header_line.endswith((b"\n", b"\r")):
+        header_line += b"\r\n"
+    encoder = ByteRangeEncoder(path, header_line)
+
+    def batches():
+        mm = encoder.mm
+        size = len(mm)
+        pos = offset
+        span = window
+        while pos < size:
+            count = min(span, size - pos)
+            final = pos + count == size
+            arr = np.frombuffer(mm, dtype=np.uint8, count=count, offset=pos)
+            try:
+                starts, ends, consumed = _scan_window(np, arr, pos, final)
+            except CsvReaderError as exc:
+                # The traceback's frames still hold views of the map, which could then never be closed.
+                del arr
+                raise exc.with_traceback(None)
+            del arr
+            if consumed == 0:
+                span *= 2
+                continue
+            pos += consumed
+            # Yield in slices so position reports stay fine-grained.
+            for i in range(0, len(starts), _RANGE_BATCH):
+                batch = _ByteRanges(starts[i : i + _RANGE_BATCH], ends[i : i + _RANGE_BATCH])
+                if on_position:
+                    on_position(int(batch.ends[-1]))
+                yield batch
+            span = window
+
+    return batches(), encoder
+
+
+def count_records(path: str | Path, offset: int) -> int:
+    """Number of data records after `offset`, found like the "bytes" backend finds them (needs NumPy)."""
+    batches, encoder = open_byte_range_batches(path, offset)
+    try:
+        return sum(len(batch) for batch in batches)
+    finally:
+        encoder.close()
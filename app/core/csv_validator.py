@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+# Value checks for input CSVs, run before any upload parts are written.
+#
+# The memory-mapped input is cut into byte ranges at record boundaries and
+# each range is parsed and checked in a worker process. Results are merged
+# into error counts per rule plus the first offending line numbers.
+
+import csv
+import io
+import mmap
+import os
+import re
+from pathlib import Path
+from typing import Callable
+
+from app.core.csv_chunker import (  # noqa: PLC2701
+    CsvChunkerError,
+    _normalize_fieldnames,
+    _required_column_indices,
+    _validate_required_columns,
+)
+from app.core.csv_readers import SCAN_WINDOW, data_offset, load_numpy, record_ends
+
+
+VALID_PRIORITIES = frozenset("01234")
+LOC_PATTERN = re.compile(r"[A-Za-z0-9]+")
+RULES = {
+    "locpriority": "locpriority is not 0-4",
+    "item": "item is blank",
+    "loc": "loc is malformed",
+}
+
+RANGE_SIZE = 16 * 1024 * 1024
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+
+class CsvValidationError(RuntimeError):
+    pass
+
+
+def _split_points(mm, offset: int, size: int, parts: int) -> list[int]:  # noqa: ANN001
+    """Record-boundary offsets cutting `[offset, size)` into about `parts` ranges."""
+    step = max(1, (size - offset) // parts)
+    targets = list(range(offset + step, size, step))
+    if not targets:
+        return [offset, size]
+
+    if mm.find(b'"', offset) == -1:
+        ends = []
+        for target in targets:
+            nl = mm.find(b"\n", target)
+            ends.append(size if nl == -1 else nl + 1)
+    else:
+        ends = _quoted_split_points(mm, offset, size, targets)
+        if ends is None:
+            return [offset, size]
+
+    points = [offset]
+    for end in ends:
+        if points[-1] < end < size:
+            points.append(end)
+    points.append(size)
+    return points
+
+
+def _quoted_split_points(mm, offset: int, size: int, targets: list[int]) -> list[int] | None:  # noqa: ANN001
+    """Like the quote-free case, but only at newlines outside quoted fields.
+
+    Returns None when NumPy is missing or quoting is irregular (see
+    `record_ends`), in which case the input is checked as one range.
+    """
+    try:
+        np = load_numpy()
+    except ImportError:
+        return None
+    ends = []
+    pos = offset
+    span = SCAN_WINDOW
+    pending = list(targets)
+    while pending and pos < size:
+        count = min(span, size - pos)
+        arr = np.frombuffer(mm, dtype=np.uint8, count=count, offset=pos)
+        found = record_ends(np, arr)
+        del arr
+        if found is None:
+            return None
+        if not found.size:
+            if pos + count == size:
+                break
+            span *= 2
+            continue
+        absolute = found + pos
+        while pending and pending[0] < absolute[-1]:
+            ends.append(int(absolute[np.searchsorted(absolute, pending.pop(0))]))
+        pos = int(absolute[-1])
+        span = SCAN_WINDOW
+    return ends
+
+
+def _check_range(path: str, start: int, end: int, indices: tuple[int, int, int], max_examples: int) -> dict:
+    """Check one byte range (whole records); line numbers are relative to it."""
+    i_item, i_loc, i_priority = indices
+    width = max(indices) + 1
+    with open(path, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode("utf-8", errors="replace")
+
+    counts = dict.fromkeys(RULES, 0)
+    examples: list[tuple[int, str, str]] = []
+    records = 0
+    reader = csv.reader(io.StringIO(text, newline=""))
+    line = 0
+    for row in reader:
+        first_line, line = line + 1, reader.line_num
+        if not row:
+            continue
+        records += 1
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        bad = []
+        if row[i_priority] not in VALID_PRIORITIES:
+            bad.append(("locpriority", row[i_priority]))
+        if not row[i_item].strip():
+            bad.append(("item", row[i_item]))
+        if LOC_PATTERN.fullmatch(row[i_loc]) is None:
+            bad.append(("loc", row[i_loc]))
+        for rule, value in bad:
+            counts[rule] += 1
+            if len(examples) < max_examples:
+                examples.append((first_line, rule, value))
+    return {"records": records, "lines": reader.line_num, "counts": counts, "examples": examples}
+
+
+def describe_errors(report: dict, limit: int = 10) -> str:
+    """One-line summary of a failed `validate_csv` report."""
+    counts = ", ".join(f"{RULES[rule]}: {n:,}" for rule, n in report["errors"].items() if n)
+    lines = sorted({e["line"] for e in report["examples"]})
+    shown = ", ".join(str(n) for n in lines[:limit])
+    return f"Input CSV has {report['error_count']:,} invalid value(s) ({counts}). First at line(s) {shown}."
+
+
+def validate_csv(
+    *,
+    input_csv: str,
+    workers: int | None = None,
+    max_examples: int = 20,
+    range_size: int = RANGE_SIZE,
+    on_log: Callable[[str], None] | None = None,
+) -> dict:
+    """Check every data row's item, loc and locpriority values.
+
+    - locpriority must be one of 0, 1, 2, 3, 4.
+    - item must not be blank.
+    - loc must be a non-empty alphanumeric code (e.g. 3001, GA01).
+
+    Records are split into byte ranges and checked by `workers` processes
+    (default: one per CPU, and small inputs are checked in-process). Line numbers
+    are 1-based physical lines of the input, header included.
+    """
+
+    input_path = Path(input_csv)
+    if not input_path.exists():
+        raise CsvValidationError(f"Input file not found: {input_csv}")
+
+    def log(msg: str) -> None:
+        if on_log:
+            on_log(msg)
+
+    with input_path.open("r", newline="", encoding="utf-8-sig") as in_fp:
+        header_reader = csv.reader(in_fp)
+        fieldnames = _normalize_fieldnames(next(header_reader, None))
+        header_lines = header_reader.line_num
+    try:
+        _validate_required_columns(fieldnames)
+    except CsvChunkerError as exc:
+        raise CsvValidationError(str(exc)) from exc
+    indices = _required_column_indices(fieldnames)
+
+    offset = data_offset(input_path)
+    size = input_path.stat().st_size
+    if workers is None:
+        workers = (os.cpu_count() or 1) if size - offset >= PARALLEL_MIN_BYTES else 1
+    workers = max(1, workers)
+
+    if size > offset:
+        with input_path.open("rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            parts = max(workers, (size - offset) // range_size) if workers > 1 else 1
+            points = _split_points(mm, offset, size, parts)
+    else:
+        points = [offset]
+    ranges = list(zip(points, points[1:]))
+
+    log(f"Checking values in {len(ranges)} range(s) with {min(workers, len(ranges) or 1)} worker(s)…")
+    jobs = [(str(input_path), start, end, indices, max_examples) for start, end in ranges]
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_check_range, *zip(*jobs)))
+    else:
+        results = [_check_range(*job) for job in jobs]
+
+    counts = dict.fromkeys(RULES, 0)
+    examples = []
+    rows = 0
+    line_base = header_lines
+    for res in results:
+        rows += res["records"]
+        for rule, n in res["counts"].items():
+            counts[rule] += n
+        if len(examples) < max_examples:
+            for line, rule, value in res["examples"]:
+                examples.append({"line": line_base + line, "column": rule, "value": value})
+        line_base += res["lines"]
+
+    return {
+        "rows_checked": rows,
+        "error_count": sum(counts.values()),
+        "errors": counts,
+        "examples": examples[:max_examples],
+        "workers": min(workers, len(jobs)) if jobs else 1,
+    }
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+# Streaming DISTINCT over (item, loc, locpriority) for the chunk pipeline.
+#
+# New rows pass straight through while the set of seen keys fits in
+# `memory_mb` (the bytes per key and per buffered row are estimated from the
+# first batch). Past that, the seen keys are written to a sorted run on disk,
+# later rows are buffered into further sorted runs of the same budget, and
+# the runs are merged at the end, so memory stays bounded no matter how
+# large the input is. Rows that come out of the merge are in
+# (item, loc, locpriority) order instead of input order.
+#
+# An (item, loc) pair with more than one locpriority is a conflict: all of
+# its rows are kept (as `select distinct` would) and the pair is reported.
+
+import csv
+import heapq
+import sys
+import tempfile
+from itertools import groupby, islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence
+
+
+DEDUPE_MEMORY_MB = 256
+MAX_CONFLICT_EXAMPLES = 20
+_SAMPLE_ROWS = 1000
+_DICT_SLOT = 64  # hash table entry and index, with the table's growth slack
+
+# Run records: item, loc, locpriority, sequence number, then the row itself.
+# Keys that were already written out before the first spill get sequence 0
+# and no row, so they sort first in their group and suppress later copies.
+_SEQ_WIDTH = 12
+_EMITTED = "0" * _SEQ_WIDTH
+
+
+def _key_bytes(batch: Sequence[Sequence], key: Callable) -> int:
+    """Approximate memory a seen key holds: the (item, loc) tuple, the item and its dict slot.
+
+    Loc and locpriority values are interned, so they are shared across keys.
+    """
+    sample = batch[:_SAMPLE_ROWS]
+    total = sum(sys.getsizeof((item, loc)) + sys.getsizeof(item) for item, loc, _ in map(key, sample))
+    return total // len(sample) + _DICT_SLOT
+
+
+def _record_bytes(batch: Sequence[Sequence]) -> int:
+    """Approximate memory a buffered row holds in a spill run: the row, its record list and sequence number."""
+    sample = batch[:_SAMPLE_ROWS]
+    total = sum(
+        sys.getsizeof(row) + sum(map(sys.getsizeof, row)) + sys.getsizeof([None] * (len(row) + 4)) for row in sample
+    )
+    return total // len(sample) + sys.getsizeof(_EMITTED) + 16
+
+
+class DistinctFilter:
+    """Drop repeated (item, loc, locpriority) rows from a stream of row batches."""
+
+    def __init__(
+        self,
+        indices: Sequence[int],
+        *,
+        memory_mb: int = DEDUPE_MEMORY_MB,
+        spill_dir: str | Path | None = None,
+        batch_size: int = 10000,
+    ) -> None:
+        self.key = itemgetter(*indices)
+        self.memory_mb = memory_mb
+        self.max_keys: int | None = None  # keys that fit `memory_mb`, from the first batch
+        self.run_rows: int | None = None  # rows per spill run, likewise
+        self.spill_dir = spill_dir
+        self.batch_size = batch_size
+        self.rows_in = 0
+        self.rows_out = 0
+        self.spilled_runs = 0
+        self.conflicts = 0
+        self.conflict_examples: list[dict] = []
+
+    def _conflict(self, item: str, loc: str, priorities: Iterable[str]) -> None:
+        self.conflicts += 1
+        if len(self.conflict_examples) < MAX_CONFLICT_EXAMPLES:
+            self.conflict_examples.append({"item": item, "loc": loc, "locpriorities": sorted(priorities)})
+
+    def filter(self, batches: Iterable[list[list[str]]]) -> Iterator[list[list[str]]]:
+        """Yield the distinct rows of `batches`, spilling to disk past `memory_mb`."""
+        key = self.key
+        intern = sys.intern
+        # (item, loc) -> locpriority, or a set of them once the pair conflicts.
+        seen: dict[tuple[str, str], str | set[str]] = {}
+        batches = iter(batches)
+        for batch in batches:
+            if not batch:
+                continue
+            if self.max_keys is None:
+                budget = self.memory_mb * 1024 * 1024
+                self.max_keys = max(1, budget // _key_bytes(batch, key))
+                self.run_rows = max(1, budget // _record_bytes(batch))
+            self.rows_in += len(batch)
+            out = []
+            for row in batch:
+                item, loc, priority = key(row)
+                pair = (item, intern(loc))
+                known = seen.get(pair)
+                if known is None:
+                    seen[pair] = intern(priority)
+                elif known == priority or (isinstance(known, set) and priority in known):
+                    continue
+                elif isinstance(known, set):
+                    known.add(priority)
+                else:
+                    seen[pair] = {known, priority}
+                out.append(row)
+            if out:
+                self.rows_out += len(out)
+                yield out
+            if len(seen) > self.max_keys:
+                yield from self._spill(seen, batches)
+                return
+
+        for (item, loc), known in seen.items():
+            if isinstance(known, set):
+                self._conflict(item, loc, known)
+
+    def _spill(self, seen: dict, batches: Iterator[list[list[str]]]) -> Iterator[list[list[str]]]:
+        with tempfile.TemporaryDirectory(prefix="locpriority-distinct-", dir=self.spill_dir) as td:
+            runs = [self._write_run(Path(td), self._emitted_records(seen))]
+            seen.clear()
+            seq = 0
+            rows = (row for batch in batches for row in batch)
+            while True:
+                chunk = list(islice(rows, self.run_rows))
+                if not chunk:
+                    break
+                self.rows_in += len(chunk)
+                records = []
+                for row in chunk:
+                    seq += 1
+                    records.append([*self.key(row), f"{seq:0{_SEQ_WIDTH}d}", *row])
+                records.sort()
+                runs.append(self._write_run(Path(td), records))
+            yield from self._merge(runs)
+
+    @staticmethod
+    def _emitted_records(seen: dict) -> list[list[str]]:
+        records = []
+        for (item, loc), known in seen.items():
+            for priority in known if isinstance(known, set) else (known,):
+                records.append([item, loc, priority, _EMITTED])
+        records.sort()
+        return records
+
+    def _write_run(self, spill_dir: Path, records: list[list[str]]) -> Path:
+        path = spill_dir / f"run-{self.spilled_runs:04d}.csv"
+        with path.open("w", newline="", encoding="utf-8") as fp:
+            csv.writer(fp).writerows(records)
+        self.spilled_runs += 1
+        return path
+
+    def _merge(self, runs: list[Path]) -> Iterator[list[list[str]]]:
+        files = [p.open("r", newline="", encoding="utf-8") for p in runs]
+        try:
+            merged = heapq.merge(*(csv.reader(fp) for fp in files))
+            out = []
+            for (item, loc), pair_records in groupby(merged, key=itemgetter(0, 1)):
+                priorities = []
+                for priority, records in groupby(pair_records, key=itemgetter(2)):
+                    priorities.append(priority)
+                    first = next(records)
+                    if first[3] != _EMITTED:
+                        out.append(first[4:])
+                if len(priorities) > 1:
+                    self._conflict(item, loc, priorities)
+                if len(out) >= self.batch_size:
+                    self.rows_out += len(out)
+                    yield out
+                    out = []
+            if out:
+                self.rows_out += len(out)
+                yield out
+        finally:
+            for fp in files:
+                fp.close()
+
+    def result(self) -> dict:
+        return {
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "duplicates_dropped": self.rows_in - self.rows_out,
+            "conflicts": self.conflicts,
+            "conflict_examples": self.conflict_examples,
+            "memory_mb": self.memory_mb,
+            "max_keys": self.max_keys,
+            "spilled_runs": self.spilled_runs,
+        }
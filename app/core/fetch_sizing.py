@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+# Runtime sizing of cursor.fetchmany() batches.
+#
+# The first fetch is a small probe that measures bytes per row, so even the
+# first full-size batch of a wide query fits the memory budget. After that,
+# each batch size is tried for `window` full batches. While rows/s keeps
+# improving by at least `min_gain`, the size doubles; when it stops, the
+# controller steps back to the best size and holds there. A window whose
+# batches exceed the memory or latency budget shrinks the size to fit and
+# caps it, so later growth cannot cross the budget again.
+
+import sys
+from typing import Sequence
+
+DEFAULT_FETCH_SIZE = 10_000
+MIN_FETCH_SIZE = 1_000
+MAX_FETCH_SIZE = 100_000
+# Per batch; the export may hold a few batches at once (see its `prefetch`).
+MAX_BATCH_BYTES = 32 * 1024 * 1024
+MAX_BATCH_SECONDS = 5.0
+
+_SAMPLE_ROWS = 32
+
+
+def estimate_batch_bytes(batch: Sequence[Sequence]) -> int:
+    """Approximate in-memory size of a batch of row tuples, from a sample of its rows."""
+    n = len(batch)
+    if not n:
+        return 0
+    step = max(1, n // _SAMPLE_ROWS)
+    sample = batch[::step]
+    sizeof = sys.getsizeof
+    sampled = sum(sizeof(row) + sum(sizeof(v) for v in row) for row in sample)
+    return sampled * n // len(sample)
+
+
+class AdaptiveFetchSize:
+    def __init__(
+        self,
+        initial: int = DEFAULT_FETCH_SIZE,
+        *,
+        probe: int = MIN_FETCH_SIZE,
+        min_size: int = MIN_FETCH_SIZE,
+        max_size: int = MAX_FETCH_SIZE,
+        max_batch_bytes: int = MAX_BATCH_BYTES,
+        max_batch_seconds: float = MAX_BATCH_SECONDS,
+        window: int = 2,
+        min_gain: float = 0.1,
+    ) -> None:
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_seconds = max_batch_seconds
+        self.window = max(1, window)
+        self.min_gain = min_gain
+        self.initial = min(max(initial, min_size), max_size)
+        self.size = min(max(probe, min_size), self.initial)
+        self.settled = False
+        self.batches = 0
+        self.peak_bytes = 0
+        self.changes: list[dict] = []
+        self._best: tuple[float, int] | None = None  # (rows/s, size)
+        self._rows = 0
+        self._seconds = 0.0
+        self._count = 0
+
+    def _change(self, size: int, reason: str) -> None:
+        size = min(max(size, self.min_size), self.max_size)
+        if size != self.size:
+            self.changes.append({"batch": self.batches, "size": size, "reason": reason})
+            self.size = size
+        self._rows = 0
+        self._seconds = 0.0
+        self._count = 0
+
+    def observe(self, rows: int, seconds: float, nbytes: int) -> int:
+        """Record one fetched batch and return the size to request next."""
+        self.batches += 1
+        self.peak_bytes = max(self.peak_bytes, nbytes)
+        if rows < self.size:
+            return self.size  # the short last batch says nothing about the rate
+        if self.batches == 1 and self.size < self.initial:
+            fit = int(self.max_batch_bytes * 0.9 / max(nbytes, 1) * rows)
+            self.max_size = max(self.min_size, min(self.max_size, fit))
+            self._change(min(self.initial, fit), "probe")
+            return self.size
+        if nbytes > self.max_batch_bytes or seconds > self.max_batch_seconds:
+            fit = min(self.max_batch_bytes / max(nbytes, 1), self.max_batch_seconds / max(seconds, 1e-9))
+            self.max_size = max(self.min_size, int(self.size * fit * 0.9))
+            self._change(self.max_size, "memory" if nbytes > self.max_batch_bytes else "latency")
+            return self.size
+        if self.settled:
+            return self.size
+        self._rows += rows
+        self._seconds += seconds
+        self._count += 1
+        if self._count < self.window:
+            return self.size
+        rate = self._rows / self._seconds if self._seconds > 0 else float("inf")
+        if self._best is None or rate >= self._best[0] * (1 + self.min_gain):
+            self._best = (rate, self.size)
+            if self.size >= self.max_size:
+                self.settled = True
+            self._change(self.size * 2, "throughput")
+        else:
+            self.settled = True
+            self._change(self._best[1], "settled")
+        return self.size
+
+    def result(self) -> dict:
+        return {
+            "initial": self.initial,
+            "final": self.size,
+            "batches": self.batches,
+            "peak_batch_mb": round(self.peak_bytes / 1e6, 1),
+            "changes": self.changes,
+        }
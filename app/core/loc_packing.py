@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+# Location-aware part packing.
+#
+# With plain cuts every 60,000 rows, one loc's rows can land in two parts,
+# which then have to be imported one after the other. Packing keeps each
+# loc in a single part instead: rows are sorted by (loc, item) (see
+# `LocItemSorter`) while the rows per loc are counted, the loc groups are
+# bin-packed first-fit-decreasing into parts of at most `max_rows` rows,
+# and the sorted rows are routed to their part. Parts are buffered in
+# memory up to the sort budget and appended to one spill file per part
+# past it, then handed to the writer part by part. A loc with more rows
+# than one part holds fills whole parts of its own, and its remainder is
+# packed like any other group.
+
+import csv
+import math
+import tempfile
+import time
+from collections import Counter
+from bisect import bisect_right
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence
+
+from app.core.csv_encode import encode_rows
+from app.core.row_sort import SORT_MEMORY_MB, LocItemSorter, RowSortError
+
+MAX_SPLIT_EXAMPLES = 20
+
+
+class LocPackingError(RuntimeError):
+    pass
+
+
+def pack_groups(counts: dict[str, int], max_rows: int) -> tuple[list[list[tuple[str, int]]], list[str]]:
+    """First-fit-decreasing: return the parts as `(loc, rows)` lists, and the locs that fill more than one part."""
+    parts: list[list[tuple[str, int]]] = []
+    room: list[int] = []
+    split = []
+    for loc, n in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])):
+        if n > max_rows:
+            split.append(loc)
+            while n > max_rows:
+                parts.append([(loc, max_rows)])
+                room.append(0)
+                n -= max_rows
+        for i, free in enumerate(room):
+            if free >= n:
+                parts[i].append((loc, n))
+                room[i] -= n
+                break
+        else:
+            parts.append([(loc, n)])
+            room.append(max_rows - n)
+    return parts, split
+
+
+class LocPacker:
+    """Regroup a stream of row batches so that no loc straddles two parts."""
+
+    def __init__(
+        self,
+        loc_index: int,
+        item_index: int,
+        *,
+        max_rows: int,
+        max_parts: int | None = None,
+        memory_mb: int = SORT_MEMORY_MB,
+        spill_dir: str | Path | None = None,
+        batch_size: int = 10000,
+    ) -> None:
+        self.sorter = LocItemSorter(
+            loc_index, item_index, memory_mb=memory_mb, spill_dir=spill_dir, batch_size=batch_size
+        )
+        self.loc_index = loc_index
+        self._loc = itemgetter(loc_index)
+        self.max_rows = max_rows
+        self.max_parts = max_parts
+        self.spill_dir = spill_dir
+        self.batch_size = batch_size
+        self.counts: Counter = Counter()
+        self.parts: list[list[tuple[str, int]]] = []
+        self.split_locs: list[str] = []
+        self.spilled_parts = 0
+        self.seconds = 0.0  # counting, packing and routing; the sort's own time is `sorter.seconds`
+
+    def _count(self, batches: Iterable[Sequence[Sequence]]) -> Iterator[Sequence[Sequence]]:
+        for batch in batches:
+            t0 = time.perf_counter()
+            self.counts.update(map(self._loc, batch))
+            self.seconds += time.perf_counter() - t0
+            yield batch
+
+    def _plan(self) -> dict:
+        """Pack the counted locs; return loc -> [[part, rows left], ...] in the order its rows go."""
+        if self.sorter.text_keys:
+            # The sorter ordered (and may have spilled) the locs as text: count and route them the same way.
+            index = self.loc_index
+            self._loc = lambda row: "" if row[index] is None else str(row[index])
+            counts: Counter = Counter()
+            for loc, n in self.counts.items():
+                counts["" if loc is None else str(loc)] += n
+            self.counts = counts
+        self.parts, self.split_locs = pack_groups(self.counts, self.max_rows)
+        if self.max_parts is not None and len(self.parts) > self.max_parts:
+            raise LocPackingError(
+                f"Keeping each loc in one file needs {len(self.parts)} files of <={self.max_rows:,} rows. "
+                f"This tool only outputs at most {self.max_parts}."
+            )
+        routes: dict = {}
+        for index, part in enumerate(self.parts):
+            for loc, n in part:
+                routes.setdefault(loc, []).append([index, n])
+        return routes
+
+    def pack(self, batches: Iterable[Sequence[Sequence]], end_part: Callable[[], None]) -> Iterator[list]:
+        """Yield the rows part by part, calling `end_part()` between parts (see `ChunkWriter.end_part`)."""
+        buffers: list[list] = []
+        buffered = 0
+        spill: tempfile.TemporaryDirectory | None = None
+        routes = None
+        try:
+            for batch in self.sorter.sort(self._count(batches)):
+                t0 = time.perf_counter()
+                if routes is None:
+                    # The sort has consumed the whole input, so the counts are final.
+                    routes = self._plan()
+                    buffers = [[] for _ in self.parts]
+                # Sorted rows: each loc's run in the batch ends where bisect puts its key.
+                keys = list(map(self._loc, batch))
+                start = 0
+                while start < len(keys):
+                    loc = keys[start]
+                    n = bisect_right(keys, loc, start) - start
+                    stops = routes[loc]
+                    while n:
+                        stop = stops[0]
+                        take = min(n, stop[1])
+                        buffers[stop[0]].extend(batch[start:start + take])
+                        start += take
+                        n -= take
+                        stop[1] -= take
+                        if not stop[1]:
+                            stops.pop(0)
+                buffered += len(batch)
+                if buffered >= self.sorter.run_rows:
+                    if spill is None:
+                        spill = self._spill_dir()
+                    self._spill(Path(spill.name), buffers)
+                    buffered = 0
+                self.seconds += time.perf_counter() - t0
+
+            for index, rows in enumerate(buffers):
+                if index:
+                    end_part()
+                yield from self._part_batches(spill, index, rows)
+                buffers[index] = []
+        finally:
+            if spill is not None:
+                spill.cleanup()
+
+    def _spill_dir(self) -> tempfile.TemporaryDirectory:
+        try:
+            return tempfile.TemporaryDirectory(prefix="locpriority-pack-", dir=self.spill_dir)
+        except OSError as exc:
+            raise LocPackingError(f"Failed to create the packing spill folder: {exc}") from exc
+
+    def _spill(self, spill_dir: Path, buffers: list[list]) -> None:
+        try:
+            for index, rows in enumerate(buffers):
+                if not rows:
+                    continue
+                path = spill_dir / f"part-{index:04d}.csv"
+                if not path.exists():
+                    self.spilled_parts += 1
+                with path.open("ab") as fp:
+                    for start in range(0, len(rows), self.batch_size):
+                        fp.write(encode_rows(rows[start:start + self.batch_size]))
+                rows.clear()
+        except OSError as exc:
+            raise LocPackingError(f"Failed to spill packed rows to disk: {exc}") from exc
+
+    def _part_batches(self, spill: tempfile.TemporaryDirectory | None, index: int, rows: list) -> Iterator[list]:
+        path = Path(spill.name) / f"part-{index:04d}.csv" if spill is not None else None
+        if path is not None and path.exists():
+            # Spilled rows came first in sort order; the buffer holds the rest of the part.
+            with path.open("r", newline="", encoding="utf-8") as fp:
+                reader = csv.reader(fp)
+                while True:
+                    batch = list(islice(reader, self.batch_size))
+                    if not batch:
+                        break
+                    yield batch
+        for start in range(0, len(rows), self.batch_size):
+            yield rows[start:start + self.batch_size]
+
+    def result(self) -> dict:
+        rows = sum(self.counts.values())
+        fills = [sum(n for _, n in part) for part in self.parts]
+        return {
+            "rows": rows,
+            "locs": len(self.counts),
+            "parts": len(self.parts),
+            "min_parts": math.ceil(rows / self.max_rows),
+            "average_fill": round(rows / (len(self.parts) * self.max_rows), 4) if self.parts else None,
+            "part_fill": [
+                {"part": i + 1, "rows": n, "locs": len(part), "fill": round(n / self.max_rows, 4)}
+                for i, (part, n) in enumerate(zip(self.parts, fills))
+            ],
+            "split_locs": len(self.split_locs),
+            "split_loc_examples": self.split_locs[:MAX_SPLIT_EXAMPLES],
+            "spilled_parts": self.spilled_parts,
+            "seconds": round(self.seconds, 3),
+        }
+
+    def summary(self) -> str:
+        fill = self.result()["average_fill"]
+        return (
+            f"Packed {len(self.counts):,} locations into {len(self.parts)} part(s) "
+            f"(average fill {fill or 0:.1%}, {len(self.split_locs)} location(s) larger than one part split)."
+        )
+
+
+__all__ = ["LocPacker", "LocPackingError", "RowSortError", "pack_groups"]
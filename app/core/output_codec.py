@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+# Output codecs for `ChunkWriter` parts.
+#
+# "none" writes plain .csv files, "gzip" writes each part as .csv.gz, and
+# "zip" writes every part as a member of one <base>.zip bundle. Compression
+# happens inline as the part is written, behind a large write buffer so zlib
+# sees big blocks instead of the csv module's small writes.
+
+import gzip
+import io
+import time
+import zipfile
+from pathlib import Path
+from typing import BinaryIO
+
+OUTPUT_CODECS = ("none", "gzip", "zip")
+DEFAULT_LEVEL = 3
+WRITE_BUFFER = 1024 * 1024
+
+
+class _GzipPart(gzip.GzipFile):
+    """GzipFile that owns (and closes) its output file; mtime 0 keeps output reproducible."""
+
+    def __init__(self, path: Path, name: str, level: int, buffer_size: int) -> None:
+        self._out = path.open("wb", buffering=buffer_size)
+        try:
+            super().__init__(filename=name, mode="wb", compresslevel=level, fileobj=self._out, mtime=0)
+        except BaseException:
+            self._out.close()
+            raise
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._out.close()
+
+
+class OutputCodec:
+    """Opens part files for a `ChunkWriter` (see `open`)."""
+
+    def __init__(self, name: str = "none", *, level: int = DEFAULT_LEVEL, buffer_size: int = WRITE_BUFFER) -> None:
+        if name not in OUTPUT_CODECS:
+            raise ValueError(f"Unknown output codec: {name} (choose from {', '.join(OUTPUT_CODECS)}).")
+        if name != "none" and not 0 <= level <= 9:
+            raise ValueError("Compression level must be between 0 and 9.")
+        self.name = name
+        self.level = level
+        self.buffer_size = buffer_size
+        self.suffix = ".csv.gz" if name == "gzip" else ".csv"
+        self._zip: zipfile.ZipFile | None = None
+        self._zip_out: BinaryIO | None = None
+        self._member_sizes: dict[str, int] = {}
+
+    @property
+    def sequential(self) -> bool:
+        """True if parts must be written one after another (zip members share one stream)."""
+        return self.name == "zip"
+
+    def archive_path(self, output_dir: Path, base_name: str) -> Path | None:
+        """The bundle the parts are written into, or None when each part is its own file."""
+        return output_dir / f"{base_name}.zip" if self.name == "zip" else None
+
+    def open_archive(self, path: Path) -> None:
+        self._zip_out = path.open("wb", buffering=self.buffer_size)
+        self._zip = zipfile.ZipFile(self._zip_out, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=self.level)
+
+    def open(self, path: Path, *, temp: Path | None = None, unbuffered: bool = False) -> BinaryIO:
+        """Return a binary stream for the part `path` (a member name inside the archive for zip).
+
+        The data goes to `temp` instead when given (the part is named after
+        `path` either way). `unbuffered` asks for the raw file where the
+        codec writes plain files, for encoders that copy with OS calls on
+        the file descriptor.
+        """
+        target = temp or path
+        if self.name == "gzip":
+            return io.BufferedWriter(_GzipPart(target, path.stem, self.level, self.buffer_size), self.buffer_size)
+        if self.name == "zip":
+            info = zipfile.ZipInfo(path.name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info._compresslevel = self.level  # noqa: SLF001 -- ZipFile.open() ignores the archive level
+            return io.BufferedWriter(self._zip.open(info, "w", force_zip64=True), self.buffer_size)
+        return target.open("wb", buffering=0 if unbuffered else self.buffer_size)
+
+    def part_size(self, path: Path) -> int:
+        """Bytes the part takes on disk (compressed size for zip members)."""
+        if self.name == "zip":
+            zf = self._zip
+            return zf.getinfo(path.name).compress_size if zf is not None else self._member_sizes.get(path.name, 0)
+        try:
+            return path.stat().st_size
+        except OSError:
+            return 0
+
+    def close(self) -> None:
+        zf, self._zip = self._zip, None
+        out, self._zip_out = self._zip_out, None
+        try:
+            if zf is not None:
+                self._member_sizes = {info.filename: info.compress_size for info in zf.infolist()}
+                zf.close()
+        finally:
+            if out is not None:
+                out.close()
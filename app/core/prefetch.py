@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Iterable, Iterator
+
+_END = object()
+
+
+class _Failed:
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+class BatchPrefetcher:
+    """Pull batches from `batches` on a background thread into a bounded queue.
+
+    Iterating the prefetcher yields the same batches in the same order while
+    the next ones are already being fetched; at most `depth` batches wait in
+    the queue, so a slow consumer stalls the fetch instead of growing memory.
+    An exception raised by the source is re-raised to the consumer after the
+    batches before it. Use as a context manager: leaving the block early
+    stops the fetch thread and waits for it, so the source (e.g. a cursor)
+    can be closed safely afterwards.
+    """
+
+    def __init__(self, batches: Iterable, *, depth: int = 4, name: str = "prefetch") -> None:
+        self._source = batches
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, depth))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def __enter__(self) -> "BatchPrefetcher":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:  # noqa: ANN001
+        self.close()
+
+    def start(self) -> None:
+        if self._thread.ident is None:
+            self._thread.start()
+
+    def _offer(self, item) -> bool:  # noqa: ANN001
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self) -> None:
+        try:
+            for batch in self._source:
+                if not self._offer(batch):
+                    return
+        except BaseException as exc:  # noqa: BLE001
+            self._offer(_Failed(exc))
+            return
+        self._offer(_END)
+
+    def __iter__(self) -> Iterator:
+        self.start()
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failed):
+                raise item.exc
+            yield item
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
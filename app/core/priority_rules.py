@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+# Local evaluator for the v_LOCPRIORITY_UPLOAD classification (`ACTIVATE_VIEW_SQL`).
+#
+# Applies the view's CASE to `skuextract`-shaped rows so rule changes can be
+# previewed without redeploying the view. With pyarrow, each batch is
+# classified with Arrow compute kernels (regex matches and boolean masks over
+# whole columns); otherwise rows go through the same rules one at a time.
+#
+# CSV exports cannot tell NULL from an empty string, so an empty field is
+# treated as NULL everywhere (including the `udc_source_1 is not null` filter).
+
+import csv
+import re
+from pathlib import Path
+from typing import Callable, Iterator, Sequence
+
+from app.core.arrow_csv import ArrowCsvEncoder
+from app.core.chunk_writer import MAX_ROWS_PER_FILE, ChunkWriter, ChunkWriterError
+from app.core.csv_chunker import (  # noqa: PLC2701
+    REQUIRED_COLUMNS,
+    CsvChunkerError,
+    _normalize_fieldnames,
+    _safe_base_name,
+    _validate_max_rows,
+)
+from app.core.csv_readers import CsvReaderError, data_offset, iter_csv_batches, open_arrow_batches, select_backend
+
+
+RULE_COLUMNS = ("item", "loc", "udc_source_1", "udc_source_2", "udc_source_3", "udc_ultimate_source")
+PRIORITIES = ("0", "1", "2", "3", "4")
+
+# regexp_like() matches the whole value; the patterns are already anchored.
+VMI_LOC = "^3[0-9]{3}$"
+DC_SOURCE = "^[A-Z]{2}[0-9]{2}$"
+
+_VMI_LOC = re.compile(VMI_LOC[1:-1])
+_DC_SOURCE = re.compile(DC_SOURCE[1:-1])
+
+
+class PriorityRulesError(RuntimeError):
+    pass
+
+
+def classify(
+    loc: str | None, source_1: str | None, source_2: str | None, source_3: str | None, ultimate: str | None
+) -> str:
+    """locpriority for one skuextract row (empty or None means NULL)."""
+    if loc and source_1 and _VMI_LOC.fullmatch(loc) and _DC_SOURCE.fullmatch(source_1):
+        return "0"
+    if source_3:
+        # NULL udc_ultimate_source makes `<>` unknown, which falls through to '3'.
+        return "4" if ultimate and source_3 != ultimate else "3"
+    if source_2:
+        return "2"
+    return "1"
+
+
+def classify_rows(rows: Sequence[Sequence[str]], indices: Sequence[int]) -> list[list[str]]:
+    """View rows `[item, loc, locpriority]` for rows with a udc_source_1."""
+    i_item, i_loc, i_s1, i_s2, i_s3, i_ult = indices
+    return [
+        [row[i_item], row[i_loc], classify(row[i_loc], row[i_s1], row[i_s2], row[i_s3], row[i_ult])]
+        for row in rows
+        if row[i_s1]
+    ]
+
+
+def classify_table(table, indices: Sequence[int]):  # noqa: ANN001
+    """Arrow version of `classify_rows`: returns an item/loc/locpriority table."""
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+
+    item, loc, s1, s2, s3, ult = (table.column(i) for i in indices)
+
+    def present(col):  # noqa: ANN001, ANN202
+        return pc.fill_null(pc.not_equal(col, ""), False)
+
+    def matches(col, pattern: str):  # noqa: ANN001, ANN202
+        return pc.fill_null(pc.match_substring_regex(col, pattern), False)
+
+    vmi = pc.and_(matches(loc, VMI_LOC), matches(s1, DC_SOURCE))
+    has_s3 = present(s3)
+    other_ultimate = pc.and_(pc.and_(has_s3, present(ult)), pc.fill_null(pc.not_equal(s3, ult), False))
+    conditions = pc.make_struct(vmi, other_ultimate, has_s3, present(s2), field_names=["0", "4", "3", "2"])
+    priority = pc.case_when(conditions, "0", "4", "3", "2", "1")
+
+    keep = present(s1)
+    return pa.table(
+        {"item": pc.filter(item, keep), "loc": pc.filter(loc, keep), "locpriority": pc.filter(priority, keep)}
+    )
+
+
+def _rule_indices(fieldnames: list[str]) -> list[int]:
+    lowered = [f.lower() for f in fieldnames]
+    missing = [c for c in RULE_COLUMNS if c not in lowered]
+    if missing:
+        raise PriorityRulesError(
+            "Input CSV is missing skuextract column(s): "
+            + ", ".join(missing)
+            + ". Required: "
+            + ", ".join(RULE_COLUMNS)
+            + "."
+        )
+    return [len(lowered) - 1 - lowered[::-1].index(c) for c in RULE_COLUMNS]
+
+
+def evaluate_skuextract(
+    *,
+    input_csv: str,
+    output_dir: str,
+    base_name: str,
+    max_rows: int = MAX_ROWS_PER_FILE,
+    max_parts: int | None = None,
+    include_header: bool = True,
+    plain_single_file: bool = True,
+    writers: int = 2,
+    engine: str = "auto",
+    on_log: Callable[[str], None] | None = None,
+) -> dict:
+    """Classify a skuextract CSV with the view's rules and write item/loc/locpriority files.
+
+    `engine` is "arrow" (vectorized, needs pyarrow), "python" or "auto".
+    The result adds per-priority `counts` and the number of `rows_read`.
+    """
+
+    try:
+        _validate_max_rows(max_rows)
+    except CsvChunkerError as exc:
+        raise PriorityRulesError(str(exc)) from exc
+
+    input_path = Path(input_csv)
+    if not input_path.exists():
+        raise PriorityRulesError(f"Input file not found: {input_csv}")
+    out_dir = Path(output_dir)
+    if not out_dir.exists():
+        raise PriorityRulesError(f"Output folder not found: {output_dir}")
+    if engine not in ("auto", "arrow", "python"):
+        raise PriorityRulesError(f"Unknown rules engine: {engine} (choose from auto, arrow, python).")
+
+    base_name = _safe_base_name(base_name)
+
+    def log(msg: str) -> None:
+        if on_log:
+            on_log(msg)
+
+    with input_path.open("r", newline="", encoding="utf-8-sig") as in_fp:
+        fieldnames = _normalize_fieldnames(next(csv.reader(in_fp), None))
+    indices = _rule_indices(fieldnames)
+    width = len(fieldnames)
+
+    if engine == "auto":
+        engine = "arrow" if select_backend("auto") == "arrow" else "python"
+    elif engine == "arrow":
+        try:
+            select_backend("arrow")
+        except CsvReaderError as exc:
+            raise PriorityRulesError(str(exc)) from exc
+
+    counts = dict.fromkeys(PRIORITIES, 0)
+    rows_read = 0
+
+    def python_batches() -> Iterator[list[list[str]]]:
+        nonlocal rows_read
+        with input_path.open("r", newline="", encoding="utf-8-sig") as in_fp:
+            rows = csv.reader(in_fp)
+            next(rows, None)
+            for batch in iter_csv_batches(rows, width):
+                rows_read += len(batch)
+                out = classify_rows(batch, indices)
+                for row in out:
+                    counts[row[2]] += 1
+                yield out
+
+    def arrow_batches():
+        import pyarrow.compute as pc  # type: ignore
+
+        nonlocal rows_read
+        batches, _ = open_arrow_batches(input_path, data_offset(input_path), width)
+        for batch in batches:
+            rows_read += batch.num_rows
+            out = classify_table(batch, indices)
+            for entry in pc.value_counts(out.column("locpriority")).to_pylist():
+                counts[entry["values"]] += entry["counts"]
+            yield out
+
+    def write(batches, encoder) -> ChunkWriter:  # noqa: ANN001
+        with ChunkWriter(
+            output_dir=out_dir,
+            base_name=base_name,
+            header=list(REQUIRED_COLUMNS),
+            encoder=encoder,
+            max_rows=max_rows,
+            max_parts=max_parts,
+            include_header=include_header,
+            plain_single_file=plain_single_file,
+            writers=writers,
+            on_log=on_log,
+        ) as writer:
+            writer.write_batches(batches)
+        return writer
+
+    try:
+        if engine == "arrow":
+            try:
+                writer = write(arrow_batches(), ArrowCsvEncoder())
+            except CsvReaderError as exc:
+                log(f"{exc} Retrying with the python rules engine.")
+                engine = "python"
+                counts = dict.fromkeys(PRIORITIES, 0)
+                rows_read = 0
+        if engine == "python":
+            writer = write(python_batches(), None)
+    except ChunkWriterError as exc:
+        raise PriorityRulesError(str(exc)) from exc
+
+    summary = ", ".join(f"{p}={n:,}" for p, n in counts.items())
+    log(f"Classified {writer.rows_written:,} of {rows_read:,} rows: {summary}")
+    return {
+        "files_written": writer.files_written,
+        "rows_written": writer.rows_written,
+        "paths": writer.result()["paths"],
+        "base_name": base_name,
+        "max_rows": max_rows,
+        "include_header": include_header,
+        "rows_read": rows_read,
+        "counts": counts,
+        "engine": engine,
+    }
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import time
+from typing import Callable
+
+
+class ProgressThrottle:
+    """Turn `(done, total)` updates into rate-limited whole-percent callbacks.
+
+    A callback fires only when the percentage has moved by at least
+    `min_delta` *and* `min_interval` seconds have passed since the last one,
+    so calling `update()` once per batch costs a division and a compare.
+    `finish()` always reports 100.
+    """
+
+    def __init__(
+        self,
+        on_progress: Callable[[int], None] | None,
+        *,
+        min_interval: float = 0.1,
+        min_delta: int = 1,
+    ) -> None:
+        self.on_progress = on_progress
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.last_pct = -1
+        self.last_time = 0.0
+
+    def _emit(self, pct: int) -> None:
+        self.last_pct = pct
+        self.last_time = time.monotonic()
+        self.on_progress(pct)
+
+    def start(self) -> None:
+        if self.on_progress:
+            self._emit(0)
+
+    def update(self, done: int, total: int | None) -> None:
+        if not self.on_progress or not total or total <= 0:
+            return
+        pct = min(99, done * 100 // total)
+        if pct - self.last_pct < self.min_delta:
+            return
+        if time.monotonic() - self.last_time < self.min_interval:
+            return
+        self._emit(pct)
+
+    def finish(self) -> None:
+        if self.on_progress and self.last_pct != 100:
+            self._emit(100)
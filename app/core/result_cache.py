@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+# Local cache of export query results.
+#
+# Entries are keyed by the whitespace-normalized SQL, the account and the
+# snapshot date (today, matching the queries' current_date()), so a cached
+# result is never reused on a later day. Each entry is a data file plus a
+# JSON meta file written last; an entry without meta is incomplete and
+# ignored. With pyarrow installed the data is an Arrow IPC file (zstd
+# compressed when available), otherwise gzip-compressed CSV. Entries older
+# than the TTL are dropped, and the least recently used ones are evicted
+# once the cache grows past `max_bytes`.
+
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence
+
+from app.core.async_query import query_digest
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_TTL_S = 24 * 3600
+_BATCH_ROWS = 10_000
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "LocPriority-BY" / "results"
+
+
+class CacheEntry:
+    def __init__(self, data_path: Path, meta: dict) -> None:
+        self.path = data_path
+        self.meta = meta
+        self.columns: list[str] = meta["columns"]
+        self.rows: int = meta["rows"]
+        self.format: str = meta["format"]
+
+    def batches(self) -> Iterator:
+        """Yield the cached result as Arrow record batches or lists of row tuples."""
+        if self.format == "arrow":
+            import pyarrow as pa  # type: ignore
+
+            with pa.memory_map(str(self.path)) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    if batch.num_rows:
+                        yield batch
+            return
+        with gzip.open(self.path, "rt", newline="", encoding="utf-8") as fp:
+            reader = csv.reader(fp)
+            while True:
+                batch = [tuple(row) for _, row in zip(range(_BATCH_ROWS), reader)]
+                if not batch:
+                    return
+                yield batch
+
+
+class _CacheWriter:
+    """Copies batches into a new cache entry as they stream past (see `ResultCache.writer`)."""
+
+    def __init__(self, cache: ResultCache, key: str, columns: Sequence[str], on_log: Callable[[str], None]) -> None:
+        self.cache = cache
+        self.key = key
+        self.columns = list(columns)
+        self.rows = 0
+        self.failed = False
+        self._log = on_log
+        self._format = "arrow" if cache.use_arrow else "csv.gz"
+        self._tmp = cache.root / f"{key}.{self._format}.tmp"
+        self._sink = None
+        self._schema = None
+
+    def _open(self) -> None:
+        self.cache.root.mkdir(parents=True, exist_ok=True)
+        if self._format == "arrow":
+            return  # opened on the first batch, once the schema is known
+        self._sink = io.TextIOWrapper(gzip.open(self._tmp, "wb", compresslevel=3), encoding="utf-8", newline="")
+        self._csv = csv.writer(self._sink)
+
+    def _write(self, batch) -> None:  # noqa: ANN001
+        if self._format != "arrow":
+            self._csv.writerows(batch)
+            return
+        import pyarrow as pa  # type: ignore
+
+        if isinstance(batch, (pa.Table, pa.RecordBatch)):
+            table = batch if isinstance(batch, pa.Table) else pa.Table.from_batches([batch])
+        else:
+            # Row tuples are stored as the strings the csv module would write.
+            table = pa.table([_string_array(pa, col) for col in zip(*batch)], names=self.columns)
+        if self._sink is None:
+            self._schema = table.schema
+            options = pa.ipc.IpcWriteOptions(compression=_ipc_compression())
+            self._sink = pa.ipc.new_file(str(self._tmp), self._schema, options=options)
+        elif table.schema != self._schema:
+            table = table.cast(self._schema)
+        self._sink.write_table(table)
+
+    def tee(self, batches: Iterable) -> Iterator:
+        """Yield `batches` unchanged, copying them into the entry; caching errors only disable the copy."""
+        try:
+            self._open()
+        except OSError as exc:
+            self._fail(exc)
+        for batch in batches:
+            if not self.failed:
+                try:
+                    self._write(batch)
+                    self.rows += len(batch)
+                except Exception as exc:  # noqa: BLE001
+                    self._fail(exc)
+            yield batch
+
+    def _fail(self, exc: Exception) -> None:
+        self._log(f"Result cache disabled for this run: {exc}")
+        self.failed = True
+        self.discard()
+
+    def _close_sink(self) -> None:
+        sink, self._sink = self._sink, None
+        if sink is not None:
+            sink.close()
+
+    def commit(self) -> None:
+        """Publish the entry (data first, then meta) and evict old entries."""
+        if self.failed:
+            return
+        try:
+            self._close_sink()
+            if not self._tmp.exists():  # an empty Arrow result never opened its file
+                return
+            data = self.cache.root / f"{self.key}.{self._format}"
+            os.replace(self._tmp, data)
+            meta = {"columns": self.columns, "rows": self.rows, "format": self._format, "created": time.time()}
+            tmp_meta = self.cache.root / f"{self.key}.json.tmp"
+            tmp_meta.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp_meta, self.cache.root / f"{self.key}.json")
+            self.cache.evict(keep=self.key)
+        except OSError as exc:
+            self._fail(exc)
+
+    def discard(self) -> None:
+        try:
+            self._close_sink()
+        except Exception:  # noqa: BLE001
+            pass
+        try:
+            self._tmp.unlink()
+        except OSError:
+            pass
+
+
+def _string_array(pa, values: Sequence):  # noqa: ANN001, ANN202
+    try:
+        return pa.array(values, pa.string())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def _ipc_compression() -> str | None:
+    import pyarrow as pa  # type: ignore
+
+    for codec in ("zstd", "lz4"):
+        if pa.Codec.is_available(codec):
+            return codec
+    return None
+
+
+class ResultCache:
+    def __init__(
+        self,
+        root: str | Path | None = None,
+        *,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_s: float = DEFAULT_TTL_S,
+        use_arrow: bool | None = None,
+    ) -> None:
+        self.root = Path(root) if root is not None else default_cache_dir()
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        if use_arrow is None:
+            from app.core.arrow_csv import pyarrow_available
+
+            use_arrow = pyarrow_available()
+        self.use_arrow = use_arrow
+
+    def key(self, query: str, *, account: str, snapshot_date: date | None = None) -> str:
+        day = (snapshot_date or date.today()).isoformat()
+        return hashlib.sha256(f"{query_digest(query)}|{account.upper()}|{day}".encode("utf-8")).hexdigest()[:32]
+
+    def _entries(self) -> list[tuple[Path, dict]]:
+        entries = []
+        for meta_path in self.root.glob("*.json"):
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            entries.append((meta_path, meta))
+        return entries
+
+    def _remove(self, key: str) -> None:
+        for path in self.root.glob(f"{key}.*"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def lookup(self, key: str) -> CacheEntry | None:
+        meta_path = self.root / f"{key}.json"
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        data_path = self.root / f"{key}.{meta.get('format')}"
+        expired = time.time() - float(meta.get("created", 0)) > self.ttl_s
+        if expired or not data_path.exists() or (meta.get("format") == "arrow" and not self.use_arrow):
+            if expired:
+                self._remove(key)
+            return None
+        os.utime(meta_path)  # LRU: mtime of the meta file is the last use
+        return CacheEntry(data_path, meta)
+
+    def writer(self, key: str, columns: Sequence[str], *, on_log: Callable[[str], None] | None = None) -> _CacheWriter:
+        return _CacheWriter(self, key, columns, on_log or (lambda msg: None))
+
+    def evict(self, *, keep: str | None = None) -> list[str]:
+        """Drop expired entries, then least recently used ones (other than `keep`) until the cache fits `max_bytes`."""
+        now = time.time()
+        live = []
+        removed = []
+        for meta_path, meta in self._entries():
+            key = meta_path.stem
+            if now - float(meta.get("created", 0)) > self.ttl_s:
+                self._remove(key)
+                removed.append(key)
+                continue
+            size = sum(p.stat().st_size for p in self.root.glob(f"{key}.*"))
+            live.append((meta_path.stat().st_mtime, key, size))
+        total = sum(size for _, _, size in live)
+        for _, key, size in sorted(live):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._remove(key)
+            removed.append(key)
+            total -= size
+        return removed
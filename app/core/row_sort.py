@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+# External sort of upload rows by (loc, item) for the chunk pipeline.
+#
+# Rows are collected into runs sized to a memory budget (the bytes per row
+# are estimated from the first batch). A full run is sorted and written to
+# a spill file; at the end the runs are merged k ways, a block per run at a time.
+# Input that fits in one run is sorted in memory and never touches the
+# disk. The sort is stable: rows with the same (loc, item) keep their input
+# order.
+#
+# Runs and merge blocks hold rows as tuples: a tuple of strings drops out of
+# cyclic GC tracking after its first collection, so the full collections
+# that a growing run triggers do not rescan millions of rows (csv.reader's
+# lists would stay tracked). They are also smaller than lists.
+
+import csv
+import sys
+import tempfile
+import time
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence
+
+from app.core.csv_encode import encode_rows
+
+SORT_MEMORY_MB = 256
+_SAMPLE_ROWS = 1000
+
+
+class RowSortError(RuntimeError):
+    pass
+
+
+def _row_bytes(batch: Sequence[Sequence]) -> int:
+    """Approximate memory a row holds in a run: the row tuple, its fields and the run's pointer to it."""
+    sample = batch[:_SAMPLE_ROWS]
+    total = sum(sys.getsizeof(tuple(row)) + sum(map(sys.getsizeof, row)) for row in sample)
+    return total // len(sample) + 8
+
+
+class LocItemSorter:
+    """Order a stream of row batches by (loc, item), spilling sorted runs past `memory_mb`."""
+
+    def __init__(
+        self,
+        loc_index: int,
+        item_index: int,
+        *,
+        memory_mb: int = SORT_MEMORY_MB,
+        spill_dir: str | Path | None = None,
+        batch_size: int = 10000,
+    ) -> None:
+        if memory_mb <= 0:
+            raise RowSortError("The sort memory budget must be a positive number of MB.")
+        self.loc_index = loc_index
+        self.item_index = item_index
+        self._getter = itemgetter(loc_index, item_index)
+        self._keys = (itemgetter(item_index), itemgetter(loc_index))
+        self.text_keys = False  # values are compared as text (see `_use_text_keys`)
+        self.memory_mb = memory_mb
+        self.spill_dir = spill_dir
+        self.batch_size = batch_size
+        self.rows = 0
+        self.run_rows: int | None = None  # rows per run, from the first batch
+        self.spilled_runs = 0
+        self.seconds = 0.0  # sorting, spilling and merging; not waiting on the input or the writer
+
+    def _use_text_keys(self) -> None:
+        # Compare values as a spill file holds them: str(), with None as "".
+        def text(index: int) -> Callable[[Sequence], str]:
+            return lambda row: "" if row[index] is None else str(row[index])
+
+        self._keys = (text(self.item_index), text(self.loc_index))
+        self.text_keys = True
+
+    def _sort(self, run: list) -> None:
+        # Two stable passes (item, then loc) beat one pass on (loc, item) tuple keys.
+        try:
+            for key in self._keys:
+                run.sort(key=key)
+        except TypeError:  # None among text keys
+            self._use_text_keys()
+            for key in self._keys:
+                run.sort(key=key)
+
+    def sort(self, batches: Iterable[Sequence[Sequence]]) -> Iterator[list]:
+        """Yield the rows of `batches` ordered by (loc, item), in batches of `batch_size`."""
+        run: list = []
+        runs: list[Path] = []
+        spill: tempfile.TemporaryDirectory | None = None
+        try:
+            for batch in batches:
+                if not batch:
+                    continue
+                t0 = time.perf_counter()
+                if self.run_rows is None:
+                    self.run_rows = max(1, self.memory_mb * 1024 * 1024 // _row_bytes(batch))
+                    if not all(isinstance(v, str) for v in self._getter(batch[0])):
+                        self._use_text_keys()  # spilled runs only hold text
+                run.extend(map(tuple, batch))
+                self.rows += len(batch)
+                if len(run) >= self.run_rows:
+                    if spill is None:
+                        try:
+                            spill = tempfile.TemporaryDirectory(prefix="locpriority-sort-", dir=self.spill_dir)
+                        except OSError as exc:
+                            raise RowSortError(f"Failed to create the sort spill folder: {exc}") from exc
+                    runs.append(self._write_run(Path(spill.name), run))
+                    run = []
+                self.seconds += time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            if runs:
+                if run:
+                    runs.append(self._write_run(Path(spill.name), run))
+                    run = []
+                self.seconds += time.perf_counter() - t0
+                yield from self._merge(runs)
+                return
+            self._sort(run)
+            self.seconds += time.perf_counter() - t0
+            for start in range(0, len(run), self.batch_size):
+                yield run[start:start + self.batch_size]
+        finally:
+            if spill is not None:
+                spill.cleanup()
+
+    def _write_run(self, spill_dir: Path, run: list) -> Path:
+        self._sort(run)
+        path = spill_dir / f"run-{self.spilled_runs:04d}.csv"
+        try:
+            with path.open("wb") as fp:
+                for start in range(0, len(run), self.batch_size):
+                    fp.write(encode_rows(run[start:start + self.batch_size]))
+        except OSError as exc:
+            raise RowSortError(f"Failed to spill sorted rows to disk: {exc}") from exc
+        self.spilled_runs += 1
+        return path
+
+    def _merge(self, runs: list[Path]) -> Iterator[list]:
+        """k-way merge of the spilled runs, a block of rows per run at a time.
+
+        Every round takes the rows below the smallest last key of the loaded
+        blocks (no later row of any run can sort before them) and sorts them
+        in C; a row-at-a-time heap merge spends most of its time in Python.
+        """
+        files = [p.open("r", newline="", encoding="utf-8", buffering=1024 * 1024) for p in runs]
+        try:
+            t0 = time.perf_counter()
+            readers = [csv.reader(fp) for fp in files]
+            block_rows = max(1000, (self.run_rows or 0) // len(runs))
+            # Spilled fields are text, so a (loc, item) getter orders them like the sort keys.
+            getter = self._getter
+            blocks: list[list | None] = [None] * len(runs)
+            keys: list[list] = [[] for _ in runs]
+            pos = [0] * len(runs)
+
+            def load(i: int) -> None:
+                rows = list(map(tuple, islice(readers[i], block_rows)))
+                blocks[i] = rows or None
+                keys[i] = list(map(getter, rows))
+                pos[i] = 0
+
+            for i in range(len(runs)):
+                load(i)
+            while True:
+                active = [i for i, rows in enumerate(blocks) if rows is not None]
+                if not active:
+                    break
+                bound = min(keys[i][-1] for i in active)
+                out = []
+                for i in active:
+                    end = bisect_left(keys[i], bound, pos[i])
+                    out.extend(blocks[i][pos[i]:end])
+                    pos[i] = end
+                if out:
+                    self._sort(out)  # stable: ties keep run order, i.e. input order
+                else:
+                    # Only rows equal to `bound` are left at the block heads: take them run by run.
+                    for i in active:
+                        while blocks[i] is not None and keys[i][pos[i]] == bound:
+                            end = bisect_right(keys[i], bound, pos[i])
+                            out.extend(blocks[i][pos[i]:end])
+                            pos[i] = end
+                            if end == len(blocks[i]):
+                                load(i)
+                for i in active:
+                    if blocks[i] is not None and pos[i] == len(blocks[i]):
+                        load(i)
+                self.seconds += time.perf_counter() - t0
+                for start in range(0, len(out), self.batch_size):
+                    yield out[start:start + self.batch_size]
+                t0 = time.perf_counter()
+        finally:
+            for fp in files:
+                fp.close()
+
+    def result(self) -> dict:
+        return {
+            "rows": self.rows,
+            "memory_mb": self.memory_mb,
+            "run_rows": self.run_rows,
+            "spilled_runs": self.spilled_runs,
+            "seconds": round(self.seconds, 3),
+        }
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+# Offline week-over-week LOCPRIORITY diff from two snapshot CSVs.
+#
+# Mirrors the `DEFAULT_QUERY` join: today's (item, loc, locpriority) rows are
+# kept when the pair also has a different locpriority in the latest two
+# snapshots (previous or current). Pairs that are new or gone are not changes.
+# Unlike the query, it does not override today's locpriority to '0' for
+# 3xxx locs whose skuextract udc_source_1 is a VMI code (two letters, two
+# digits): the snapshots carry no udc_source_1. Such pairs are compared on
+# their uploaded locpriority, so the output can differ from the export for
+# them; apply the override before writing the current snapshot if needed.
+#
+# Each snapshot is reduced to a plain dict of (item, loc) -> priority bitmask
+# (a small int, bit n set for locpriority n): about 170 bytes per pair with
+# the key tuple, which `max_index_rows` bounds. Loc codes are interned: a few
+# thousand distinct values repeat across millions of rows.
+# Snapshots that do not fit `max_index_rows` are sorted into on-disk runs and
+# merge-joined instead.
+
+import csv
+import heapq
+import sys
+import tempfile
+from itertools import groupby, islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from app.core.chunk_writer import MAX_ROWS_PER_FILE, ChunkWriter, ChunkWriterError
+from app.core.csv_chunker import (  # noqa: PLC2701
+    REQUIRED_COLUMNS,
+    CsvChunkerError,
+    _normalize_fieldnames,
+    _required_column_indices,
+    _safe_base_name,
+    _validate_max_rows,
+    _validate_required_columns,
+)
+
+
+PRIORITIES = ("0", "1", "2", "3", "4")
+MAX_INDEX_ROWS = 5_000_000
+RUN_ROWS = 1_000_000
+
+_CODES = {p: i for i, p in enumerate(PRIORITIES)}
+
+
+class SnapshotDiffError(RuntimeError):
+    pass
+
+
+def _read_snapshot(path: Path) -> Iterator[tuple[str, str, int]]:
+    """Yield `(item, loc, priority code)` for each data row of a snapshot CSV."""
+    with path.open("r", newline="", encoding="utf-8-sig") as fp:
+        reader = csv.reader(fp)
+        fieldnames = _normalize_fieldnames(next(reader, None))
+        try:
+            _validate_required_columns(fieldnames)
+        except CsvChunkerError as exc:
+            raise SnapshotDiffError(f"{path.name}: {exc}") from exc
+        i_item, i_loc, i_priority = _required_column_indices(fieldnames)
+        width = max(i_item, i_loc, i_priority) + 1
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            code = _CODES.get(row[i_priority])
+            if code is None:
+                raise SnapshotDiffError(
+                    f"{path.name} line {reader.line_num}: locpriority {row[i_priority]!r} is not 0-4."
+                )
+            yield row[i_item], row[i_loc], code
+
+
+def _build_index(rows: Iterable[tuple[str, str, int]], limit: int) -> dict | None:
+    """(item, loc) -> priority bitmask, or None once more than `limit` keys are seen."""
+    intern = sys.intern
+    index: dict[tuple[str, str], int] = {}
+    get = index.get
+    for item, loc, code in rows:
+        key = (item, intern(loc))
+        index[key] = get(key, 0) | (1 << code)
+        if len(index) > limit:
+            return None
+    return index
+
+
+def _changed(key: tuple[str, str], mask: int, seen: int) -> Iterator[list[str]]:
+    """Today's rows for one pair whose priority differs from another one seen for it."""
+    for code, priority in enumerate(PRIORITIES):
+        if mask >> code & 1 and seen & ~(1 << code):
+            yield [key[0], key[1], priority]
+
+
+def _diff_in_memory(previous: dict, current: dict) -> Iterator[list[str]]:
+    get = previous.get
+    for key, mask in current.items():
+        yield from _changed(key, mask, mask | get(key, 0))
+
+
+def _sorted_runs(rows: Iterable[tuple[str, str, int]], spill_dir: Path, prefix: str, run_rows: int) -> list[Path]:
+    runs = []
+    rows = iter(rows)
+    while True:
+        run = sorted(islice(rows, run_rows))
+        if not run:
+            return runs
+        path = spill_dir / f"{prefix}-{len(runs):04d}.csv"
+        with path.open("w", newline="", encoding="utf-8") as fp:
+            csv.writer(fp).writerows(run)
+        runs.append(path)
+
+
+def _merge_runs(runs: list[Path]) -> Iterator[tuple[tuple[str, str], int]]:
+    """Merge sorted runs into `((item, loc), bitmask)` in key order."""
+    files = [p.open("r", newline="", encoding="utf-8") for p in runs]
+    try:
+        merged = heapq.merge(*(csv.reader(fp) for fp in files))
+        for key, group in groupby(merged, key=itemgetter(0, 1)):
+            mask = 0
+            for row in group:
+                mask |= 1 << int(row[2])
+            yield key, mask
+    finally:
+        for fp in files:
+            fp.close()
+
+
+def _diff_sort_merge(previous: Iterator, current: Iterator) -> Iterator[list[str]]:
+    prev = next(previous, None)
+    for key, mask in current:
+        while prev is not None and prev[0] < key:
+            prev = next(previous, None)
+        seen = mask | (prev[1] if prev is not None and prev[0] == key else 0)
+        yield from _changed(key, mask, seen)
+
+
+def iter_changes(
+    *,
+    previous_csv: str,
+    current_csv: str,
+    max_index_rows: int = MAX_INDEX_ROWS,
+    run_rows: int = RUN_ROWS,
+    spill_dir: str | None = None,
+    on_log: Callable[[str], None] | None = None,
+) -> Iterator[list[str]]:
+    """Yield changed `[item, loc, locpriority]` rows of `current_csv`.
+
+    In memory, rows come out in first-seen order of the current snapshot.
+    When the two indexes would exceed `max_index_rows` keys, both snapshots
+    are sorted into runs of `run_rows` under `spill_dir` (default: the system
+    temp folder) and rows come out sorted by (item, loc).
+    """
+
+    def log(msg: str) -> None:
+        if on_log:
+            on_log(msg)
+
+    prev_path = Path(previous_csv)
+    cur_path = Path(current_csv)
+    for path in (prev_path, cur_path):
+        if not path.exists():
+            raise SnapshotDiffError(f"Snapshot not found: {path}")
+
+    previous = _build_index(_read_snapshot(prev_path), max_index_rows)
+    current = None
+    if previous is not None:
+        current = _build_index(_read_snapshot(cur_path), max_index_rows - len(previous))
+    if current is not None:
+        log(f"Indexed {len(previous):,} previous and {len(current):,} current (item, loc) pairs.")
+        yield from _diff_in_memory(previous, current)
+        return
+
+    previous = current = None
+    log(f"Snapshots exceed {max_index_rows:,} pairs; sorting to disk for a merge join…")
+    with tempfile.TemporaryDirectory(prefix="locpriority-diff-", dir=spill_dir) as td:
+        prev_runs = _sorted_runs(_read_snapshot(prev_path), Path(td), "previous", run_rows)
+        cur_runs = _sorted_runs(_read_snapshot(cur_path), Path(td), "current", run_rows)
+        log(f"Merging {len(prev_runs)} previous and {len(cur_runs)} current sorted run(s)…")
+        yield from _diff_sort_merge(_merge_runs(prev_runs), _merge_runs(cur_runs))
+
+
+def diff_snapshots(
+    *,
+    previous_csv: str,
+    current_csv: str,
+    output_dir: str,
+    base_name: str,
+    max_rows: int = MAX_ROWS_PER_FILE,
+    max_parts: int | None = None,
+    include_header: bool = True,
+    plain_single_file: bool = True,
+    writers: int = 2,
+    max_index_rows: int = MAX_INDEX_ROWS,
+    spill_dir: str | None = None,
+    on_log: Callable[[str], None] | None = None,
+) -> dict:
+    """Write the week-over-week changes between two snapshots as upload files.
+
+    Output naming and options match `chunk_csv`; the header is
+    item, loc, locpriority like the `DEFAULT_QUERY` result. The query's
+    VMI override to '0' is not applied (see the module comment).
+    """
+
+    try:
+        _validate_max_rows(max_rows)
+    except CsvChunkerError as exc:
+        raise SnapshotDiffError(str(exc)) from exc
+
+    out_dir = Path(output_dir)
+    if not out_dir.exists():
+        raise SnapshotDiffError(f"Output folder not found: {output_dir}")
+
+    base_name = _safe_base_name(base_name)
+    changes = iter_changes(
+        previous_csv=previous_csv,
+        current_csv=current_csv,
+        max_index_rows=max_index_rows,
+        spill_dir=spill_dir,
+        on_log=on_log,
+    )
+
+    def batches():
+        while True:
+            batch = list(islice(changes, 10000))
+            if not batch:
+                return
+            yield batch
+
+    try:
+        with ChunkWriter(
+            output_dir=out_dir,
+            base_name=base_name,
+            header=list(REQUIRED_COLUMNS),
+            max_rows=max_rows,
+            max_parts=max_parts,
+            include_header=include_header,
+            plain_single_file=plain_single_file,
+            writers=writers,
+            on_log=on_log,
+        ) as writer:
+            writer.write_batches(batches())
+    except ChunkWriterError as exc:
+        raise SnapshotDiffError(str(exc)) from exc
+
+    return {
+        "files_written": writer.files_written,
+        "rows_written": writer.rows_written,
+        "paths": writer.result()["paths"],
+        "base_name": base_name,
+        "max_rows": max_rows,
+        "include_header": include_header,
+    }
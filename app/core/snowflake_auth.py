@@ -7,17 +7,28 @@ from dataclasses import dataclass
 class SnowflakeAuthConfig:
     account: str = "HDSUPPLY-DATA"
     authenticator: str = "externalbrowser"
+    # Let the connector keep the SSO ID token in the OS credential store, so a
+    # reconnect does not open the browser again while the token is valid.
+    cache_sso_token: bool = True
 
 
 class SnowflakeAuthError(RuntimeError):
     pass
 
 
-def authenticate(*, email: str, insecure_mode: bool, config: SnowflakeAuthConfig | None = None):
+def authenticate(
+    *,
+    email: str,
+    insecure_mode: bool,
+    config: SnowflakeAuthConfig | None = None,
+    connector=None,  # noqa: ANN001
+):
     """Authenticate to Snowflake via SSO external browser.
 
     Returns the live connection so it can be reused for subsequent operations
     (view activation, queries) without requiring additional SSO sign-ins.
+    `connector` replaces the `snowflake.connector` module (anything with a
+    compatible `connect(**params)`, e.g. for offline tests).
     """
 
     email = (email or "").strip()
@@ -26,19 +37,25 @@ def authenticate(*, email: str, insecure_mode: bool, config: SnowflakeAuthConfig
 
     cfg = config or SnowflakeAuthConfig()
 
-    try:
-        import snowflake.connector as sc  # type: ignore
-    except Exception as exc:  # noqa: BLE001
-        raise SnowflakeAuthError(
-            "Snowflake connector is not available. Install dependencies or use the packaged EXE."
-        ) from exc
-
+    sc = connector
+    if sc is None:
+        try:
+            import snowflake.connector as sc  # type: ignore
+        except Exception as exc:  # noqa: BLE001
+            raise SnowflakeAuthError(
+                "Snowflake connector is not available. Install dependencies or use the packaged EXE."
+            ) from exc
+
+    params = {}
+    if cfg.cache_sso_token and cfg.authenticator == "externalbrowser":
+        params["client_store_temporary_credential"] = True
     try:
         con = sc.connect(
             user=email,
             account=cfg.account,
             authenticator=cfg.authenticator,
             insecure_mode=bool(insecure_mode),
+            **params,
         )
     except Exception as exc:  # noqa: BLE001
         raise SnowflakeAuthError(str(exc)) from exc
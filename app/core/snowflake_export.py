@@ -1,10 +1,29 @@
 from __future__ import annotations
 
-import csv
+import threading
+import time
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Callable
-
-from app.core.csv_chunker import REQUIRED_COLUMNS, CsvChunkerError, _safe_base_name  # noqa: PLC2701
+from typing import Callable, Iterator
+
+from app.core.arrow_csv import ArrowCsvEncoder, iter_arrow_batches
+from app.core.async_query import AsyncQueryError, clear_state, run_async_query, state_path
+from app.core.chunk_writer import MAX_ROWS_PER_FILE, ChunkWriter, ChunkWriterError, CsvRowEncoder, make_projection
+from app.core.csv_chunker import (  # noqa: PLC2701
+    REQUIRED_COLUMNS,
+    CsvChunkerError,
+    _safe_base_name,
+    _validate_codec,
+    _validate_max_rows,
+)
+from app.core.fetch_sizing import DEFAULT_FETCH_SIZE, AdaptiveFetchSize, estimate_batch_bytes
+from app.core.loc_packing import LocPacker, LocPackingError
+from app.core.output_codec import DEFAULT_LEVEL
+from app.core.prefetch import BatchPrefetcher
+from app.core.progress import ProgressThrottle
+from app.core.result_cache import ResultCache
+from app.core.row_sort import SORT_MEMORY_MB, LocItemSorter, RowSortError
+from app.core.timings import RunTimer, trace_path, write_trace
 
 
 DEFAULT_QUERY = """\
@@ -55,6 +74,77 @@ class SnowflakeExportError(RuntimeError):
     pass
 
 
+def _fetch_batches(cur, sizer: AdaptiveFetchSize | None = None) -> Iterator[list]:  # noqa: ANN001
+    while True:
+        t0 = time.perf_counter()
+        batch = cur.fetchmany(cur.arraysize)
+        if not batch:
+            return
+        if sizer is not None:
+            cur.arraysize = sizer.observe(len(batch), time.perf_counter() - t0, estimate_batch_bytes(batch))
+        yield batch
+
+
+def _output_columns(columns: list[str]) -> tuple[list[str], list[int]]:
+    """Return the output header (item, loc, locpriority first, then the rest) and its source indices."""
+    # Normalize for validation
+    normalized = {c.lower(): c for c in columns}
+    missing = [c for c in REQUIRED_COLUMNS if c not in normalized]
+    if missing:
+        raise SnowflakeExportError(
+            "Query result is missing required column(s): "
+            + ", ".join(missing)
+            + ". Required: item, loc, locpriority."
+        )
+
+    # Force output header order to match required columns first, then the rest.
+    # Resolved once into a column index projection; last duplicate name wins.
+    index_of = {c: i for i, c in enumerate(columns)}
+    ordered_cols = [normalized["item"], normalized["loc"], normalized["locpriority"]]
+    for c in columns:
+        if c not in ordered_cols:
+            ordered_cols.append(c)
+    return ordered_cols, [index_of[c] for c in ordered_cols]
+
+
+def _count_rows(con, query: str, log: Callable[[str], None]) -> int | None:  # noqa: ANN001
+    """Row count of `query` via `select count(*)`, for cursors that report no rowcount."""
+    cur = None
+    try:
+        cur = con.cursor()
+        cur.execute(f"select count(*) from (\n{query.rstrip().rstrip(';')}\n)")
+        return int(cur.fetchone()[0])
+    except Exception as exc:  # noqa: BLE001
+        log(f"Could not count the result rows up front: {exc}")
+        return None
+    finally:
+        if cur is not None:
+            try:
+                cur.close()
+            except Exception:
+                pass
+
+
+def _table_rows(tables) -> Iterator[list[tuple]]:  # noqa: ANN001
+    """Row batches from Arrow tables, for stages that need rows."""
+    for table in tables:
+        yield list(zip(*(col.to_pylist() for col in table.columns)))
+
+
+def _open_arrow_batches(cur, indices: list[int], log: Callable[[str], None]):  # noqa: ANN001
+    """Return `(batch iterator, encoder)` for an Arrow fetch, or None to fall back to rows."""
+    try:
+        encoder = ArrowCsvEncoder(indices)
+    except ImportError:
+        log("pyarrow is not installed; fetching rows instead of Arrow batches.")
+        return None
+    if not hasattr(cur, "fetch_arrow_batches"):
+        log("Cursor does not support Arrow batches; fetching rows instead.")
+        return None
+    log("Fetching Arrow batches…")
+    return iter_arrow_batches(cur), encoder
+
+
 def activate_view(
     *,
     email: str = "",
@@ -114,18 +204,94 @@ def export_query_to_chunked_csv(
     query: str,
     output_dir: str,
     base_name: str,
-    max_rows: int = 60000,
+    max_rows: int = MAX_ROWS_PER_FILE,
+    max_parts: int | None = None,
     include_header: bool = True,
+    plain_single_file: bool = True,
+    writers: int = 2,
+    arrow: bool = False,
+    prefetch: int = 4,
+    fetch_size: int | None = None,
+    async_query: bool = False,
+    query_state_dir: str | None = None,
+    cancel: threading.Event | None = None,
+    cache: bool = False,
+    cache_dir: str | None = None,
+    refresh_cache: bool = False,
+    sort: bool = False,
+    sort_memory_mb: int | None = None,
+    pack: bool = False,
+    codec: str = "none",
+    compress_level: int = DEFAULT_LEVEL,
     insecure_mode: bool = True,
     account: str = "HDSUPPLY-DATA",
     authenticator: str = "externalbrowser",
     connection=None,
+    on_progress: Callable[[int], None] | None = None,
+    trace: bool = False,
     on_log: Callable[[str], None] | None = None,
 ) -> dict:
     """Run a Snowflake query and stream-write chunked CSV files.
 
     This avoids client-side export limits by fetching all rows via the connector.
     Each output file contains at most `max_rows` *data* rows (header not counted).
+    Output naming and the `max_parts` / `writers` / `codec` options match
+    `chunk_csv`.
+
+    With `arrow=True`, results are fetched as Arrow batches and written with
+    Arrow's vectorized CSV writer (falls back to row fetches when pyarrow or
+    the connector's Arrow support is unavailable).
+
+    With `prefetch > 0`, a fetch thread keeps up to `prefetch` batches queued
+    while the calling thread encodes and writes the parts, so network waits
+    overlap with CSV encoding and disk writes. `prefetch=0` fetches on the
+    calling thread and hands parts to `writers` pool threads instead (a
+    pool behind the fetch thread only adds GIL hand-offs).
+
+    Row fetches start with a 1,000-row probe (`MIN_FETCH_SIZE`) that
+    measures bytes per row, then move to up to 10,000 rows per `fetchmany`;
+    by default the size then adapts to the measured rows/s within a
+    per-batch memory and latency budget (see `AdaptiveFetchSize`), and the
+    result's `fetch_sizing` lists the sizes chosen. A `fetch_size` fixes it
+    instead (still reported).
+
+    With `async_query=True`, the query is submitted asynchronously and its
+    ID saved until the files are written, in a state file outside
+    `output_dir` (see `default_state_dir`; `query_state_dir` overrides it). Re-running the same SQL after an interruption (e.g. the app was
+    closed) re-attaches to that query's result instead of running it again,
+    as long as the account, role and snapshot date (today) are unchanged.
+    Waiting for the query gives up after `WAIT_TIMEOUT_S`, or as soon as
+    `cancel` is set; the saved ID lets the next run re-attach.
+
+    With `cache=True`, results are kept in a local cache (see `ResultCache`;
+    `cache_dir` overrides its location) keyed by the normalized SQL, the
+    account and today's date. A hit writes the parts from the cache without
+    connecting to Snowflake; the result's `cache` is "hit" or "miss".
+    `refresh_cache=True` skips the lookup (e.g. the table was reloaded
+    since) and replaces the entry with the fresh result ("refresh").
+
+    With `sort=True`, rows are ordered by (loc, item) before they are
+    written, spilling to the output folder past `sort_memory_mb` (see
+    `LocItemSorter`). Sorting needs row batches, so it fetches rows even
+    with `arrow=True`.
+
+    With `pack=True`, rows are sorted the same way and whole locs are packed
+    into the parts (see `LocPacker`), so no loc straddles two files unless
+    it alone holds more than `max_rows` rows; the result's `packing` reports
+    how full each part is.
+
+    The cursor's `rowcount` fixes the file naming and part count before
+    anything is written, and a result over `max_parts` fails before it is
+    fetched. Where the connector reports no rowcount and `max_parts` is
+    given, a `select count(*)` over the query stands in for it.
+
+    `on_progress` gets whole percentages of rows fetched against the
+    cursor's `rowcount` (rate-limited like `chunk_csv`).
+
+    The result's `timings` holds seconds per phase (connect, execute,
+    first_batch, fetch, write; with prefetch, "fetch" is time spent waiting
+    on the fetch thread), fetch batch sizes and per-part rows/s and
+    MB/s; `trace=True` also writes them to <base_name>.trace.json.
     """
 
     email = (email or "").strip()
@@ -136,12 +302,16 @@ def export_query_to_chunked_csv(
     if not query:
         raise SnowflakeExportError("Query is empty.")
 
-    if max_rows != 60000:
-        raise SnowflakeExportError("This tool enforces 60,000 rows max per file.")
+    try:
+        _validate_max_rows(max_rows)
+        _validate_codec(codec, compress_level)
+    except CsvChunkerError as exc:
+        raise SnowflakeExportError(str(exc)) from exc
 
-    # Interpretation: 60,000 is the maximum number of DATA rows per file.
-    # Header (when enabled) does not count toward the limit.
-    max_data_rows = 60000
+    if fetch_size is not None and fetch_size <= 0:
+        raise SnowflakeExportError("fetch_size must be a positive number.")
+    if sort_memory_mb is not None and sort_memory_mb <= 0:
+        raise SnowflakeExportError("The sort memory budget must be a positive number of MB.")
 
     out_dir = Path(output_dir)
     if not out_dir.exists():
@@ -153,139 +323,224 @@ def export_query_to_chunked_csv(
         if on_log:
             on_log(msg)
 
+    timer = RunTimer()
+
+    def write_parts(batches, encoder, header, total_rows, depth, sorter=None):  # noqa: ANN001, ANN202
+        # `total_rows` fixes the part layout up front (see `ChunkWriter`) and drives progress.
+        progress = ProgressThrottle(on_progress)
+
+        def counted(batches):  # noqa: ANN001, ANN202
+            fetched = 0
+            for batch in batches:
+                fetched += len(batch)
+                progress.update(fetched, total_rows)
+                yield batch
+
+        progress.start()
+        fetcher = BatchPrefetcher(batches, depth=depth, name="snowflake-fetch") if depth > 0 else None
+        if fetcher is not None:
+            batches = fetcher
+        # The writer first: its max_parts check must fail before the fetch thread starts pulling rows.
+        with timer.phase("write"), ChunkWriter(
+            output_dir=out_dir,
+            base_name=base_name,
+            header=header,
+            encoder=encoder,
+            max_rows=max_rows,
+            max_parts=max_parts,
+            include_header=include_header,
+            plain_single_file=plain_single_file,
+            writers=0 if fetcher is not None else writers,
+            total_rows=total_rows,
+            codec=codec,
+            compress_level=compress_level,
+            on_log=on_log,
+        ) as writer, fetcher or nullcontext():
+            batches = counted(timer.timed_batches(batches, "fetch", first_phase="first_batch"))
+            if isinstance(sorter, LocPacker):
+                batches = sorter.pack(batches, writer.end_part)
+            elif sorter is not None:
+                batches = sorter.sort(batches)
+            writer.write_batches(batches)
+        progress.finish()
+        # The write loop includes waiting on the fetch (and the sort); report only the writer's share.
+        for name in ("first_batch", "fetch"):
+            timer.add("write", -timer.phases.get(name, 0.0))
+        packer = sorter if isinstance(sorter, LocPacker) else None
+        if packer is not None:
+            sorter = packer.sorter
+            timer.add("pack", packer.seconds)
+            timer.add("write", -packer.seconds)
+        if sorter is not None:
+            timer.add("sort", sorter.seconds)
+            timer.add("write", -sorter.seconds)
+            stats = sorter.result()
+            log(f"Sorted {stats['rows']:,} rows by loc, item ({stats['spilled_runs']} run(s) spilled to disk).")
+        if packer is not None:
+            log(packer.summary())
+        return writer
+
+    def make_sorter(indices):  # noqa: ANN001, ANN202
+        # `indices` from `_output_columns`: item, loc, locpriority first.
+        memory_mb = sort_memory_mb or SORT_MEMORY_MB
+        if pack:
+            return LocPacker(
+                indices[1], indices[0], max_rows=max_rows, max_parts=max_parts, memory_mb=memory_mb, spill_dir=out_dir
+            )
+        if sort:
+            return LocItemSorter(indices[1], indices[0], memory_mb=memory_mb, spill_dir=out_dir)
+        return None
+
+    def sort_details(sorter) -> dict:  # noqa: ANN001
+        if isinstance(sorter, LocPacker):
+            return {"sort": sorter.sorter.result(), "packing": sorter.result()}
+        return {"sort": sorter.result() if sorter is not None else None, "packing": None}
+
+    def finish(writer: ChunkWriter, **details) -> dict:  # noqa: ANN003
+        result = {
+            "files_written": writer.files_written,
+            "rows_written": writer.rows_written,
+            "paths": writer.result()["paths"],
+            "base_name": base_name,
+            "max_rows": max_rows,
+            "include_header": include_header,
+            "codec": codec,
+            **details,
+            "timings": timer.result(writer.part_stats()),
+        }
+        if trace:
+            path = trace_path(out_dir, base_name)
+            write_trace(path, {"command": "export", "query": query, **result})
+            log(f"Trace written: {path.name}")
+        return result
+
+    cache_store = ResultCache(cache_dir) if cache else None
+    cache_key = cache_store.key(query, account=account) if cache_store is not None else None
+    cache_writer = None
     owns_connection = connection is None
     con = connection
     cur = None
     try:
+        entry = cache_store.lookup(cache_key) if cache_store is not None and not refresh_cache else None
+        if entry is not None:
+            cached_at = time.strftime("%H:%M", time.localtime(float(entry.meta.get("created", 0))))
+            log(
+                f"Result cache hit: using {entry.rows:,} rows cached today at {cached_at}. Snowflake was NOT "
+                "queried; changes made since then are not included."
+            )
+            ordered_cols, indices = _output_columns(entry.columns)
+            sorter = make_sorter(indices)
+            batches = entry.batches()
+            if entry.format == "arrow" and sorter is None:
+                encoder = ArrowCsvEncoder(indices)
+            else:
+                if entry.format == "arrow":
+                    batches = _table_rows(batches)
+                encoder = CsvRowEncoder(make_projection(indices, len(entry.columns)))
+            writer = write_parts(batches, encoder, ordered_cols, entry.rows, 0, sorter)
+            return finish(
+                writer,
+                fetch="cache",
+                fetch_sizing=None,
+                query_id=None,
+                resumed=False,
+                cache="hit",
+                **sort_details(sorter),
+            )
+        if cache_store is not None and refresh_cache:
+            log("Refreshing the result cache; querying Snowflake.")
+        elif cache_store is not None:
+            log("Result cache miss; querying Snowflake.")
+
         if con is None:
             try:
                 import snowflake.connector as sc  # type: ignore
             except Exception as exc:  # noqa: BLE001
                 raise SnowflakeExportError("Snowflake connector is not available.") from exc
             log("Connecting to Snowflake (external browser SSO)…")
-            con = sc.connect(
-                user=email,
-                account=account,
-                authenticator=authenticator,
-                insecure_mode=bool(insecure_mode),
-            )
+            with timer.phase("connect"):
+                con = sc.connect(
+                    user=email,
+                    account=account,
+                    authenticator=authenticator,
+                    insecure_mode=bool(insecure_mode),
+                )
         cur = con.cursor()
 
-        log("Running query…")
-        cur.execute(query)
+        query_state = state_path(out_dir, base_name, query_state_dir) if async_query else None
+        query_id = None
+        resumed = False
+        with timer.phase("execute"):
+            if query_state is not None:
+                query_id, resumed = run_async_query(
+                    con, cur, query, query_state, account=account, cancel=cancel, on_log=on_log
+                )
+            else:
+                log("Running query…")
+                cur.execute(query)
 
         if not cur.description:
             raise SnowflakeExportError("Query returned no columns.")
 
         columns = [d[0] for d in cur.description]
-        # Normalize for validation
-        normalized = {c.lower(): c for c in columns}
-        missing = [c for c in REQUIRED_COLUMNS if c not in normalized]
-        if missing:
-            raise SnowflakeExportError(
-                "Query result is missing required column(s): "
-                + ", ".join(missing)
-                + ". Required: item, loc, locpriority."
-            )
-
-        # Force output header order to match required columns first, then the rest
-        ordered_cols = [normalized["item"], normalized["loc"], normalized["locpriority"]]
-        for c in columns:
-            if c not in ordered_cols:
-                ordered_cols.append(c)
-
-        def first_path() -> Path:
-            return out_dir / f"{base_name}.csv"
-
-        def part_path(part_index: int) -> Path:
-            return out_dir / f"{base_name}_{part_index:03d}.csv"
-
-        files_written = 0
-        rows_written = 0
-        rows_in_part = 0
-
-        out_fp = None
-        writer = None
-
-        def open_first() -> Path:
-            nonlocal out_fp, writer, files_written, rows_in_part
-            p = first_path()
-            out_fp = p.open("w", newline="", encoding="utf-8")
-            writer = csv.writer(out_fp)
-            files_written = 1
-            rows_in_part = 0
-            if include_header:
-                writer.writerow(ordered_cols)
-            log(f"Writing: {p.name}")
-            return p
-
-        def rollover_to_second(first_file: Path) -> None:
-            nonlocal out_fp, writer, files_written, rows_in_part
-            if out_fp:
-                out_fp.close()
-
-            first_renamed = part_path(1)
-            try:
-                first_file.replace(first_renamed)
-            except OSError as exc:
-                raise SnowflakeExportError(f"Failed to rename output file: {exc}") from exc
-
-            p = part_path(2)
-            out_fp = p.open("w", newline="", encoding="utf-8")
-            writer = csv.writer(out_fp)
-            files_written = 2
-            rows_in_part = 0
-            if include_header:
-                writer.writerow(ordered_cols)
-            log(f"Writing: {p.name}")
-
-        first_file = open_first()
-
-        # Stream rows in batches
-        cur.arraysize = 10000
-        while True:
-            batch = cur.fetchmany(cur.arraysize)
-            if not batch:
-                break
-
-            for row in batch:
-                if rows_in_part >= max_data_rows:
-                    if files_written == 1:
-                        rollover_to_second(first_file)
-                    else:
-                        raise SnowflakeExportError(
-                            "Result exceeds 120,000 rows. This tool only outputs 1 file (<=60,000) "
-                            "or 2 files (<=120,000 total)."
-                        )
-
-                # Row is a tuple in column order `columns`.
-                row_map = dict(zip(columns, row))
-                # `writer` is initialized by open_first() and may be re-initialized by rollover.
-                writer.writerow([row_map.get(c) for c in ordered_cols])
-                rows_in_part += 1
-                rows_written += 1
-
-        # If there were zero rows, remove the empty first file
-        if rows_written == 0:
-            first = first_path()
-            try:
-                first.unlink(missing_ok=True)  # py3.8+ supports missing_ok
-            except TypeError:
-                if first.exists():
-                    first.unlink()
-            files_written = 0
-
-        return {
-            "files_written": files_written,
-            "rows_written": rows_written,
-            "base_name": base_name,
-            "max_rows": max_rows,
-            "include_header": include_header,
-        }
-
-    except CsvChunkerError as exc:
+        ordered_cols, indices = _output_columns(columns)
+        sorter = make_sorter(indices)
+        if arrow and sorter is not None:
+            step = "Packing" if pack else "Sorting"
+            log(f"{step} needs row batches; fetching rows instead of Arrow batches.")
+
+        sizer = None
+        cur.arraysize = fetch_size or DEFAULT_FETCH_SIZE
+        arrow_fetch = _open_arrow_batches(cur, indices, log) if arrow and sorter is None else None
+        if arrow_fetch is not None:
+            fetch_mode = "arrow"
+            batches, encoder = arrow_fetch
+        else:
+            fetch_mode = "rows"
+            encoder = CsvRowEncoder(make_projection(indices, len(columns)))
+            if fetch_size is None:
+                sizer = AdaptiveFetchSize(DEFAULT_FETCH_SIZE)
+            else:
+                sizer = AdaptiveFetchSize(fetch_size, min_size=fetch_size, max_size=fetch_size)
+            cur.arraysize = sizer.size
+            # Stream rows in batches
+            batches = _fetch_batches(cur, sizer)
+
+        total_rows = getattr(cur, "rowcount", None)
+        if not isinstance(total_rows, int) or total_rows < 0:
+            total_rows = None
+            if max_parts is not None:
+                # Fail before fetching anything when the result cannot fit.
+                with timer.phase("count"):
+                    total_rows = _count_rows(con, query, log)
+        if cache_store is not None:
+            cache_writer = cache_store.writer(cache_key, columns, on_log=on_log)
+            batches = cache_writer.tee(batches)
+        writer = write_parts(batches, encoder, ordered_cols, total_rows, prefetch, sorter)
+        if cache_writer is not None:
+            cache_writer.commit()
+
+        if sizer is not None and sizer.changes:
+            log(f"Fetch batch size: {sizer.initial:,} → {sizer.size:,} rows.")
+
+        result = finish(
+            writer,
+            fetch=fetch_mode,
+            fetch_sizing=sizer.result() if sizer is not None else None,
+            query_id=query_id,
+            resumed=resumed,
+            cache=None if cache_store is None else "refresh" if refresh_cache else "miss",
+            **sort_details(sorter),
+        )
+        if query_state is not None:
+            clear_state(query_state)
+        return result
+
+    except (CsvChunkerError, ChunkWriterError, AsyncQueryError, RowSortError, LocPackingError) as exc:
         raise SnowflakeExportError(str(exc)) from exc
     finally:
+        if cache_writer is not None:
+            cache_writer.discard()
         try:
             if cur is not None:
                 cur.close()
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from app.core.snowflake_auth import SnowflakeAuthConfig, SnowflakeAuthError, authenticate
+
+HEALTH_CHECK_SQL = "select 1"
+# Skip the pre-use health check if the connection was used this recently.
+CHECK_AFTER_S = 60.0
+KEEPALIVE_INTERVAL_S = 15 * 60.0
+
+
+class SnowflakeSession:
+    """One authenticated Snowflake connection shared by worker threads.
+
+    `connection()` hands the connection to one operation at a time (a lock
+    is held for the duration of the `with` block). Before handing it out, a
+    connection idle for more than `check_after` seconds gets a `select 1`
+    health check; a closed or failing connection is replaced by a new one
+    via `authenticate`, which reuses the connector's cached SSO token where
+    it can instead of opening the browser again. `start_keepalive()` pings
+    the connection in the background so the session does not idle out; it
+    never reconnects by itself (that could open a browser unprompted).
+    """
+
+    def __init__(
+        self,
+        *,
+        email: str,
+        insecure_mode: bool = True,
+        config: SnowflakeAuthConfig | None = None,
+        connector=None,  # noqa: ANN001
+        check_after: float = CHECK_AFTER_S,
+        on_log: Callable[[str], None] | None = None,
+    ) -> None:
+        self.email = email
+        self.insecure_mode = insecure_mode
+        self.config = config
+        self.connector = connector
+        self.check_after = check_after
+        self.reconnects = 0
+        self._on_log = on_log
+        self._con = None
+        self._last_ok = 0.0
+        self._suspect = False  # check before the next use regardless of idle time
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._keepalive: threading.Thread | None = None
+
+    def _log(self, msg: str) -> None:
+        if self._on_log:
+            self._on_log(msg)
+
+    def _open(self) -> None:
+        self._con = authenticate(
+            email=self.email,
+            insecure_mode=self.insecure_mode,
+            config=self.config,
+            connector=self.connector,
+        )
+        self._last_ok = time.monotonic()
+
+    def _close_quietly(self) -> None:
+        con, self._con = self._con, None
+        if con is not None:
+            try:
+                con.close()
+            except Exception:
+                pass
+
+    def _healthy(self) -> bool:
+        con = self._con
+        if con is None:
+            return False
+        is_closed = getattr(con, "is_closed", None)
+        if is_closed is not None and is_closed():
+            return False
+        cur = None
+        try:
+            cur = con.cursor()
+            cur.execute(HEALTH_CHECK_SQL)
+            cur.fetchone()
+        except Exception:  # noqa: BLE001
+            return False
+        finally:
+            if cur is not None:
+                try:
+                    cur.close()
+                except Exception:
+                    pass
+        self._last_ok = time.monotonic()
+        return True
+
+    def connect(self) -> None:
+        """Authenticate now (raises SnowflakeAuthError) unless already connected."""
+        with self._lock:
+            if self._con is None:
+                self._open()
+
+    def check(self) -> bool:
+        """Health-check the connection, reconnecting if it is gone. Returns False if that fails."""
+        with self._lock:
+            try:
+                self._ensure(force=True)
+            except SnowflakeAuthError as exc:
+                self._log(f"Snowflake reconnect failed: {exc}")
+                return False
+            return True
+
+    def _ensure(self, *, force: bool = False) -> None:
+        if self._con is None:
+            self._open()
+            return
+        if not (force or self._suspect) and time.monotonic() - self._last_ok < self.check_after:
+            return
+        self._suspect = False
+        if self._healthy():
+            return
+        self._log("Snowflake session expired; reconnecting…")
+        self._close_quietly()
+        self._open()
+        self.reconnects += 1
+        self._log("Reconnected to Snowflake.")
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        """Yield a live connection, held exclusively until the block exits."""
+        with self._lock:
+            self._ensure()
+            try:
+                yield self._con
+            except BaseException:
+                self._suspect = True
+                raise
+            self._last_ok = time.monotonic()
+
+    def start_keepalive(self, interval: float = KEEPALIVE_INTERVAL_S) -> None:
+        """Ping every `interval` seconds on a daemon thread (skipped while the connection is in use)."""
+        if self._keepalive is not None:
+            return
+
+        def run() -> None:
+            while not self._stop.wait(interval):
+                if self._lock.acquire(blocking=False):
+                    try:
+                        if self._con is not None and not self._healthy():
+                            self._suspect = True
+                            self._log("Snowflake session check failed; it will reconnect on next use.")
+                    finally:
+                        self._lock.release()
+
+        self._keepalive = threading.Thread(target=run, name="snowflake-keepalive", daemon=True)
+        self._keepalive.start()
+
+    @property
+    def connected(self) -> bool:
+        return self._con is not None
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._keepalive is not None:
+            self._keepalive.join(timeout=5)
+            self._keepalive = None
+        with self._lock:
+            self._close_quietly()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+# Per-phase timing for chunk/export runs.
+#
+# Phases are accumulated wall-clock seconds (time.perf_counter); the batch
+# iterator wrapper times only the reader/fetcher side, so "write" can be
+# reported as the rest of the write loop.
+
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+def trace_path(output_dir: str | Path, base_name: str) -> Path:
+    return Path(output_dir) / f"{base_name}.trace.json"
+
+
+class RunTimer:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.batch_count = 0
+        self.batch_min: int | None = None
+        self.batch_max = 0
+        self.batch_rows = 0
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def timed_batches(self, batches: Iterable, phase: str, first_phase: str | None = None) -> Iterator:
+        """Yield from `batches`, charging the time spent producing them to `phase`.
+
+        With `first_phase`, the wait for the first batch is recorded separately.
+        """
+        it = iter(batches)
+        name = first_phase or phase
+        while True:
+            t0 = time.perf_counter()
+            try:
+                batch = next(it)
+            except StopIteration:
+                self.add(name, time.perf_counter() - t0)
+                return
+            self.add(name, time.perf_counter() - t0)
+            name = phase
+            n = len(batch)
+            self.batch_count += 1
+            self.batch_rows += n
+            self.batch_max = max(self.batch_max, n)
+            self.batch_min = n if self.batch_min is None else min(self.batch_min, n)
+            yield batch
+
+    def result(self, parts: list[dict] | None = None) -> dict:
+        total = time.perf_counter() - self.started
+        rows = sum(p["rows"] for p in parts or [])
+        data = sum(p["bytes"] for p in parts or [])
+        return {
+            "total_s": round(total, 4),
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "rows_per_s": round(rows / total, 1) if total > 0 else None,
+            "mb_per_s": round(data / 1e6 / total, 2) if total > 0 else None,
+            "batches": {
+                "count": self.batch_count,
+                "min_rows": self.batch_min or 0,
+                "max_rows": self.batch_max,
+                "mean_rows": round(self.batch_rows / self.batch_count, 1) if self.batch_count else 0,
+            },
+            "parts": parts or [],
+        }
+
+
+def write_trace(path: Path, payload: dict) -> None:
+    path.write_text(json.dumps(payload, indent=2, default=str), encoding="utf-8")
@@ -1,7 +1,8 @@
 import sys
 import threading
+from contextlib import nullcontext
 
-from PySide6.QtCore import QEvent, QTimer, Qt
+from PySide6.QtCore import QEvent, Qt
 from PySide6.QtGui import QAction, QPainter, QPixmap
 from PySide6.QtSvg import QSvgRenderer
 from PySide6.QtWidgets import (
@@ -26,7 +27,8 @@ from PySide6.QtWidgets import (
 )
 
 from app.core.brand import APP_NAME, DEPARTMENT, DEVELOPER, LOGO_SVG, MANAGER
-from app.core.snowflake_auth import SnowflakeAuthError, authenticate
+from app.core.snowflake_auth import SnowflakeAuthError
+from app.core.snowflake_session import SnowflakeSession
 from app.core.snowflake_export import (
     ACTIVATE_VIEW_SQL,
     DEFAULT_QUERY,
@@ -198,6 +200,9 @@ class MainWindow(QMainWindow):
         self.use_snowflake = QCheckBox("Pull data from Snowflake (recommended)")
         self.use_snowflake.setChecked(True)
 
+        self.use_cache = QCheckBox("Use the local result cache (reuses today's result; skips Snowflake, may be stale)")
+        self.use_cache.setChecked(False)
+
         self.sf_query = QTextEdit()
         self.sf_query.setPlaceholderText("Snowflake SQL query")
         self.sf_query.setPlainText(DEFAULT_QUERY)
@@ -229,10 +234,23 @@ class MainWindow(QMainWindow):
         self.validate_columns = QCheckBox("Validate required columns (item, loc, locpriority)")
         self.validate_columns.setChecked(True)
 
+        self.check_values = QCheckBox("Check values before writing (locpriority 0–4, item, loc)")
+        self.check_values.setChecked(False)
+
+        self.dedupe = QCheckBox("Remove duplicate rows (reports conflicting priorities)")
+        self.dedupe.setChecked(False)
+
+        self.sort_rows = QCheckBox("Sort rows by location (loc, then item)")
+        self.sort_rows.setChecked(False)
+
+        self.pack_locs = QCheckBox("Keep each location in one file (packs whole locations into the files)")
+        self.pack_locs.setChecked(False)
+
         row = 0
         s3_content.addWidget(self.use_snowflake, row, 0, 1, 3); row += 1
         s3_content.addWidget(QLabel("SQL"), row, 0, Qt.AlignTop)
         s3_content.addWidget(self.sf_query, row, 1, 1, 2); row += 1
+        s3_content.addWidget(self.use_cache, row, 1, 1, 2); row += 1
         s3_content.addWidget(QLabel("Input CSV"), row, 0)
         s3_content.addWidget(self.input_path, row, 1)
         s3_content.addWidget(browse_in, row, 2); row += 1
@@ -243,6 +261,13 @@ class MainWindow(QMainWindow):
         s3_content.addWidget(self.base_name, row, 1, 1, 2); row += 1
         s3_content.addWidget(self.include_header, row, 0, 1, 2)
         s3_content.addWidget(self.validate_columns, row, 2); row += 1
+        s3_content.addWidget(self.check_values, row, 0, 1, 3); row += 1
+        s3_content.addWidget(self.dedupe, row, 0, 1, 3); row += 1
+        s3_content.addWidget(self.sort_rows, row, 0, 1, 3); row += 1
+        s3_content.addWidget(self.pack_locs, row, 0, 1, 3); row += 1
+
+        self.use_snowflake.toggled.connect(self._sync_source_options)
+        self._sync_source_options()
 
         self.step3_box.layout().addLayout(s3_content)
 
@@ -310,16 +335,17 @@ class MainWindow(QMainWindow):
         # ── Internal state ──────────────────────────────────────────
         self._auth_thread: threading.Thread | None = None
         self._authenticated = False
-        self._sf_connection = None  # shared Snowflake connection from Step 1
-
-        # Pulse timer for indeterminate steps
-        self._pulse_timer = QTimer(self)
-        self._pulse_timer.setInterval(30)
-        self._pulse_timer.timeout.connect(self._pulse_tick)
-        self._pulse_value = 0
-        self._pulse_direction = 1
+        self._sf_session: SnowflakeSession | None = None  # shared Snowflake session from Step 1
 
     # ── Helpers ─────────────────────────────────────────────────────
+    def _sync_source_options(self) -> None:
+        # Options the Snowflake export does not apply are greyed out rather than silently ignored.
+        csv_only = "Applies to CSV input only; the Snowflake export writes the query's rows as returned."
+        from_csv = not self.use_snowflake.isChecked()
+        for box in (self.check_values, self.dedupe):
+            box.setEnabled(from_csv)
+            box.setToolTip("" if from_csv else csv_only)
+
     def _set_step_status(self, status_label: QLabel, state: str, text: str) -> None:
         icon = _status_icon(state)
         status_label.setText(f"{icon}  {text}")
@@ -332,22 +358,15 @@ class MainWindow(QMainWindow):
         self.overall_progress.setValue(pct)
         self.overall_progress.setFormat(text)
 
-    def _start_pulse(self) -> None:
-        self._pulse_value = 0
-        self._pulse_direction = 1
-        self.step_progress.setRange(0, 100)
-        self._pulse_timer.start()
-
-    def _stop_pulse(self) -> None:
-        self._pulse_timer.stop()
+    def _start_busy(self) -> None:
+        # Indeterminate until the first real progress report arrives (e.g. while the query runs).
+        self.step_progress.setRange(0, 0)
 
-    def _pulse_tick(self) -> None:
-        self._pulse_value += self._pulse_direction * 2
-        if self._pulse_value >= 100:
-            self._pulse_direction = -1
-        elif self._pulse_value <= 0:
-            self._pulse_direction = 1
-        self.step_progress.setValue(self._pulse_value)
+    def _set_step_progress(self, pct: int) -> None:
+        if self.step_progress.maximum() == 0:
+            self.step_progress.setRange(0, 100)
+            self.step_progress.setFormat("Writing… %p%")
+        self.step_progress.setValue(pct)
 
     def _pick_input(self) -> None:
         path, _ = QFileDialog.getOpenFileName(self, "Select input CSV", "", "CSV Files (*.csv);;All Files (*.*)")
@@ -384,20 +403,29 @@ class MainWindow(QMainWindow):
         self._set_step_status(self.step1_status, "working", "Authenticating…")
         self._set_overall(10, "Step 1/3 — Authenticating…")
 
+        session = SnowflakeSession(
+            email=email,
+            insecure_mode=insecure_mode,
+            on_log=lambda m: self._post_to_ui(lambda: self._append_log(m)),
+        )
+
         def worker() -> None:
             try:
-                con = authenticate(email=email, insecure_mode=insecure_mode)
+                session.connect()
             except (SnowflakeAuthError, Exception) as exc:
                 self._post_to_ui(lambda: self._auth_failed(str(exc)))
                 return
-            self._post_to_ui(lambda: self._auth_ok(con))
+            self._post_to_ui(lambda: self._auth_ok(session))
 
         self._auth_thread = threading.Thread(target=worker, daemon=True)
         self._auth_thread.start()
 
-    def _auth_ok(self, connection=None) -> None:
+    def _auth_ok(self, session: SnowflakeSession) -> None:
         self._authenticated = True
-        self._sf_connection = connection
+        if self._sf_session is not None:
+            self._sf_session.close()
+        self._sf_session = session
+        session.start_keepalive()
         self.sf_auth_btn.setEnabled(True)
         self._set_step_status(self.step1_status, "ok", "Authenticated")
         self.step1_box.setObjectName("StepDone")
@@ -428,12 +456,13 @@ class MainWindow(QMainWindow):
 
         def worker() -> None:
             try:
-                activate_view(
-                    email=email,
-                    insecure_mode=insecure_mode,
-                    connection=self._sf_connection,
-                    on_log=lambda m: self._post_to_ui(lambda: self._append_log(m)),
-                )
+                with self._sf_connection() as connection:
+                    activate_view(
+                        email=email,
+                        insecure_mode=insecure_mode,
+                        connection=connection,
+                        on_log=lambda m: self._post_to_ui(lambda: self._append_log(m)),
+                    )
             except (SnowflakeExportError, Exception) as exc:
                 self._post_to_ui(lambda: self._activate_failed(str(exc)))
                 return
@@ -463,7 +492,12 @@ class MainWindow(QMainWindow):
         base_name = self.base_name.text().strip() or "LOCPRIORITY_UPLOAD"
         include_header = bool(self.include_header.isChecked())
         validate_columns = bool(self.validate_columns.isChecked())
+        check_values = bool(self.check_values.isChecked())
+        dedupe = bool(self.dedupe.isChecked())
+        sort_rows = bool(self.sort_rows.isChecked())
+        pack_locs = bool(self.pack_locs.isChecked())
         use_snowflake = bool(self.use_snowflake.isChecked())
+        use_cache = bool(self.use_cache.isChecked())
 
         if not use_snowflake and not input_csv:
             QMessageBox.warning(self, "Missing input", "Select an input CSV, or enable Snowflake data source.")
@@ -475,27 +509,37 @@ class MainWindow(QMainWindow):
         self.run_btn.setEnabled(False)
         self._set_step_status(self.step3_status, "working", "Running…")
         self._set_overall(70, "Step 3/3 — Generating files…")
-        self._start_pulse()
+        self._start_busy()
         self.step_progress.setFormat("Querying & writing…")
         self.log.clear()
         self._append_log(f"Source: {'Snowflake' if use_snowflake else 'CSV'}")
         self._append_log(f"Output: {output_dir}")
         self._append_log(f"Base name: {base_name}")
 
+        def on_progress(pct: int) -> None:
+            # Already throttled by the core (ProgressThrottle), so at most ~10 posts per second.
+            self._post_to_ui(lambda: self._set_step_progress(pct))
+
         def worker() -> None:
             try:
                 if use_snowflake:
-                    result = export_query_to_chunked_csv(
-                        email=self.sf_email.text().strip(),
-                        query=self.sf_query.toPlainText(),
-                        output_dir=output_dir,
-                        base_name=base_name,
-                        max_rows=60000,
-                        include_header=include_header,
-                        insecure_mode=bool(self.sf_insecure.isChecked()),
-                        connection=self._sf_connection,
-                        on_log=lambda m: self._post_to_ui(lambda: self._append_log(m)),
-                    )
+                    with self._sf_connection() as connection:
+                        result = export_query_to_chunked_csv(
+                            email=self.sf_email.text().strip(),
+                            query=self.sf_query.toPlainText(),
+                            output_dir=output_dir,
+                            base_name=base_name,
+                            max_rows=60000,
+                            include_header=include_header,
+                            insecure_mode=bool(self.sf_insecure.isChecked()),
+                            connection=connection,
+                            async_query=True,
+                            cache=use_cache,
+                            sort=sort_rows,
+                            pack=pack_locs,
+                            on_progress=on_progress,
+                            on_log=lambda m: self._post_to_ui(lambda: self._append_log(m)),
+                        )
                 else:
                     result = chunk_csv(
                         input_csv=input_csv,
@@ -504,7 +548,11 @@ class MainWindow(QMainWindow):
                         max_rows=60000,
                         include_header=include_header,
                         validate_required_columns=validate_columns,
-                        on_progress=None,
+                        check_values=check_values,
+                        dedupe=dedupe,
+                        sort=sort_rows,
+                        pack=pack_locs,
+                        on_progress=on_progress,
                         on_log=lambda m: self._post_to_ui(lambda: self._append_log(m)),
                     )
             except (SnowflakeExportError, SnowflakeAuthError) as exc:
@@ -519,7 +567,6 @@ class MainWindow(QMainWindow):
         threading.Thread(target=worker, daemon=True).start()
 
     def _run_ok(self, result: dict, output_dir: str) -> None:
-        self._stop_pulse()
         self.run_btn.setEnabled(True)
         self.step_progress.setRange(0, 100)
         self.step_progress.setValue(100)
@@ -535,6 +582,14 @@ class MainWindow(QMainWindow):
         self.stat_files.setText(str(files))
         self.stat_rows.setText(f"{rows:,}")
 
+        if result.get("cache") == "hit":
+            self._append_log("⚠ Written from the cached result of an earlier run today, not a fresh query.")
+
+        timings = result.get("timings") or {}
+        if timings.get("phases"):
+            phases = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in timings["phases"].items())
+            self._append_log(f"Timings: {phases} (total {timings['total_s']:.1f}s)")
+
         self._append_log("")
         self._append_log(f"✓ Done — {files} file(s), {rows:,} row(s) written to {output_dir}")
 
@@ -545,7 +600,6 @@ class MainWindow(QMainWindow):
         )
 
     def _run_failed(self, message: str) -> None:
-        self._stop_pulse()
         self.run_btn.setEnabled(True)
         self.step_progress.setRange(0, 100)
         self.step_progress.setValue(0)
@@ -556,13 +610,16 @@ class MainWindow(QMainWindow):
         QMessageBox.critical(self, "Failed", message)
 
 
+    def _sf_connection(self):  # noqa: ANN202
+        """The Step 1 session's connection for one operation, or None to connect on demand."""
+        if self._sf_session is None:
+            return nullcontext()
+        return self._sf_session.connection()
+
     def closeEvent(self, event) -> None:  # noqa: ANN001, N802
-        if self._sf_connection is not None:
-            try:
-                self._sf_connection.close()
-            except Exception:
-                pass
-            self._sf_connection = None
+        if self._sf_session is not None:
+            self._sf_session.close()
+            self._sf_session = None
         super().closeEvent(event)
 
 
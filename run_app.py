@@ -1,5 +1,9 @@
+import multiprocessing
+
 from app.gui.main import main
 
 
 if __name__ == "__main__":
+    # Value checks run in worker processes; needed for the frozen Windows build.
+    multiprocessing.freeze_support()
     raise SystemExit(main())
@@ -0,0 +1 @@
+# Benchmark suite: `python -m tools.bench` (see tools/bench/run.py).
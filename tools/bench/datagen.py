@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+# Synthetic LOCPRIORITY data shaped like the weekly upload.
+#
+# - loc: ~1,200 location codes with Zipf-like skew (a few DCs carry most
+#   rows); about a third are 3xxx VMI buildings.
+# - locpriority: mostly 1, then 2/3, few 0/4.
+# - item: numeric SKUs plus a small share of vendor part numbers that need
+#   quoting (commas, quotes).
+
+import csv
+import random
+from itertools import accumulate, islice
+from pathlib import Path
+from typing import Iterator
+
+SIZES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+COLUMNS = ("item", "loc", "locpriority")
+SEED = 20240101
+
+_PRIORITIES = ("0", "1", "2", "3", "4")
+_PRIORITY_WEIGHTS = (3, 55, 22, 15, 5)
+_LOC_COUNT = 1_200
+_QUOTED_SHARE = 0.01
+
+
+def _locs(rng: random.Random) -> list[str]:
+    vmi = [f"3{n:03d}" for n in rng.sample(range(1000), 400)]
+    stores = [f"{n:04d}" for n in rng.sample(range(4000, 10000), _LOC_COUNT - 400)]
+    locs = vmi + stores
+    rng.shuffle(locs)
+    return locs
+
+
+def generate_rows(rows: int, seed: int = SEED) -> Iterator[tuple[str, str, str]]:
+    """Yield `rows` deterministic `(item, loc, locpriority)` tuples."""
+    rng = random.Random(seed)
+    locs = _locs(rng)
+    loc_weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(locs))))
+    priority_weights = list(accumulate(_PRIORITY_WEIGHTS))
+    batch = 10_000
+    made = 0
+    while made < rows:
+        n = min(batch, rows - made)
+        loc_col = rng.choices(locs, cum_weights=loc_weights, k=n)
+        pri_col = rng.choices(_PRIORITIES, cum_weights=priority_weights, k=n)
+        for i in range(n):
+            sku = made + i
+            if rng.random() < _QUOTED_SHARE:
+                item = f'VP-{sku},{sku % 97} 1/2" PIPE'
+            else:
+                item = str(100000 + sku * 7)
+            yield item, loc_col[i], pri_col[i]
+        made += n
+
+
+def write_csv(path: Path, rows: int, seed: int = SEED) -> Path:
+    with path.open("w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(COLUMNS)
+        gen = generate_rows(rows, seed)
+        while True:
+            chunk = list(islice(gen, 50_000))
+            if not chunk:
+                return path
+            writer.writerows(chunk)
+
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+# In-process stand-in for snowflake.connector, for offline load tests.
+#
+# Pass a FakeSnowflakeConnection as `connection=` to activate_view /
+# export_query_to_chunked_csv. Every query returns the same result (generated
+# LOCPRIORITY rows by default); a FakeProfile shapes how it is served:
+# per-batch latency with jitter, a throughput cap, slow execute/connect and
+# injected failures. `select count(*) from (...)` returns the row count.
+# Sleeps wait on the cursor's cancel event, so cancel()
+# from another thread interrupts a slow fetch immediately.
+
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from itertools import islice
+from typing import Iterable, Iterator, Sequence
+
+from tools.bench.datagen import COLUMNS, SEED, generate_rows
+
+
+class FakeSnowflakeError(Exception):
+    """Raised for injected failures; shaped like snowflake.connector.errors.Error."""
+
+    def __init__(self, msg: str, *, errno: int = 0, sfqid: str | None = None) -> None:
+        super().__init__(msg)
+        self.msg = msg
+        self.errno = errno
+        self.sfqid = sfqid
+
+
+class QueryStatus(Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    SUCCESS = "SUCCESS"
+    FAILED_WITH_ERROR = "FAILED_WITH_ERROR"
+    ABORTED = "ABORTED"
+
+
+# Error numbers the connector uses for these cases.
+ERRNO_CANCELLED = 604
+ERRNO_NETWORK = 251005
+ERRNO_CONNECT = 250001
+ERRNO_SESSION_EXPIRED = 390114
+
+COUNT_PREFIX = "select count(*) from ("
+
+
+@dataclass(frozen=True)
+class FakeProfile:
+    execute_latency: float = 0.0  # seconds before results are available
+    batch_latency: float = 0.0  # seconds per fetched batch
+    rows_per_s: float | None = None  # throughput cap (None: unlimited)
+    jitter: float = 0.0  # +/- fraction applied to each sleep
+    arrow_batch_rows: int = 10_000  # server chunk size for fetch_arrow_batches
+    fail_on_execute: bool = False
+    fail_at_batch: int | None = None  # raise on this fetch (1-based)
+    failure_rate: float = 0.0  # chance that any fetch raises
+    connect_latency: float = 0.0
+    connect_failures: int = 0  # connect() attempts that fail before one succeeds
+    report_rowcount: bool = True  # False: rowcount is -1, as for connectors that do not report it
+    seed: int = SEED
+
+
+@dataclass
+class _Query:
+    sfqid: str
+    sql: str
+    ready_at: float
+    status: QueryStatus = QueryStatus.RUNNING
+
+
+class FakeSnowflakeCursor:
+    def __init__(self, connection: FakeSnowflakeConnection) -> None:
+        self.connection = connection
+        self.profile = connection.profile
+        self.arraysize = 1
+        self.description: list[tuple] | None = None
+        self.rowcount: int | None = None
+        self.sfqid: str | None = None
+        self.batches_fetched = 0
+        self._rows: Iterator[tuple] | None = None
+        self._cancelled = threading.Event()
+        self._rng = random.Random(self.profile.seed)
+        self._closed = False
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        if self.profile.jitter:
+            seconds *= 1 + self._rng.uniform(-self.profile.jitter, self.profile.jitter)
+        if self._cancelled.wait(max(0.0, seconds)):
+            self._raise_cancelled()
+
+    def _raise_cancelled(self) -> None:
+        raise FakeSnowflakeError("SQL execution canceled", errno=ERRNO_CANCELLED, sfqid=self.sfqid)
+
+    def _check_open(self) -> None:
+        if self._closed or self.connection.is_closed():
+            raise FakeSnowflakeError("Cursor is closed", sfqid=self.sfqid)
+        self.connection._check_session()
+
+    def execute(self, command: str, *args, **kwargs) -> FakeSnowflakeCursor:  # noqa: ANN002, ANN003
+        query = self.connection._submit(command)
+        self._sleep(self.profile.execute_latency)
+        return self._attach(query)
+
+    def execute_async(self, command: str, *args, **kwargs) -> dict:  # noqa: ANN002, ANN003
+        self._check_open()
+        query = self.connection._submit(command)
+        self.sfqid = query.sfqid
+        return {"queryId": query.sfqid}
+
+    def get_results_from_sfqid(self, sfqid: str) -> None:
+        query = self.connection._query(sfqid)
+        self._sleep(query.ready_at - time.monotonic())
+        self._attach(query)
+
+    def _attach(self, query: _Query) -> FakeSnowflakeCursor:
+        self._check_open()
+        self.sfqid = query.sfqid
+        if self._cancelled.is_set() or query.status is QueryStatus.ABORTED:
+            query.status = QueryStatus.ABORTED
+            self._raise_cancelled()
+        if self.profile.fail_on_execute:
+            query.status = QueryStatus.FAILED_WITH_ERROR
+            raise FakeSnowflakeError("Injected execute failure", errno=ERRNO_NETWORK, sfqid=query.sfqid)
+        query.status = QueryStatus.SUCCESS
+        self.batches_fetched = 0
+        if query.sql.lstrip().lower().startswith(COUNT_PREFIX):
+            self.description = [("COUNT(*)", None, None, None, None, None, None)]
+            self.rowcount = 1
+            self._rows = iter([(self.connection.row_count,)])
+            return self
+        self.description = [(c, None, None, None, None, None, None) for c in self.connection.columns]
+        self.rowcount = self.connection.row_count if self.profile.report_rowcount else -1
+        self._rows = self.connection._rows()
+        return self
+
+    def _next_batch(self, size: int) -> list[tuple]:
+        self._check_open()
+        if self._rows is None:
+            raise FakeSnowflakeError("No query has been executed", sfqid=self.sfqid)
+        if self._cancelled.is_set():
+            self._raise_cancelled()
+        batch = list(islice(self._rows, size))
+        if not batch:
+            return batch
+        self.batches_fetched += 1
+        profile = self.profile
+        if self.batches_fetched == profile.fail_at_batch or (
+            profile.failure_rate and self._rng.random() < profile.failure_rate
+        ):
+            raise FakeSnowflakeError(
+                f"Injected failure on batch {self.batches_fetched}", errno=ERRNO_NETWORK, sfqid=self.sfqid
+            )
+        delay = profile.batch_latency
+        if profile.rows_per_s:
+            delay += len(batch) / profile.rows_per_s
+        self._sleep(delay)
+        return batch
+
+    def fetchmany(self, size: int | None = None) -> list[tuple]:
+        return self._next_batch(size or self.arraysize)
+
+    def fetchone(self) -> tuple | None:
+        batch = self._next_batch(1)
+        return batch[0] if batch else None
+
+    def fetchall(self) -> list[tuple]:
+        rows = []
+        while batch := self._next_batch(self.profile.arrow_batch_rows):
+            rows.extend(batch)
+        return rows
+
+    def fetch_arrow_batches(self):
+        import pyarrow as pa
+
+        names = list(self.connection.columns)
+        while batch := self._next_batch(self.profile.arrow_batch_rows):
+            yield pa.table({name: list(col) for name, col in zip(names, zip(*batch))})
+
+    def cancel(self) -> None:
+        """Abort the running query; a blocked or later fetch raises errno 604."""
+        self._cancelled.set()
+        if self.sfqid:
+            self.connection._query(self.sfqid).status = QueryStatus.ABORTED
+
+    def abort_query(self, sfqid: str) -> bool:
+        self.connection._query(sfqid).status = QueryStatus.ABORTED
+        if sfqid == self.sfqid:
+            self._cancelled.set()
+        return True
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class FakeSnowflakeConnection:
+    """Connection serving `rows` (a row count to generate, or explicit tuples)."""
+
+    def __init__(
+        self,
+        rows: int | Sequence[tuple] = 100_000,
+        *,
+        columns: Sequence[str] | None = None,
+        profile: FakeProfile | None = None,
+    ) -> None:
+        self.profile = profile or FakeProfile()
+        if isinstance(rows, int):
+            self.row_count = rows
+            self.columns = tuple(columns or (c.upper() for c in COLUMNS))
+            self._source: Iterable[tuple] | None = None
+        else:
+            self.row_count = len(rows)
+            if columns is None:
+                raise ValueError("columns is required with explicit rows")
+            self.columns = tuple(columns)
+            self._source = rows
+        self.queries: list[str] = []
+        self._registry: dict[str, _Query] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.expired = False
+
+    def _rows(self) -> Iterator[tuple]:
+        if self._source is not None:
+            return iter(self._source)
+        return generate_rows(self.row_count, self.profile.seed)
+
+    def _check_session(self) -> None:
+        if self.expired:
+            raise FakeSnowflakeError(
+                "Authentication token has expired.  The user must authenticate again.",
+                errno=ERRNO_SESSION_EXPIRED,
+            )
+
+    def expire(self) -> None:
+        """Make every later call fail like a session whose token has expired."""
+        self.expired = True
+
+    def _submit(self, sql: str) -> _Query:
+        if self._closed:
+            raise FakeSnowflakeError("Connection is closed")
+        self._check_session()
+        with self._lock:
+            sfqid = f"01fake00-0000-{next(self._ids):04x}-0000-000000000000"
+            query = _Query(sfqid, sql, time.monotonic() + self.profile.execute_latency)
+            self._registry[sfqid] = query
+            self.queries.append(sql)
+        return query
+
+    def _query(self, sfqid: str) -> _Query:
+        try:
+            return self._registry[sfqid]
+        except KeyError:
+            raise FakeSnowflakeError(f"No query with id {sfqid}", sfqid=sfqid) from None
+
+    def cursor(self) -> FakeSnowflakeCursor:
+        if self._closed:
+            raise FakeSnowflakeError("Connection is closed")
+        return FakeSnowflakeCursor(self)
+
+    def get_query_status(self, sfqid: str) -> QueryStatus:
+        query = self._query(sfqid)
+        if query.status is QueryStatus.RUNNING and time.monotonic() >= query.ready_at:
+            query.status = (
+                QueryStatus.FAILED_WITH_ERROR if self.profile.fail_on_execute else QueryStatus.SUCCESS
+            )
+        return query.status
+
+    def is_still_running(self, status: QueryStatus) -> bool:
+        return status in (QueryStatus.QUEUED, QueryStatus.RUNNING)
+
+    def is_an_error(self, status: QueryStatus) -> bool:
+        return status in (QueryStatus.FAILED_WITH_ERROR, QueryStatus.ABORTED)
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class FakeConnector:
+    """Stand-in for the `snowflake.connector` module's `connect()`.
+
+    The first `profile.connect_failures` calls raise; every call sleeps
+    `profile.connect_latency` first.
+    """
+
+    def __init__(self, rows: int | Sequence[tuple] = 100_000, **kwargs) -> None:  # noqa: ANN003
+        self.rows = rows
+        self.kwargs = kwargs
+        self.profile = kwargs.get("profile") or FakeProfile()
+        self.attempts = 0
+        self.params: list[dict] = []
+        self.connections: list[FakeSnowflakeConnection] = []
+
+    def connect(self, **params) -> FakeSnowflakeConnection:  # noqa: ANN003
+        self.attempts += 1
+        self.params.append(params)
+        time.sleep(self.profile.connect_latency)
+        if self.attempts <= self.profile.connect_failures:
+            raise FakeSnowflakeError(f"Injected connect failure ({self.attempts})", errno=ERRNO_CONNECT)
+        con = FakeSnowflakeConnection(self.rows, **self.kwargs)
+        self.connections.append(con)
+        return con
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Allow running as: `python tools/bench/run.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.core.arrow_csv import pyarrow_available
+from tools.bench.datagen import SIZES, write_csv
+from tools.bench.fake_snowflake import FakeSnowflakeConnection
+
+BASELINES = Path(__file__).with_name("baselines.json")
+CASES = (
+    "chunk-auto",
+    "chunk-csv",
+    "chunk-gzip",
+    "chunk-zip",
+    "chunk-sort",
+    "chunk-sort-spill",
+    "chunk-pack",
+    "export-rows",
+    "export-arrow",
+    "export-gzip",
+    "export-sort",
+    "export-pack",
+)
+# Cases that write compressed output, and the codec they use.
+CODECS = {"chunk-gzip": "gzip", "chunk-zip": "zip", "export-gzip": "gzip"}
+# Cases that sort by (loc, item), and their sort memory budget in MB (None: the default).
+SORTS = {"chunk-sort": None, "chunk-sort-spill": 16, "export-sort": None}
+# Cases that pack whole locs into the parts (see `LocPacker`).
+PACKS = ("chunk-pack", "export-pack")
+TIME_FLOOR_S = 0.25
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process, or None where it cannot be read."""
+    # On Linux ru_maxrss also counts the parent's RSS at fork time; VmHWM does not.
+    try:
+        with open("/proc/self/status", encoding="ascii") as fp:
+            for line in fp:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        pass
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / 1024 / 1024
+    return None
+
+
+def run_case(case: str, rows: int, input_csv: Path, out_dir: Path) -> dict:
+    """Run one case in this process and return its measurements."""
+    from app.core.csv_chunker import chunk_csv
+    from app.core.snowflake_export import export_query_to_chunked_csv
+
+    codec = CODECS.get(case, "none")
+    sort = case in SORTS
+    pack = case in PACKS
+    t0 = time.perf_counter()
+    if case.startswith("chunk-"):
+        res = chunk_csv(
+            input_csv=str(input_csv),
+            output_dir=str(out_dir),
+            base_name="BENCH",
+            reader="auto" if case in CODECS or sort or pack else case.split("-", 1)[1],
+            sort=sort,
+            sort_memory_mb=SORTS.get(case),
+            pack=pack,
+            codec=codec,
+        )
+    else:
+        res = export_query_to_chunked_csv(
+            email="bench@hdsupply.com",
+            query="select 1",
+            output_dir=str(out_dir),
+            base_name="BENCH",
+            arrow=case == "export-arrow",
+            sort=sort,
+            sort_memory_mb=SORTS.get(case),
+            pack=pack,
+            codec=codec,
+            connection=FakeSnowflakeConnection(rows),
+        )
+    elapsed = time.perf_counter() - t0
+    if res["rows_written"] != rows:
+        raise SystemExit(f"{case}: wrote {res['rows_written']:,} rows, expected {rows:,}")
+    out_mb = sum(Path(p).stat().st_size for p in res["paths"]) / 1e6
+    return {
+        "seconds": round(elapsed, 3),
+        "peak_mb": peak_rss_mb(),
+        "out_mb": round(out_mb, 2),
+        "phases": res["timings"]["phases"],
+    }
+
+
+def _run_isolated(case: str, rows: int, input_csv: Path, td: Path) -> dict:
+    out_dir = Path(tempfile.mkdtemp(prefix=f"{case}-", dir=td))
+    proc = subprocess.run(
+        [sys.executable, "-m", "tools.bench.run", "--worker", case, str(rows), str(input_csv), str(out_dir)],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"{case} ({rows:,} rows) failed:\n{proc.stderr}")
+    for p in out_dir.iterdir():
+        p.unlink()
+    return json.loads(proc.stdout)
+
+
+def check_regression(measured: dict, baseline: dict | None, time_tolerance: float, memory_tolerance: float) -> list:
+    if not baseline:
+        return []
+    problems = []
+    # Sub-second cases are noisy; ignore slowdowns smaller than TIME_FLOOR_S.
+    limit = max(baseline["seconds"] * (1 + time_tolerance), baseline["seconds"] + TIME_FLOOR_S)
+    if measured["seconds"] > limit:
+        problems.append(f"time {measured['seconds']:.2f}s > {limit:.2f}s (baseline {baseline['seconds']:.2f}s)")
+    if measured.get("peak_mb") and baseline.get("peak_mb"):
+        limit = baseline["peak_mb"] * (1 + memory_tolerance)
+        if measured["peak_mb"] > limit:
+            problems.append(f"peak {measured['peak_mb']:.0f} MB > {limit:.0f} MB (baseline {baseline['peak_mb']:.0f} MB)")
+    return problems
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Time chunk_csv and the Snowflake export on synthetic data.")
+    ap.add_argument("--sizes", default="100k,1m", help=f"Comma-separated sizes from {', '.join(SIZES)}.")
+    ap.add_argument("--cases", default=",".join(CASES), help="Comma-separated cases to run.")
+    ap.add_argument("--time-tolerance", type=float, default=0.5, help="Allowed slowdown vs. baseline (0.5 = +50%%).")
+    ap.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed peak-memory growth vs. baseline.")
+    ap.add_argument("--update-baselines", action="store_true", help="Store this run's numbers as the baselines.")
+    ap.add_argument("--worker", nargs=4, metavar=("CASE", "ROWS", "INPUT", "OUT"), help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.worker:
+        case, rows, input_csv, out_dir = args.worker
+        print(json.dumps(run_case(case, int(rows), Path(input_csv), Path(out_dir))))
+        return 0
+
+    sizes = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = [s for s in sizes if s not in SIZES] + [c for c in cases if c not in CASES]
+    if unknown:
+        ap.error(f"unknown size/case: {', '.join(unknown)}")
+    if "export-arrow" in cases and not pyarrow_available():
+        print("pyarrow is not installed; skipping export-arrow.")
+        cases.remove("export-arrow")
+
+    baselines = json.loads(BASELINES.read_text(encoding="utf-8")) if BASELINES.exists() else {}
+    measured_all: dict[str, dict] = {}
+    failures = []
+    print(f"{'case':<16} {'size':>5} {'seconds':>9} {'rows/s':>12} {'out MB':>8} {'peak MB':>9}  vs. baseline")
+    with tempfile.TemporaryDirectory() as td:
+        td_path = Path(td)
+        for size in sizes:
+            rows = SIZES[size]
+            input_csv = write_csv(td_path / f"locpriority-{size}.csv", rows)
+            for case in cases:
+                key = f"{case}/{size}"
+                measured = _run_isolated(case, rows, input_csv, td_path)
+                measured_all[key] = measured
+                problems = check_regression(measured, baselines.get(key), args.time_tolerance, args.memory_tolerance)
+                base = baselines.get(key)
+                delta = f"{measured['seconds'] / base['seconds'] - 1:+.0%}" if base else "new"
+                peak = f"{measured['peak_mb']:9.0f}" if measured["peak_mb"] is not None else f"{'n/a':>9}"
+                print(
+                    f"{case:<16} {size:>5} {measured['seconds']:9.2f} {rows / measured['seconds']:12,.0f} "
+                    f"{measured['out_mb']:8.1f} {peak}  {delta}"
+                )
+                for problem in problems:
+                    failures.append(f"{key}: {problem}")
+            os.remove(input_csv)
+
+    if args.update_baselines:
+        for key, v in measured_all.items():
+            baselines[key] = {"seconds": v["seconds"], "peak_mb": v["peak_mb"] and round(v["peak_mb"], 1)}
+        BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"baselines updated: {BASELINES.relative_to(PROJECT_ROOT)}")
+        return 0
+
+    if failures:
+        print("REGRESSION:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("bench-ok")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
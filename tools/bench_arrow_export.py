@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Allow running as: `python tools/bench_arrow_export.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.core.arrow_csv import load_pyarrow
+from app.core.snowflake_export import export_query_to_chunked_csv
+
+COLUMNS = ["LOCPRIORITY", "ITEM", "LOC"]
+
+
+class FakeArrowCursor:
+    """Offline cursor serving the same result as tuple batches or Arrow tables."""
+
+    def __init__(self, tuple_batches: list[list[tuple]], arrow_tables: list) -> None:
+        self.description = [(c, None, None, None, None, None, None) for c in COLUMNS]
+        self.arraysize = 1
+        self._tuple_batches = tuple_batches
+        self._arrow_tables = arrow_tables
+        self._pos = 0
+
+    def execute(self, query: str) -> None:
+        self._pos = 0
+
+    def fetchmany(self, size: int | None = None) -> list[tuple]:
+        if self._pos >= len(self._tuple_batches):
+            return []
+        batch = self._tuple_batches[self._pos]
+        self._pos += 1
+        return batch
+
+    def fetch_arrow_batches(self):
+        yield from self._arrow_tables
+
+    def close(self) -> None:
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor: FakeArrowCursor) -> None:
+        self._cursor = cursor
+
+    def cursor(self) -> FakeArrowCursor:
+        return self._cursor
+
+    def close(self) -> None:
+        pass
+
+
+def build_result(rows: int, batch_size: int = 10000) -> tuple[list[list[tuple]], list]:
+    pa, _ = load_pyarrow()
+    tuple_batches = []
+    arrow_tables = []
+    for start in range(0, rows, batch_size):
+        idx = range(start, min(rows, start + batch_size))
+        cols = {
+            "LOCPRIORITY": [str(i % 5) for i in idx],
+            "ITEM": [f"SKU{i:08d}" for i in idx],
+            "LOC": [f"{3000 + i % 977}" for i in idx],
+        }
+        arrow_tables.append(pa.table(cols))
+        tuple_batches.append(list(zip(*(cols[c] for c in COLUMNS))))
+    return tuple_batches, arrow_tables
+
+
+def read_rows(out_dir: Path) -> list[list[str]]:
+    rows: list[list[str]] = []
+    for p in sorted(out_dir.glob("*.csv")):
+        with p.open("r", newline="", encoding="utf-8") as fp:
+            reader = csv.reader(fp)
+            next(reader, None)
+            rows.extend(reader)
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Compare the Arrow batch export path with the tuple path.")
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    args = ap.parse_args(argv)
+
+    try:
+        load_pyarrow()
+    except ImportError:
+        print("pyarrow is not installed; nothing to compare.")
+        return 0
+
+    tuple_batches, arrow_tables = build_result(args.rows)
+    timings = {}
+    with tempfile.TemporaryDirectory() as td:
+        outputs = {}
+        for arrow in (False, True):
+            out_dir = Path(td) / ("arrow" if arrow else "rows")
+            out_dir.mkdir()
+            con = FakeConnection(FakeArrowCursor(tuple_batches, arrow_tables))
+            t0 = time.perf_counter()
+            res = export_query_to_chunked_csv(
+                email="bench@hdsupply.com",
+                query="select 1",
+                output_dir=str(out_dir),
+                base_name="BENCH",
+                arrow=arrow,
+                connection=con,
+            )
+            elapsed = time.perf_counter() - t0
+            timings[res["fetch"]] = elapsed
+            outputs[res["fetch"]] = out_dir
+            print(f"{res['fetch']:<6} {elapsed:8.2f}s  {res['rows_written'] / elapsed:12,.0f} rows/s")
+
+        if read_rows(outputs["rows"]) != read_rows(outputs["arrow"]):
+            raise SystemExit("Arrow output does not parse to the same rows as the tuple path.")
+
+    print(f"speedup: x{timings['rows'] / timings['arrow']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
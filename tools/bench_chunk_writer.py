@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Allow running as: `python tools/bench_chunk_writer.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.core.chunk_writer import ChunkWriter, make_projection
+from app.core.csv_chunker import chunk_csv
+from app.core.csv_readers import available_backends
+from app.core.csv_readers import iter_csv_batches
+
+COLUMNS = ["LOCPRIORITY", "ITEM", "LOC"]
+BATCH = 10000
+
+
+def synthetic_rows(n: int):
+    for i in range(n):
+        yield (str(i % 5), f"SKU{i:08d}", f"{3000 + i % 977}")
+
+
+def fetch_batches(n: int):
+    rows = synthetic_rows(n)
+    while True:
+        batch = [r for _, r in zip(range(BATCH), rows)]
+        if not batch:
+            return
+        yield batch
+
+
+def write_input_csv(path: Path, n: int) -> None:
+    with path.open("w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["item", "loc", "locpriority"])
+        writer.writerows((r[1], r[2], r[0]) for r in synthetic_rows(n))
+
+
+# ── Pre-engine reference loops (per-row dicts) ─────────────────────
+def legacy_csv(input_csv: Path, out_dir: Path) -> int:
+    rows = 0
+    with input_csv.open("r", newline="", encoding="utf-8-sig") as in_fp:
+        reader = csv.DictReader(in_fp)
+        with (out_dir / "legacy_csv.csv").open("w", newline="", encoding="utf-8") as out_fp:
+            writer = csv.DictWriter(out_fp, fieldnames=reader.fieldnames, extrasaction="ignore")
+            writer.writeheader()
+            for row in reader:
+                writer.writerow(row)
+                rows += 1
+    return rows
+
+
+def legacy_export(n: int, out_dir: Path) -> int:
+    ordered = ["ITEM", "LOC", "LOCPRIORITY"]
+    rows = 0
+    with (out_dir / "legacy_export.csv").open("w", newline="", encoding="utf-8") as out_fp:
+        writer = csv.writer(out_fp)
+        writer.writerow(ordered)
+        for batch in fetch_batches(n):
+            for row in batch:
+                row_map = dict(zip(COLUMNS, row))
+                writer.writerow([row_map.get(c) for c in ordered])
+                rows += 1
+    return rows
+
+
+# ── Shared engine ──────────────────────────────────────────────────
+def engine_csv(input_csv: Path, out_dir: Path) -> int:
+    with input_csv.open("r", newline="", encoding="utf-8-sig") as in_fp:
+        reader = csv.reader(in_fp)
+        header = next(reader)
+        with ChunkWriter(output_dir=out_dir, base_name="engine_csv", header=header) as writer:
+            writer.write_batches(iter_csv_batches(reader, len(header)))
+    return writer.rows_written
+
+
+def engine_export(n: int, out_dir: Path) -> int:
+    projection = make_projection([1, 2, 0], len(COLUMNS))
+    with ChunkWriter(
+        output_dir=out_dir, base_name="engine_export", header=["ITEM", "LOC", "LOCPRIORITY"], projection=projection
+    ) as writer:
+        writer.write_batches(fetch_batches(n))
+    return writer.rows_written
+
+
+def _time(fn, *args) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    rows = fn(*args)
+    return time.perf_counter() - t0, rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Compare the shared ChunkWriter engine with the per-row dict loops.")
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as td:
+        td_path = Path(td)
+        input_csv = td_path / "in.csv"
+        print(f"generating {args.rows:,} rows…")
+        write_input_csv(input_csv, args.rows)
+
+        results = {}
+        for i, (name, fn, src) in enumerate((
+            ("csv: DictReader/DictWriter", legacy_csv, input_csv),
+            ("csv: ChunkWriter", engine_csv, input_csv),
+            ("export: dict(zip) per row", legacy_export, args.rows),
+            ("export: ChunkWriter", engine_export, args.rows),
+        )):
+            out_dir = td_path / f"out{i}"
+            out_dir.mkdir()
+            elapsed, rows = _time(fn, src, out_dir)
+            if rows != args.rows:
+                raise SystemExit(f"{name}: wrote {rows:,} rows, expected {args.rows:,}")
+            results[name] = elapsed
+            print(f"{name:<30} {elapsed:8.2f}s  {rows / elapsed:12,.0f} rows/s")
+
+        backends = available_backends()
+        if "numpy" in backends:
+            backends.append("bytes")
+        for backend in backends:
+            out_dir = td_path / f"reader-{backend}"
+            out_dir.mkdir()
+            elapsed, _ = _time(
+                lambda: chunk_csv(
+                    input_csv=str(input_csv),
+                    output_dir=str(out_dir),
+                    base_name="B",
+                    reader=backend,
+                    validate_required_columns=backend != "bytes",
+                )
+            )
+            results[f"chunk_csv: {backend} reader"] = elapsed
+            print(f"{'chunk_csv: ' + backend + ' reader':<30} {elapsed:8.2f}s  {args.rows / elapsed:12,.0f} rows/s")
+
+    print(
+        "speedup: csv x{:.2f}, export x{:.2f}".format(
+            results["csv: DictReader/DictWriter"] / results["csv: ChunkWriter"],
+            results["export: dict(zip) per row"] / results["export: ChunkWriter"],
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Allow running as: `python tools/bench_dedupe.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+# Runs one dedupe in a fresh interpreter and reports its peak RSS (Unix only).
+_PROBE = """
+import json, resource, sys, time
+from app.core.csv_chunker import chunk_csv
+t0 = time.perf_counter()
+res = chunk_csv(input_csv=sys.argv[1], output_dir=sys.argv[2], base_name="D", dedupe=True,
+                dedupe_memory_mb=int(sys.argv[3]) or None, validate_required_columns=False)
+print(json.dumps({"elapsed": time.perf_counter() - t0, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  **res["dedupe"]}))
+"""
+
+
+def write_input(path: Path, rows: int) -> None:
+    with path.open("w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["item", "loc", "locpriority"])
+        # Every row appears twice; one pair in 1,000 has a second priority.
+        for i in range(rows):
+            j = i // 2
+            writer.writerow([f"SKU{j:09d}", f"{3000 + j % 977}", str(int(i % 2000 == 1))])
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Peak RSS of chunk_csv(dedupe=True) as the input grows.")
+    ap.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 4_000_000])
+    ap.add_argument("--memory-mb", type=int, default=64, help="Dedupe memory budget (0: the default).")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as td:
+        for rows in args.rows:
+            in_csv = Path(td) / f"in-{rows}.csv"
+            out_dir = Path(td) / f"out-{rows}"
+            out_dir.mkdir()
+            write_input(in_csv, rows)
+            proc = subprocess.run(
+                [sys.executable, "-c", _PROBE, str(in_csv), str(out_dir), str(args.memory_mb)],
+                cwd=PROJECT_ROOT,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            res = json.loads(proc.stdout)
+            print(
+                f"{rows:>12,} rows  {res['elapsed']:7.2f}s  peak RSS {res['rss_mb']:7.1f} MB  "
+                f"dropped {res['duplicates_dropped']:,}  conflicts {res['conflicts']:,}  runs {res['spilled_runs']}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Allow running as: `python tools/bench_export_pipeline.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.core.snowflake_export import export_query_to_chunked_csv
+from tools.bench.datagen import COLUMNS, generate_rows
+from tools.bench.fake_snowflake import FakeProfile, FakeSnowflakeConnection
+
+# (label, prefetch, writers)
+MODES = (("serial", 0, 0), ("writer pool", 0, 2), ("pipeline", 4, 0))
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Time the export's fetch/write overlap at several simulated latencies.")
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--latencies", default="0,2,10", help="Comma-separated per-batch latencies in milliseconds.")
+    ap.add_argument("--arrow", action="store_true")
+    args = ap.parse_args(argv)
+
+    latencies = [float(x) for x in args.latencies.split(",") if x.strip()]
+    # Rows are generated up front so a fetch costs only the simulated latency.
+    rows = list(generate_rows(args.rows))
+    columns = [c.upper() for c in COLUMNS]
+    print(f"{args.rows:,} rows in 10,000-row batches, fetch={'arrow' if args.arrow else 'rows'}")
+    with tempfile.TemporaryDirectory() as td:
+        for latency_ms in latencies:
+            timings = {}
+            for label, prefetch, writers in MODES:
+                out_dir = Path(td) / f"{latency_ms}-{prefetch}-{writers}"
+                out_dir.mkdir()
+                profile = FakeProfile(batch_latency=latency_ms / 1000)
+                t0 = time.perf_counter()
+                res = export_query_to_chunked_csv(
+                    email="bench@hdsupply.com",
+                    query="select 1",
+                    output_dir=str(out_dir),
+                    base_name="BENCH",
+                    writers=writers,
+                    arrow=args.arrow,
+                    prefetch=prefetch,
+                    connection=FakeSnowflakeConnection(rows, columns=columns, profile=profile),
+                )
+                timings[label] = time.perf_counter() - t0
+                wait = res["timings"]["phases"].get("fetch", 0.0)
+                print(
+                    f"latency={latency_ms:5.1f}ms {label:<12} {timings[label]:7.2f}s  "
+                    f"{res['rows_written'] / timings[label]:12,.0f} rows/s  fetch wait {wait:6.2f}s"
+                )
+            print(f"  pipeline vs. serial: x{timings['serial'] / timings['pipeline']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Allow running as: `python tools/bench_fetch_sizing.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.core.snowflake_export import export_query_to_chunked_csv
+from tools.bench.datagen import COLUMNS, generate_rows
+from tools.bench.fake_snowflake import FakeProfile, FakeSnowflakeConnection
+
+# name -> (per-batch latency s, link rows/s, extra columns)
+LINKS = {
+    "lan": (0.002, 2_000_000, 0),
+    "vpn": (0.150, 400_000, 0),
+    "wide": (0.020, 200_000, 40),
+}
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Compare a fixed fetch size with adaptive sizing on simulated links.")
+    ap.add_argument("--rows", type=int, default=500_000)
+    ap.add_argument("--links", default=",".join(LINKS), help="Comma-separated links from " + ", ".join(LINKS))
+    args = ap.parse_args(argv)
+
+    base_rows = list(generate_rows(args.rows))
+    with tempfile.TemporaryDirectory() as td:
+        for link in args.links.split(","):
+            latency, rate, extra = LINKS[link]
+            columns = [c.upper() for c in COLUMNS] + [f"NOTE_{i}" for i in range(extra)]
+            # Wide rows are ~100x larger; a tenth of the rows is enough to cross the memory budget.
+            rows = base_rows
+            if extra:
+                rows = [r + tuple(f"{r[0]}-note-{i:02d}-" * 6 for i in range(extra)) for r in base_rows[: args.rows // 10]]
+            print(f"{link}: {latency * 1000:.0f} ms/batch, {rate:,} rows/s, {len(columns)} columns")
+            timings = {}
+            for label, fetch_size in (("fixed 10k", 10_000), ("adaptive", None)):
+                out_dir = Path(td) / f"{link}-{label}"
+                out_dir.mkdir()
+                profile = FakeProfile(batch_latency=latency, rows_per_s=rate)
+                con = FakeSnowflakeConnection(rows, columns=columns, profile=profile)
+                t0 = time.perf_counter()
+                res = export_query_to_chunked_csv(
+                    email="bench@hdsupply.com",
+                    query="select 1",
+                    output_dir=str(out_dir),
+                    base_name="BENCH",
+                    fetch_size=fetch_size,
+                    connection=con,
+                )
+                timings[label] = time.perf_counter() - t0
+                sizing = res["fetch_sizing"]
+                sizes = " → ".join(f"{c['size']:,} ({c['reason']})" for c in sizing["changes"]) or "-"
+                peak = f"{sizing['peak_batch_mb']:6.1f} MB"
+                batches = res["timings"]["batches"]["count"]
+                print(f"  {label:<10} {timings[label]:7.2f}s  batches={batches:<4} peak batch {peak}  sizes: {sizes}")
+            print(f"  speedup: x{timings['fixed 10k'] / timings['adaptive']:.2f}")
+            del rows
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
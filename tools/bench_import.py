@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Allow running as: `python tools/bench_import.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# Modules the headless CLI must never import on its own.
+FORBIDDEN_PREFIXES = ("PySide6", "shiboken6", "snowflake")
+
+# Cold start budget for `python -m app.cli --help` (seconds).
+COLD_START_BUDGET_S = 1.0
+
+_PROBE = """\
+import json, sys, time
+t0 = time.perf_counter()
+import app.cli
+t1 = time.perf_counter()
+argv = json.loads(sys.argv[1])
+if argv:
+    import contextlib, io
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.cli.main(argv)
+print(json.dumps({
+    "import_s": t1 - t0,
+    "modules": sorted(m for m in sys.modules if m.split(".")[0] in %r),
+}))
+""" % (FORBIDDEN_PREFIXES,)
+
+
+def _python(args: list[str], **kwargs) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(PROJECT_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=str(PROJECT_ROOT),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+        **kwargs,
+    )
+
+
+def _probe(argv: list[str]) -> dict:
+    proc = _python(["-c", _PROBE, json.dumps(argv)])
+    if proc.returncode != 0:
+        raise SystemExit(f"probe failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _cold_start(runs: int = 5) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        proc = _python(["-m", "app.cli", "--help"])
+        elapsed = time.perf_counter() - t0
+        if proc.returncode != 0:
+            raise SystemExit(f"`python -m app.cli --help` failed:\n{proc.stderr}")
+        best = min(best, elapsed)
+    return best
+
+
+def _import_time_top(n: int = 8) -> list[tuple[int, str]]:
+    proc = _python(["-X", "importtime", "-c", "import app.cli"])
+    rows: list[tuple[int, str]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, _, rest = line.partition(":")
+        parts = [p.strip() for p in rest.split("|")]
+        if len(parts) == 3 and parts[1].isdigit():
+            rows.append((int(parts[1]), parts[2]))
+    rows.sort(reverse=True)
+    return rows[:n]
+
+
+def main() -> int:
+    failures: list[str] = []
+
+    probe = _probe([])
+    print(f"import app.cli: {probe['import_s'] * 1000:.1f} ms")
+    if probe["modules"]:
+        failures.append(f"`import app.cli` pulled in: {', '.join(probe['modules'])}")
+
+    with tempfile.TemporaryDirectory() as td:
+        td_path = Path(td)
+        in_csv = td_path / "in.csv"
+        in_csv.write_text("item,loc,locpriority\nSKU1,3001,1\n", encoding="utf-8")
+        probe = _probe(["chunk", "--quiet", "--input", str(in_csv), "--output-dir", str(td_path)])
+        if probe["modules"]:
+            failures.append(f"`chunk` pulled in: {', '.join(probe['modules'])}")
+
+    cold = _cold_start()
+    print(f"cold start (python -m app.cli --help, best of 5): {cold * 1000:.1f} ms")
+    if cold > COLD_START_BUDGET_S:
+        failures.append(f"cold start {cold:.3f}s exceeds budget {COLD_START_BUDGET_S:.3f}s")
+
+    print("slowest imports (cumulative us):")
+    for us, name in _import_time_top():
+        print(f"  {us:>8}  {name}")
+
+    if failures:
+        for f in failures:
+            print("FAIL:", f)
+        return 1
+
+    print("bench-import-ok")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Allow running as: `python tools/bench_validate.py`
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.core.csv_validator import validate_csv
+from tools.bench_chunk_writer import write_input_csv
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Time value validation with one vs. many worker processes.")
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as td:
+        in_csv = Path(td) / "in.csv"
+        write_input_csv(in_csv, args.rows)
+        print(f"input: {args.rows:,} rows, {in_csv.stat().st_size / 1e6:,.1f} MB, {os.cpu_count()} CPU(s)")
+
+        timings = {}
+        reports = {}
+        for workers in sorted({1, args.workers}):
+            t0 = time.perf_counter()
+            reports[workers] = validate_csv(input_csv=str(in_csv), workers=workers)
+            timings[workers] = time.perf_counter() - t0
+            rate = reports[workers]["rows_checked"] / timings[workers]
+            print(f"workers={workers:<3} {timings[workers]:8.2f}s  {rate:12,.0f} rows/s")
+
+        if len({(r["rows_checked"], r["error_count"]) for r in reports.values()}) != 1:
+            raise SystemExit("Worker counts disagree on the validation result.")
+
+    print(f"speedup: x{timings[1] / timings[args.workers]:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,22 @@
 from __future__ import annotations
 
 import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
 import sys
 import tempfile
+import threading
+import time
+import zipfile
+from datetime import date
+from decimal import Decimal
 from pathlib import Path
 
 # Allow running as: `python tools/selftest.py`
@@ -10,7 +24,33 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-from app.core.csv_chunker import chunk_csv
+from app.core.arrow_csv import pyarrow_available
+from app.core.async_query import AsyncQueryError, save_state, state_path, wait_for_query
+from app.core.chunk_writer import ChunkWriter, ChunkWriterError, CsvRowEncoder
+from app.core.csv_chunker import CsvChunkerError, chunk_csv
+from app.core.csv_encode import encode_rows
+from app.core.csv_readers import available_backends, fit_rows
+from app.core.csv_validator import validate_csv
+from app.core.fetch_sizing import AdaptiveFetchSize
+from app.core.loc_packing import pack_groups
+from app.core.priority_rules import evaluate_skuextract
+from app.core.progress import ProgressThrottle
+from app.core.result_cache import ResultCache
+from app.core.snapshot_diff import diff_snapshots
+from app.core.snowflake_session import SnowflakeSession
+from app.core.snowflake_export import (
+    ACTIVATE_VIEW_SQL,
+    SnowflakeExportError,
+    activate_view,
+    export_query_to_chunked_csv,
+)
+from tools.bench.fake_snowflake import (
+    FakeConnector,
+    FakeProfile,
+    FakeSnowflakeConnection,
+    FakeSnowflakeError,
+    QueryStatus,
+)
 
 
 def count_data_rows(path: Path) -> int:
@@ -22,6 +62,1034 @@ def count_data_rows(path: Path) -> int:
         return sum(1 for _ in reader)
 
 
+def read_data_rows(path: Path) -> list[list[str]]:
+    with path.open("r", newline="", encoding="utf-8") as fp:
+        reader = csv.reader(fp)
+        next(reader, None)
+        return list(reader)
+
+
+def read_data_rows_gz(path: Path) -> list[list[str]]:
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as fp:
+        return list(csv.reader(fp))[1:]
+
+
+def _fake_connection(rows: list[tuple], profile: FakeProfile | None = None) -> FakeSnowflakeConnection:
+    return FakeSnowflakeConnection(
+        rows, columns=["LOCPRIORITY", "ITEM", "LOC"], profile=profile or FakeProfile(arrow_batch_rows=7000)
+    )
+
+
+def check_arrow_export(td_path: Path) -> None:
+    rows = [(str(i % 5), f"SKU{i}", None if i % 11 == 0 else f'L,"{i % 7}"') for i in range(61_000)]
+    outputs = {}
+    for arrow in (False, True):
+        out_dir = td_path / f"arrow-{arrow}"
+        out_dir.mkdir()
+        res = export_query_to_chunked_csv(
+            email="selftest@hdsupply.com",
+            query="select 1",
+            output_dir=str(out_dir),
+            base_name="SF",
+            arrow=arrow,
+            connection=_fake_connection(rows),
+        )
+        if set(res["timings"]["phases"]) != {"execute", "first_batch", "fetch", "write"}:
+            raise SystemExit(f"Unexpected export phases: {res['timings']['phases']}")
+        if res["fetch"] != ("arrow" if arrow else "rows"):
+            raise SystemExit(f"Unexpected fetch mode: {res['fetch']}")
+        outputs[arrow] = [read_data_rows(p) for p in sorted(out_dir.glob("SF_*.csv"))]
+    if outputs[False] != outputs[True] or [len(p) for p in outputs[True]] != [60_000, 1_000]:
+        raise SystemExit("Arrow export rows differ from the tuple export")
+
+
+def check_fake_snowflake(td_path: Path) -> None:
+    out_dir = td_path / "fake-sf"
+    out_dir.mkdir()
+    export = dict(email="selftest@hdsupply.com", query="select 1", output_dir=str(out_dir), base_name="FAKE")
+
+    # Throughput cap: 30,000 rows at 300,000 rows/s take at least 0.1 s.
+    con = FakeSnowflakeConnection(30_000, profile=FakeProfile(rows_per_s=300_000, jitter=0.2))
+    t0 = time.perf_counter()
+    res = export_query_to_chunked_csv(**export, connection=con)
+    if res["rows_written"] != 30_000 or time.perf_counter() - t0 < 0.08 or con.is_closed():
+        raise SystemExit(f"Unexpected throttled fake export: {res['rows_written']}")
+
+    # Injected fetch failures surface from the export.
+    try:
+        failing = FakeSnowflakeConnection(50_000, profile=FakeProfile(fail_at_batch=3))
+        export_query_to_chunked_csv(**export, connection=failing)
+    except FakeSnowflakeError as exc:
+        if "batch 3" not in str(exc):
+            raise SystemExit(f"Unexpected injected failure: {exc}") from exc
+    else:
+        raise SystemExit("Injected fetch failure was not raised")
+
+    # The fetch thread yields the same parts as an inline fetch, and stops when the writer fails.
+    rows = [(str(i % 5), f"SKU{i}", f"L{i % 7}") for i in range(70_000)]
+    for prefetch in (0, 4):
+        prefetch_dir = out_dir / f"prefetch-{prefetch}"
+        prefetch_dir.mkdir()
+        export_query_to_chunked_csv(
+            **{**export, "output_dir": str(prefetch_dir)}, prefetch=prefetch, connection=_fake_connection(rows)
+        )
+    inline, threaded = (sorted((out_dir / f"prefetch-{n}").iterdir()) for n in (0, 4))
+    if [p.read_bytes() for p in inline] != [p.read_bytes() for p in threaded] or len(threaded) != 2:
+        raise SystemExit("Prefetched export differs from the inline fetch")
+    # A cursor that reported fewer rows than it returns fails the writer mid-stream.
+    short = _fake_connection(rows)
+    short.row_count = 10
+    try:
+        export_query_to_chunked_csv(**export, connection=short)
+    except SnowflakeExportError as exc:
+        if "counted before writing" not in str(exc):
+            raise SystemExit(f"Unexpected row-count mismatch error: {exc}") from exc
+    else:
+        raise SystemExit("More rows than the cursor reported were accepted")
+    if any(t.name == "snowflake-fetch" for t in threading.enumerate()):
+        raise SystemExit("Fetch thread still running after a failed export")
+
+    # cancel() from another thread interrupts a slow fetch.
+    cur = FakeSnowflakeConnection(1_000, profile=FakeProfile(batch_latency=30)).cursor()
+    cur.execute("select 1")
+    threading.Timer(0.05, cur.cancel).start()
+    t0 = time.perf_counter()
+    try:
+        cur.fetchmany(100)
+    except FakeSnowflakeError as exc:
+        if exc.errno != 604 or time.perf_counter() - t0 > 5:
+            raise SystemExit(f"Unexpected cancel behaviour: {exc}") from exc
+    else:
+        raise SystemExit("Cancelled fetch did not raise")
+
+    # Async submission: RUNNING until execute_latency passes, then results by query id.
+    con = FakeSnowflakeConnection(10, profile=FakeProfile(execute_latency=0.1))
+    sfqid = con.cursor().execute_async("select 1")["queryId"]
+    if not con.is_still_running(con.get_query_status(sfqid)):
+        raise SystemExit("Async query finished immediately")
+    cur = con.cursor()
+    cur.get_results_from_sfqid(sfqid)
+    if con.get_query_status(sfqid) is not QueryStatus.SUCCESS or len(cur.fetchall()) != 10 or cur.rowcount != 10:
+        raise SystemExit("Async query results were not served")
+
+    con = FakeSnowflakeConnection(0)
+    activate_view(connection=con)
+    if con.queries != [ACTIVATE_VIEW_SQL]:
+        raise SystemExit("activate_view did not run through the fake connection")
+
+
+def check_async_query(td_path: Path) -> None:
+    out_dir = td_path / "async"
+    out_dir.mkdir()
+    state_dir = td_path / "async-state"
+    export = dict(
+        email="selftest@hdsupply.com",
+        query="select 1",
+        output_dir=str(out_dir),
+        base_name="AQ",
+        query_state_dir=str(state_dir),
+    )
+    state = state_path(out_dir, "AQ", state_dir)
+
+    # The fake connection stands in for the server: its query registry outlives a failed run.
+    server = FakeSnowflakeConnection(30_000, profile=FakeProfile(execute_latency=0.2, fail_at_batch=2))
+    try:
+        export_query_to_chunked_csv(**export, async_query=True, connection=server)
+    except FakeSnowflakeError:
+        pass
+    else:
+        raise SystemExit("Injected failure did not interrupt the export")
+    saved = json.loads(state.read_text(encoding="utf-8"))
+    if len(server.queries) != 1 or not saved["query_id"]:
+        raise SystemExit(f"Query ID was not saved: {saved}")
+    if any(p.name.endswith(".query.json") for p in out_dir.iterdir()):
+        raise SystemExit("Query state was saved in the output folder")
+
+    # "Restart": the same SQL re-attaches to the saved query instead of running it again.
+    server.profile = FakeProfile()
+    res = export_query_to_chunked_csv(**{**export, "query": "select  1\n"}, async_query=True, connection=server)
+    if not res["resumed"] or res["query_id"] != saved["query_id"] or len(server.queries) != 1:
+        raise SystemExit(f"Export did not resume the saved query: {res['query_id']}, {server.queries}")
+    if res["rows_written"] != 30_000 or state.exists():
+        raise SystemExit("Resumed export did not finish cleanly")
+
+    # Different SQL is submitted fresh; a failed query clears its state.
+    save_state(state, {**saved, "query_sha256": "0" * 64})
+    res = export_query_to_chunked_csv(**export, async_query=True, connection=server)
+    if res["resumed"] or len(server.queries) != 2:
+        raise SystemExit("Stale query state was reused")
+
+    # The same SQL from another snapshot date (current_date() has moved on) or account is not resumed either.
+    for changed in ({"snapshot_date": "2000-01-01"}, {"account": "OTHER-ACCOUNT"}):
+        queries = len(server.queries)
+        save_state(state, {**saved, **changed})
+        res = export_query_to_chunked_csv(**export, async_query=True, connection=server)
+        if res["resumed"] or len(server.queries) != queries + 1:
+            raise SystemExit(f"Query state with {changed} was reused")
+
+    # Waiting stops at the deadline, or as soon as the cancel event is set.
+    slow = FakeSnowflakeConnection(10, profile=FakeProfile(execute_latency=30))
+    sfqid = slow.cursor().execute_async("select 1")["queryId"]
+    cancel = threading.Event()
+    threading.Timer(0.05, cancel.set).start()
+    for kwargs in ({"timeout": 0.1}, {"timeout": None, "cancel": cancel}):
+        t0 = time.perf_counter()
+        try:
+            wait_for_query(slow, sfqid, interval=0.02, **kwargs)
+        except AsyncQueryError:
+            if time.perf_counter() - t0 > 5:
+                raise SystemExit(f"Waiting with {kwargs} took too long")
+        else:
+            raise SystemExit(f"Waiting with {kwargs} did not stop")
+    try:
+        failing = FakeSnowflakeConnection(10, profile=FakeProfile(fail_on_execute=True))
+        export_query_to_chunked_csv(**export, async_query=True, connection=failing)
+    except SnowflakeExportError as exc:
+        if "failed" not in str(exc) or state.exists():
+            raise SystemExit(f"Unexpected failed-query handling: {exc}") from exc
+    else:
+        raise SystemExit("Failed async query was not reported")
+
+
+def check_result_cache(td_path: Path) -> None:
+    cache_dir = td_path / "result-cache"
+    export = dict(email="selftest@hdsupply.com", query="select 1", cache=True, cache_dir=str(cache_dir))
+    rows = [
+        (f'{i % 5}"q' if i % 7 == 0 else str(i % 3), f"ITEM{i:05d}", f"L,{i % 9}" if i % 4 == 0 else None)
+        for i in range(25_000)
+    ]
+    columns = ["LOCPRIORITY", "ITEM", "LOC"]
+    first, second = td_path / "cache-miss", td_path / "cache-hit"
+    first.mkdir()
+    second.mkdir()
+
+    server = FakeSnowflakeConnection(rows, columns=columns)
+    logs: list[str] = []
+    res = export_query_to_chunked_csv(
+        **export, output_dir=str(first), base_name="C", max_rows=10_000, connection=server, on_log=logs.append
+    )
+    if res["cache"] != "miss" or not any("cache miss" in m for m in logs):
+        raise SystemExit(f"Expected a cache miss: {res['cache']}, {logs}")
+
+    # A hit re-chunks without querying Snowflake; whitespace in the SQL does not matter.
+    logs.clear()
+    res = export_query_to_chunked_csv(
+        **{**export, "query": " select\n  1 "},
+        output_dir=str(second),
+        base_name="C",
+        max_rows=10_000,
+        connection=server,
+        on_log=logs.append,
+    )
+    if res["cache"] != "hit" or len(server.queries) != 1 or res["rows_written"] != len(rows):
+        raise SystemExit(f"Expected a cache hit: {res['cache']}, {server.queries}")
+    missed = sorted(p.name for p in first.glob("C_*.csv"))
+    if missed != sorted(p.name for p in second.glob("C_*.csv")) or len(missed) != 3:
+        raise SystemExit(f"Cached export wrote different parts: {missed}")
+    for name in missed:
+        if (first / name).read_bytes() != (second / name).read_bytes():
+            raise SystemExit(f"Cached result differs from the fetched one: {name}")
+
+    # refresh_cache queries anyway (a reloaded table) and replaces the entry.
+    third = td_path / "cache-third"
+    third.mkdir()
+    res = export_query_to_chunked_csv(
+        **export, output_dir=str(third), base_name="C", refresh_cache=True, connection=server, on_log=logs.append
+    )
+    if res["cache"] != "refresh" or len(server.queries) != 2 or not any("cached today at" in m for m in logs):
+        raise SystemExit(f"Expected a cache refresh: {res['cache']}, {server.queries}")
+
+    # The CSV fallback format round-trips rows as the strings the csv module writes.
+    store = ResultCache(td_path / "result-cache-csv", use_arrow=False, max_bytes=1)
+    key = store.key("select 1", account="x", snapshot_date=date(2024, 1, 2))
+    if key == store.key("select 1", account="x", snapshot_date=date(2024, 1, 3)):
+        raise SystemExit("Cache key ignores the snapshot date")
+    writer = store.writer(key, columns)
+    list(writer.tee([rows[:10], rows[10:20]]))
+    writer.commit()
+    entry = store.lookup(key)
+    cached = [row for batch in entry.batches() for row in batch] if entry else []
+    if cached != [tuple("" if v is None else v for v in row) for row in rows[:20]]:
+        raise SystemExit("CSV cache entry did not round-trip")
+
+    # Least recently used entries are evicted past max_bytes; expired ones are dropped.
+    other = store.key("select 2", account="x")
+    writer = store.writer(other, columns)
+    list(writer.tee([rows[:10]]))
+    writer.commit()
+    if store.lookup(key) is not None or store.lookup(other) is None:
+        raise SystemExit("Cache eviction did not keep only the newest entry")
+    store.ttl_s = 0
+    time.sleep(0.01)
+    if store.lookup(other) is not None or list(store.root.glob(f"{other}.*")):
+        raise SystemExit("Expired cache entry was served")
+
+
+def check_snowflake_session() -> None:
+    connector = FakeConnector(0)
+    logs = []
+    session = SnowflakeSession(email="selftest@hdsupply.com", connector=connector, check_after=0, on_log=logs.append)
+    session.connect()
+    if not connector.params[0].get("client_store_temporary_credential"):
+        raise SystemExit("SSO token caching was not requested")
+
+    # One operation at a time across threads.
+    active = []
+    overlaps = []
+
+    def operation() -> None:
+        with session.connection() as con:
+            active.append(con)
+            overlaps.append(len(active))
+            time.sleep(0.01)
+            active.pop()
+
+    threads = [threading.Thread(target=operation) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if max(overlaps) != 1 or connector.attempts != 1:
+        raise SystemExit(f"Session was shared concurrently: {overlaps}, {connector.attempts} connects")
+
+    # An expired connection is replaced before the next operation.
+    connector.connections[-1].expire()
+    with session.connection() as con:
+        activate_view(connection=con)
+    if session.reconnects != 1 or con is not connector.connections[-1] or con.queries[-1] != ACTIVATE_VIEW_SQL:
+        raise SystemExit(f"Expired session was not reconnected: {logs}")
+
+    # The keepalive notices expiry without reconnecting on its own.
+    session.check_after = 3600
+    session.start_keepalive(0.02)
+    connector.connections[-1].expire()
+    time.sleep(0.2)
+    if connector.attempts != 2 or not any("check failed" in m for m in logs):
+        raise SystemExit(f"Keepalive did not flag the expired session: {logs}")
+    with session.connection():
+        pass
+    session.close()
+    if connector.attempts != 3 or not connector.connections[-1].is_closed():
+        raise SystemExit("Session did not reconnect after the keepalive failure, or did not close")
+
+
+def check_fetch_sizing(td_path: Path) -> None:
+    # Fixed 50 ms overhead per batch: rows/s rises with the size until the cap.
+    sizer = AdaptiveFetchSize(10_000, max_size=80_000)
+    for _ in range(40):
+        sizer.observe(sizer.size, 0.05 + sizer.size / 1e6, sizer.size * 100)
+    if sizer.size != 80_000 or sizer.changes[0] != {"batch": 1, "size": 10_000, "reason": "probe"}:
+        raise SystemExit(f"Fetch size did not grow: {sizer.result()}")
+    # 1 KB rows against a 4 MB budget: the probe caps the size below 4,096 rows.
+    sizer = AdaptiveFetchSize(10_000, max_batch_bytes=4 << 20)
+    for _ in range(20):
+        sizer.observe(sizer.size, 0.01, sizer.size * 1024)
+    if not 1_000 <= sizer.size < 4_096:
+        raise SystemExit(f"Fetch size ignored the memory budget: {sizer.result()}")
+
+    # Adaptive and fixed sizes write the same files.
+    rows = [(str(i % 5), f"SKU{i}", f"L{i % 7}") for i in range(150_000)]
+    outputs = {}
+    for fetch_size in (None, 7_000):
+        out_dir = td_path / f"fetch-size-{fetch_size}"
+        out_dir.mkdir()
+        profile = FakeProfile(batch_latency=0.005)
+        res = export_query_to_chunked_csv(
+            email="selftest@hdsupply.com",
+            query="select 1",
+            output_dir=str(out_dir),
+            base_name="FS",
+            fetch_size=fetch_size,
+            connection=_fake_connection(rows, profile),
+        )
+        outputs[fetch_size] = [p.read_bytes() for p in sorted(out_dir.iterdir())]
+        sizing = res["fetch_sizing"]
+        if (fetch_size is None) != bool(sizing["changes"]):
+            raise SystemExit(f"Unexpected fetch sizing: {sizing}")
+    if outputs[None] != outputs[7_000]:
+        raise SystemExit("Adaptive fetch size changed the output")
+
+
+def check_reader_backends(td_path: Path) -> None:
+    # Quoted delimiters, embedded newlines, blank and ragged rows, mixed line endings.
+    tricky = td_path / "tricky.csv"
+    lines = ["\ufeffitem,loc,locpriority"]
+    for i in range(5_000):
+        lines.append(f"SKU{i},{3000 + i % 7},{i % 5}")
+        if i % 997 == 0:
+            lines.append(f'"SKU,{i}","multi\nline",""')
+            lines.append("")
+            lines.append(f"SKU{i}-short,3001")
+    tricky.write_bytes("\r\n".join(lines).encode("utf-8"))
+
+    outputs = {}
+    for backend in available_backends():
+        out_dir = td_path / f"reader-{backend}"
+        out_dir.mkdir()
+        chunk_csv(input_csv=str(tricky), output_dir=str(out_dir), base_name="R", max_rows=1_000, reader=backend)
+        outputs[backend] = {p.name: p.read_bytes() for p in out_dir.iterdir()}
+    for backend, files in outputs.items():
+        if files != outputs["csv"]:
+            raise SystemExit(f"Reader backend {backend} output differs from the csv backend")
+
+
+def check_output_codecs(td_path: Path) -> None:
+    # Compressed parts decompress to the plain parts, for every reader backend and the export.
+    tricky = td_path / "tricky.csv"  # written by check_reader_backends()
+    plain = {p.name: p.read_bytes() for p in (td_path / "reader-csv").iterdir()}
+    readers = available_backends() + (["bytes"] if "numpy" in available_backends() else [])
+    for reader in readers:
+        kwargs = dict(input_csv=str(tricky), base_name="R", max_rows=1_000, reader=reader)
+        if reader == "bytes":
+            kwargs["validate_required_columns"] = False
+            plain_dir = td_path / "codec-bytes-none"
+            plain_dir.mkdir()
+            chunk_csv(**kwargs, output_dir=str(plain_dir))
+            expected = {p.name: p.read_bytes() for p in plain_dir.iterdir()}
+        else:
+            expected = plain
+        for codec in ("gzip", "zip"):
+            out_dir = td_path / f"codec-{reader}-{codec}"
+            out_dir.mkdir()
+            res = chunk_csv(**kwargs, output_dir=str(out_dir), codec=codec, compress_level=1)
+            if codec == "gzip":
+                got = {p.name[: -len(".gz")]: gzip.decompress(p.read_bytes()) for p in out_dir.iterdir()}
+            else:
+                with zipfile.ZipFile(out_dir / "R.zip") as zf:
+                    got = {name: zf.read(name) for name in zf.namelist()}
+            if got != expected or res["files_written"] != len(expected):
+                raise SystemExit(f"{codec} output of the {reader} reader differs from plain CSV")
+
+    out_dir = td_path / "codec-export"
+    out_dir.mkdir()
+    rows = [(str(i % 4), f"SKU{i}", "3001") for i in range(50)]
+    res = export_query_to_chunked_csv(
+        email="selftest@hdsupply.com",
+        query="select 1",
+        output_dir=str(out_dir),
+        base_name="E",
+        codec="gzip",
+        connection=_fake_connection(rows),
+    )
+    if [Path(p).name for p in res["paths"]] != ["E.csv.gz"] or len(read_data_rows_gz(out_dir / "E.csv.gz")) != 50:
+        raise SystemExit(f"Unexpected gzip export output: {res['paths']}")
+    try:
+        chunk_csv(input_csv=str(tricky), output_dir=str(out_dir), base_name="X", codec="rar")
+    except CsvChunkerError:
+        pass
+    else:
+        raise SystemExit("Unknown codec was accepted")
+
+
+def check_preflight(td_path: Path, input_csv: Path) -> None:
+    out_dir = td_path / "preflight"
+    out_dir.mkdir()
+    export = dict(email="selftest@hdsupply.com", query="select 1;", output_dir=str(out_dir), base_name="P")
+
+    # Over max_parts fails before anything is written or fetched.
+    if "numpy" in available_backends():
+        try:
+            chunk_csv(input_csv=str(input_csv), output_dir=str(out_dir), base_name="P", max_rows=60_000, max_parts=2)
+        except CsvChunkerError as exc:
+            if "120,005" not in str(exc):
+                raise SystemExit(f"Unexpected preflight error: {exc}") from exc
+        else:
+            raise SystemExit("chunk_csv max_parts was not checked up front")
+        # Inputs the byte scan cannot split (a stray quote, bare-CR line endings) are counted with the csv reader.
+        for name, data in (("quote", b'item,loc,locpriority\nSK"U1,3001,1\nSKU2,3002,2\n'),
+                           ("cr", b"item,loc,locpriority\rSKU1,3001,1\rSKU2,3002,2\r")):
+            odd_csv = td_path / f"preflight-{name}.csv"
+            odd_csv.write_bytes(data)
+            odd_dir = td_path / f"preflight-{name}"
+            odd_dir.mkdir()
+            res = chunk_csv(input_csv=str(odd_csv), output_dir=str(odd_dir), base_name="P", max_parts=1)
+            if res["rows_written"] != 2 or res["paths"] != [str(odd_dir / "P.csv")] or "count" not in res["timings"]["phases"]:
+                raise SystemExit(f"Unexpected preflight result for the {name} input: {res}")
+            try:
+                chunk_csv(input_csv=str(odd_csv), output_dir=str(odd_dir), base_name="Q", max_rows=1, max_parts=1)
+            except CsvChunkerError as exc:
+                if "2 data rows" not in str(exc):
+                    raise SystemExit(f"Unexpected preflight error for the {name} input: {exc}") from exc
+            else:
+                raise SystemExit(f"chunk_csv max_parts was not checked up front for the {name} input")
+    for profile in (FakeProfile(), FakeProfile(report_rowcount=False)):
+        for prefetch in (4, 0):
+            con = FakeSnowflakeConnection(200_000, profile=profile)
+            fetches = []
+            open_cursor = con.cursor
+
+            def counting_cursor(open_cursor=open_cursor, fetches=fetches):  # noqa: ANN001, ANN202
+                cur = open_cursor()
+                fetchmany = cur.fetchmany
+                cur.fetchmany = lambda *args, **kwargs: fetches.append(1) or fetchmany(*args, **kwargs)
+                return cur
+
+            con.cursor = counting_cursor
+            try:
+                export_query_to_chunked_csv(**export, max_parts=1, prefetch=prefetch, connection=con)
+            except SnowflakeExportError:
+                pass
+            else:
+                raise SystemExit("Export max_parts was not checked up front")
+            counted = [q for q in con.queries if q.startswith("select count(*)")]
+            if len(counted) != (0 if profile.report_rowcount else 1) or fetches:
+                raise SystemExit(f"Unexpected queries or fetches before the preflight failed: {con.queries}, {fetches}")
+    if list(out_dir.iterdir()):
+        raise SystemExit(f"Files were written before the preflight failed: {list(out_dir.iterdir())}")
+
+    # With or without a row count, the naming is decided before writing: the only renames are the
+    # final commit's, each `<name>.partial` -> `<name>`, and no final name exists before it.
+    replace = os.replace
+    renames: list[tuple[str, str, list[str]]] = []
+
+    def recording_replace(src, dst):  # noqa: ANN001, ANN202
+        renames.append((Path(src).name, Path(dst).name, sorted(p.name for p in Path(dst).parent.iterdir())))
+        replace(src, dst)
+
+    os.replace = recording_replace
+    try:
+        for report in (True, False):
+            for n, expected in ((60_000, ["P.csv"]), (60_001, ["P_001.csv", "P_002.csv"]), (0, [])):
+                run_dir = out_dir / f"{report}-{n}"
+                run_dir.mkdir()
+                renames.clear()
+                rows = [(str(i % 5), f"SKU{i}", "3001") for i in range(n)]
+                res = export_query_to_chunked_csv(
+                    **{**export, "output_dir": str(run_dir)},
+                    connection=_fake_connection(rows, FakeProfile(report_rowcount=report)),
+                )
+                names = sorted(p.name for p in run_dir.iterdir())
+                if names != expected or res["rows_written"] != n:
+                    raise SystemExit(f"Unexpected layout for {n:,} rows (rowcount {report}): {names}")
+                if [(src, dst) for src, dst, _ in renames] != [(f"{name}.partial", name) for name in expected]:
+                    raise SystemExit(f"Unexpected renames for {n:,} rows (rowcount {report}): {renames}")
+                if renames and renames[0][2] != [f"{name}.partial" for name in expected]:
+                    raise SystemExit(f"Output existed before the commit for {n:,} rows: {renames[0][2]}")
+    finally:
+        os.replace = replace
+
+
+class _FailingEncoder(CsvRowEncoder):
+    """Raises from the part writer on its `fail_at`-th batch, or kills the process with `crash`.
+
+    With `fail_close_part`, closing that part raises a non-OSError instead.
+    """
+
+    def __init__(self, fail_at: int, *, crash: bool = False, fail_close_part: int | None = None) -> None:
+        super().__init__()
+        self.fail_at = fail_at
+        self.crash = crash
+        self.fail_close_part = fail_close_part
+        self.batches = 0
+        self.parts = 0
+
+    def open(self, fp, header):  # noqa: ANN001, ANN201
+        sink = super().open(fp, header)
+        write = sink.write
+        close = sink.close
+        self.parts += 1
+        part = self.parts
+
+        def failing_close():  # noqa: ANN202
+            close()
+            if part == self.fail_close_part:
+                raise ValueError("encoder bug (injected)")
+
+        sink.close = failing_close
+
+        def failing_write(rows):  # noqa: ANN001, ANN202
+            self.batches += 1
+            if self.batches == self.fail_at:
+                if self.crash:
+                    fp.flush()
+                    os._exit(3)
+                raise OSError("No space left on device (injected)")
+            write(rows)
+
+        sink.write = failing_write
+        return sink
+
+
+def _write_parts(out_dir: Path, encoder: CsvRowEncoder | None, *, writers: int = 2, codec: str = "none") -> dict:
+    rows = [(f"SKU{i}", str(i % 5), "3") for i in range(2_500)]
+    with ChunkWriter(
+        output_dir=out_dir, base_name="A", header=["item", "loc", "locpriority"], encoder=encoder,
+        max_rows=1_000, writers=writers, codec=codec,
+    ) as writer:
+        for start in range(0, len(rows), 100):
+            writer.write_batch(rows[start:start + 100])
+    return writer.result()
+
+
+def check_csv_encode() -> None:
+    # Fuzz: random batches must serialize byte-for-byte like the csv module.
+    rng = random.Random(23)
+    alphabet = ["a", "Z", "7", " ", ",", '"', "\r", "\n", "\t", "é", "\u2603", "'", ";", "\x1e", "\x1f"]
+
+    def value():  # noqa: ANN202
+        kind = rng.random()
+        if kind < 0.6:
+            return "".join(rng.choice(alphabet) for _ in range(rng.randrange(6)))
+        if kind < 0.7:
+            return None
+        return rng.choice([rng.randrange(-10, 10_000), rng.random() * 100, Decimal("3.10"), True, 0])
+
+    for trial in range(3_000):
+        width = rng.randrange(0, 5)
+        rows = [[value() for _ in range(width)] for _ in range(rng.randrange(1, 12))]
+        if trial % 10 == 0:
+            rows.append([value() for _ in range(rng.randrange(4))])  # ragged
+        if trial % 3 == 0:
+            # Mostly plain text rows, as in real batches.
+            rows = [row if rng.random() < 0.2 else (f"SKU{i}", str(i % 7), "1") for i, row in enumerate(rows)]
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        if encode_rows(rows) != buf.getvalue().encode("utf-8"):
+            raise SystemExit(f"encode_rows differs from the csv module for {rows!r}")
+    if encode_rows([]) != b"":
+        raise SystemExit("encode_rows([]) is not empty")
+
+
+def check_atomic_parts(td_path: Path) -> None:
+    out_dir = td_path / "atomic"
+    out_dir.mkdir()
+
+    # A failing part writer (or fetch) leaves nothing behind, not even the parts already finished.
+    for writers, codec in ((0, "none"), (2, "none"), (2, "gzip"), (0, "zip")):
+        run_dir = out_dir / f"fail-{writers}-{codec}"
+        run_dir.mkdir()
+        try:
+            _write_parts(run_dir, _FailingEncoder(fail_at=22), writers=writers, codec=codec)
+        except ChunkWriterError as exc:
+            if "injected" not in str(exc):
+                raise SystemExit(f"Unexpected writer error: {exc}") from exc
+        else:
+            raise SystemExit("Injected write failure was not raised")
+        if list(run_dir.iterdir()):
+            raise SystemExit(f"Failed run left files behind: {sorted(p.name for p in run_dir.iterdir())}")
+    run_dir = out_dir / "fetch"
+    run_dir.mkdir()
+    try:
+        export_query_to_chunked_csv(
+            email="selftest@hdsupply.com", query="select 1;", output_dir=str(run_dir), base_name="A",
+            max_rows=10_000, fetch_size=5_000,
+            connection=FakeSnowflakeConnection(50_000, profile=FakeProfile(fail_at_batch=4)),
+        )
+    except FakeSnowflakeError:
+        pass
+    else:
+        raise SystemExit("Injected fetch failure was not raised")
+    if list(run_dir.iterdir()):
+        raise SystemExit(f"Failed export left files behind: {sorted(p.name for p in run_dir.iterdir())}")
+
+    # A non-OSError while closing the last part (inside close()) is re-raised and still cleans up.
+    run_dir = out_dir / "fail-close"
+    run_dir.mkdir()
+    try:
+        _write_parts(run_dir, _FailingEncoder(fail_at=0, fail_close_part=3), writers=0)
+    except ValueError:
+        pass
+    else:
+        raise SystemExit("Injected close failure was not raised")
+    if list(run_dir.iterdir()):
+        raise SystemExit(f"Failed close left files behind: {sorted(p.name for p in run_dir.iterdir())}")
+
+    # A rename failing partway through the commit takes back the parts already renamed.
+    run_dir = out_dir / "fail-commit"
+    run_dir.mkdir()
+    replace = os.replace
+    calls = []
+
+    def failing_replace(src, dst):  # noqa: ANN001, ANN202
+        calls.append(Path(dst).name)
+        if len(calls) == 2:
+            raise OSError("Permission denied (injected)")
+        replace(src, dst)
+
+    os.replace = failing_replace
+    try:
+        _write_parts(run_dir, None)
+    except ChunkWriterError as exc:
+        if "injected" not in str(exc):
+            raise SystemExit(f"Unexpected commit error: {exc}") from exc
+    else:
+        raise SystemExit("Injected rename failure was not raised")
+    finally:
+        os.replace = replace
+    if calls != ["A_001.csv", "A_002.csv"] or list(run_dir.iterdir()):
+        raise SystemExit(f"Failed commit left files behind: {calls}, {sorted(p.name for p in run_dir.iterdir())}")
+
+    # A killed process leaves only .partial files, which never look like finished upload files.
+    run_dir = out_dir / "crash"
+    run_dir.mkdir()
+    script = (
+        "import sys; from pathlib import Path; sys.path.insert(0, sys.argv[1]); "
+        "from tools.selftest import _FailingEncoder, _write_parts; "
+        "_write_parts(Path(sys.argv[2]), _FailingEncoder(fail_at=22, crash=True))"
+    )
+    proc = subprocess.run([sys.executable, "-c", script, str(PROJECT_ROOT), str(run_dir)], capture_output=True)
+    names = sorted(p.name for p in run_dir.iterdir())
+    if proc.returncode != 3 or not names or not all(n.endswith(".partial") for n in names):
+        raise SystemExit(f"Unexpected files after a crash (exit {proc.returncode}): {names}")
+
+    # A finished run renames every part into place.
+    run_dir = out_dir / "ok"
+    run_dir.mkdir()
+    res = _write_parts(run_dir, None)
+    names = sorted(p.name for p in run_dir.iterdir())
+    if names != ["A_001.csv", "A_002.csv", "A_003.csv"] or [str(run_dir / n) for n in names] != res["paths"]:
+        raise SystemExit(f"Unexpected committed parts: {names}")
+    if sum(count_data_rows(run_dir / n) for n in names) != 2_500:
+        raise SystemExit("Committed parts lost rows")
+
+
+def check_byte_splitting(td_path: Path) -> None:
+    # Same records per part as the parser path, for embedded newlines and quotes.
+    tricky = td_path / "tricky.csv"  # written by check_reader_backends()
+    parsed = {}
+    for reader in ("csv", "bytes"):
+        out_dir = td_path / f"split-{reader}"
+        out_dir.mkdir()
+        res = chunk_csv(
+            input_csv=str(tricky),
+            output_dir=str(out_dir),
+            base_name="B",
+            max_rows=1_000,
+            reader=reader,
+            validate_required_columns=False,
+        )
+        if res["reader"] != reader:
+            raise SystemExit(f"Expected reader {reader}, got {res['reader']}")
+        parsed[reader] = {p.name: fit_rows(read_data_rows(p), 3) for p in out_dir.iterdir()}
+    if parsed["bytes"] != parsed["csv"]:
+        raise SystemExit("Byte-range split differs from the parser path")
+
+
+def check_value_validation(td_path: Path) -> None:
+    # Known bad values at known physical lines, behind quoted multi-line records.
+    path = td_path / "values.csv"
+    lines = ["\ufeffitem,loc,locpriority"]
+    expected = []
+    multiline = 0
+    for i in range(20_000):
+        if i % 4_999 == 0:
+            lines.append(f'"SKU{i}\nnote",3001,1')
+            multiline += 1
+        line_no = len(lines) + 1 + multiline
+        if i % 3_001 == 0:
+            expected.append((line_no, "locpriority"))
+            lines.append(f"SKU{i},3001,7")
+        elif i % 4_001 == 0:
+            expected.append((line_no, "item"))
+            expected.append((line_no, "loc"))
+            lines.append(" ,30 01,2")
+        else:
+            lines.append(f"SKU{i},{3000 + i % 7},{i % 5}")
+    path.write_bytes("\r\n".join(lines).encode("utf-8"))
+
+    reports = [
+        validate_csv(input_csv=str(path), workers=1),
+        validate_csv(input_csv=str(path), workers=3, range_size=8 * 1024),
+    ]
+    for report in reports:
+        found = [(e["line"], e["column"]) for e in report["examples"]]
+        if found != expected[:20] or report["error_count"] != len(expected) or report["rows_checked"] != 20_005:
+            raise SystemExit(f"Value validation mismatch: {report}")
+    if reports[1]["workers"] != 3:
+        raise SystemExit(f"Expected 3 validation workers, got {reports[1]['workers']}")
+
+
+def check_snapshot_diff(td_path: Path) -> None:
+    # Changed, unchanged, new and dropped pairs plus duplicate keys; the reference
+    # is the DEFAULT_QUERY join written as set operations.
+    previous = [(f"SKU{i}", f"{3000 + i % 11}", str(i % 5)) for i in range(30_000)]
+    current = [(f"SKU{i}", f"{3000 + i % 11}", str((i + (i % 7 == 0)) % 5)) for i in range(1_000, 32_000)]
+    previous += [("DUP", "3001", "1"), ("DUP", "3001", "2")]
+    current += [("DUP", "3001", "1"), ("SELF", "GA01", "3"), ("SELF", "GA01", "4"), current[5]]
+    for name, rows in (("previous", previous), ("current", current)):
+        with (td_path / f"{name}.csv").open("w", newline="", encoding="utf-8") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["LocPriority", "Item", "Loc"])
+            writer.writerows((p, item, loc) for item, loc, p in rows)
+
+    old = {}
+    for item, loc, p in previous + current:
+        old.setdefault((item, loc), set()).add(p)
+    expected = {(item, loc, p) for item, loc, p in current if old[(item, loc)] - {p}}
+
+    for mode, max_index_rows in (("memory", 10_000_000), ("sort-merge", 1_000)):
+        out_dir = td_path / f"diff-{mode}"
+        out_dir.mkdir()
+        res = diff_snapshots(
+            previous_csv=str(td_path / "previous.csv"),
+            current_csv=str(td_path / "current.csv"),
+            output_dir=str(out_dir),
+            base_name="DIFF",
+            max_index_rows=max_index_rows,
+        )
+        rows = [tuple(r) for p in sorted(out_dir.iterdir()) for r in read_data_rows(p)]
+        if len(rows) != len(set(rows)) or set(rows) != expected or res["rows_written"] != len(expected):
+            raise SystemExit(f"Snapshot diff ({mode}) differs from the reference join")
+
+
+def check_priority_rules(td_path: Path) -> None:
+    # Every combination of edge values, classified by each engine and by the
+    # view's own SQL (run in SQLite with regexp_like and NULLs for empty fields).
+    locs = ["3001", "3999", "30012", "2001", "3a01", " 3001", ""]
+    sources = ["GA01", "ga01", "GA1", "GA01X", "TX99", ""]
+    others = ["GA01", "TX99", ""]
+    rows = [
+        [f"SKU{i}", loc, s1, s2, s3, ult]
+        for i, (loc, s1, s2, s3, ult) in enumerate(itertools.product(locs, sources, others, others, others))
+    ]
+    rows.append(['"ITEM, 1"', "3001", "GA01\n", "", "", ""])
+    path = td_path / "skuextract.csv"
+    with path.open("w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["ITEM", "LOC", "UDC_SOURCE_1", "UDC_SOURCE_2", "UDC_SOURCE_3", "UDC_ULTIMATE_SOURCE"])
+        writer.writerows(rows)
+
+    db = sqlite3.connect(":memory:")
+    # Snowflake's `$` is end of string; Python's also matches before a trailing newline.
+    db.create_function(
+        "regexp_like",
+        2,
+        lambda value, pattern: None if value is None else re.search(pattern.replace("$", r"\Z"), value) is not None,
+    )
+    db.execute("create table skuextract (item, loc, udc_source_1, udc_source_2, udc_source_3, udc_ultimate_source)")
+    db.executemany("insert into skuextract values (?, ?, ?, ?, ?, ?)", [[v or None for v in r] for r in rows])
+    select = re.search(r"as \((.*)\)\s*$", ACTIVATE_VIEW_SQL, re.S).group(1)
+    select = select.replace("edp.std_jda.skuextract", "skuextract").replace("current_date()", "current_date")
+    expected = sorted([item, loc or "", p] for item, loc, p, _ in db.execute(select))
+
+    engines = ["python", "arrow"] if pyarrow_available() else ["python"]
+    outputs = {}
+    for engine in engines:
+        out_dir = td_path / f"rules-{engine}"
+        out_dir.mkdir()
+        res = evaluate_skuextract(input_csv=str(path), output_dir=str(out_dir), base_name="V", engine=engine)
+        outputs[engine] = {p.name: p.read_bytes() for p in out_dir.iterdir()}
+        got = sorted(r for p in out_dir.iterdir() for r in read_data_rows(p))
+        if got != expected or sum(res["counts"].values()) != len(expected):
+            raise SystemExit(f"Rules engine {engine} differs from ACTIVATE_VIEW_SQL")
+    if outputs.get("arrow", outputs["python"]) != outputs["python"]:
+        raise SystemExit("Arrow rules engine output bytes differ from the python engine")
+
+
+def check_dedupe(td_path: Path) -> None:
+    # Repeats and conflicting priorities, with and without spilling to sorted runs.
+    path = td_path / "dupes.csv"
+    rows = [[f"SKU{i % 12_000}", f"{3000 + i % 4}", str(int(i >= 9_000 and i % 10 == 0))] for i in range(48_000)]
+    with path.open("w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["item", "loc", "locpriority"])
+        writer.writerows(rows)
+    expected = {tuple(r) for r in rows}
+    conflicts = {(i, l) for i, l, _ in expected if (i, l, "0") in expected and (i, l, "1") in expected}
+    if not conflicts:
+        raise SystemExit("Dedupe fixture has no conflicting pairs")
+
+    for label, memory_mb in (("memory", None), ("spill", 1)):
+        out_dir = td_path / f"dedupe-{label}"
+        out_dir.mkdir()
+        res = chunk_csv(
+            input_csv=str(path),
+            output_dir=str(out_dir),
+            base_name="D",
+            max_rows=1_000,
+            dedupe=True,
+            dedupe_memory_mb=memory_mb,
+        )
+        got = [tuple(r) for p in sorted(out_dir.iterdir()) for r in read_data_rows(p)]
+        stats = res["dedupe"]
+        if len(got) != len(set(got)) or set(got) != expected or stats["conflicts"] != len(conflicts):
+            raise SystemExit(f"Dedupe ({label}) result is wrong: {stats}")
+        if (stats["spilled_runs"] > 0) != (label == "spill"):
+            raise SystemExit(f"Dedupe ({label}) spilled {stats['spilled_runs']} run(s)")
+        first_seen = {}
+        for i, r in enumerate(rows):
+            first_seen.setdefault(tuple(r), i)
+        if label == "memory" and got != sorted(expected, key=first_seen.get):
+            raise SystemExit("In-memory dedupe did not keep input order")
+
+
+def check_row_sort(td_path: Path) -> None:
+    # (loc, item) order, stable for repeated pairs, in memory and across spilled runs.
+    path = td_path / "unsorted.csv"
+    rng = random.Random(24)
+    rows = [[f"SKU{rng.randrange(2_000)}", f"{rng.choice('3589')}{rng.randrange(40):03d}", str(i % 5)] for i in range(20_000)]
+    rows[5][0] = 'VP-1,"2"'  # a quoted item goes through the spill files intact
+    with path.open("w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["locpriority", "loc", "item"])
+        writer.writerows([r[2], r[1], r[0]] for r in rows)
+    expected = [[r[2], r[1], r[0]] for r in sorted(rows, key=lambda r: (r[1], r[0]))]
+
+    for label, memory_mb in (("memory", None), ("spill", 1)):
+        out_dir = td_path / f"sort-{label}"
+        out_dir.mkdir()
+        res = chunk_csv(
+            input_csv=str(path), output_dir=str(out_dir), base_name="S", max_rows=3_000, sort=True,
+            sort_memory_mb=memory_mb,
+        )
+        got = [r for p in res["paths"] for r in read_data_rows(Path(p))]
+        if got != expected or res["sort"]["rows"] != len(rows):
+            raise SystemExit(f"Sorted chunk ({label}) is out of order: {res['sort']}")
+        if (res["sort"]["spilled_runs"] > 1) != (label == "spill"):
+            raise SystemExit(f"Sort ({label}) spilled {res['sort']['spilled_runs']} run(s)")
+        if sorted(p.name for p in out_dir.iterdir()) != [f"S_{i:03d}.csv" for i in range(1, 8)]:
+            raise SystemExit(f"Sort left files behind: {sorted(p.name for p in out_dir.iterdir())}")
+
+    # Export: Arrow fetches fall back to rows; a None item sorts as an empty field.
+    fetched = [(str(i % 5), f"SKU{(i * 7919) % 5_000}", f"{3000 + i % 9}") for i in range(30_000)]
+    fetched[7] = ("1", None, "3004")
+    out_dir = td_path / "sort-export"
+    out_dir.mkdir()
+    res = export_query_to_chunked_csv(
+        email="selftest@hdsupply.com", query="select 1;", output_dir=str(out_dir), base_name="S", max_rows=10_000,
+        arrow=True, sort=True, sort_memory_mb=1, connection=_fake_connection(fetched),
+    )
+    got = [r for p in res["paths"] for r in read_data_rows(Path(p))]
+    want = sorted(([r[1] or "", r[2], r[0]] for r in fetched), key=lambda r: (r[1], r[0]))
+    if got != want or res["fetch"] != "rows" or not res["sort"]["spilled_runs"]:
+        raise SystemExit(f"Sorted export is wrong: {res['sort']}, fetch {res['fetch']}")
+
+
+def check_loc_packing(td_path: Path) -> None:
+    # First fit, largest loc first; a loc over one part fills whole parts and packs its remainder.
+    parts, split = pack_groups({"A": 5, "B": 4, "C": 3, "D": 2, "E": 1, "F": 13}, 6)
+    want = [[("F", 6)], [("F", 6)], [("F", 1), ("A", 5)], [("B", 4), ("D", 2)], [("C", 3), ("E", 1)]]
+    if parts != want or split != ["F"]:
+        raise SystemExit(f"Unexpected packing: {parts}, split {split}")
+
+    path = td_path / "unpacked.csv"
+    rng = random.Random(25)
+    locs = [f"{3000 + n}" for n in range(60)]
+    weights = [1 / (n + 1) for n in range(60)]
+    rows = [[f"SKU{i}", rng.choices(locs, weights)[0], str(i % 5)] for i in range(20_000)]
+    rows[3][0] = 'VP-1,"2"'
+    with path.open("w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["item", "loc", "locpriority"])
+        writer.writerows(rows)
+
+    for label, memory_mb in (("memory", None), ("spill", 1)):
+        out_dir = td_path / f"pack-{label}"
+        out_dir.mkdir()
+        res = chunk_csv(
+            input_csv=str(path), output_dir=str(out_dir), base_name="K", max_rows=3_000, pack=True,
+            sort_memory_mb=memory_mb,
+        )
+        packing = res["packing"]
+        files = [read_data_rows(Path(p)) for p in res["paths"]]
+        parts_of: dict[str, set] = {}
+        for index, part in enumerate(files):
+            if len(part) > 3_000 or part != sorted(part, key=lambda r: (r[1], r[0])):
+                raise SystemExit(f"Packed part {index + 1} ({label}) is too big or out of order")
+            for row in part:
+                parts_of.setdefault(row[1], set()).add(index)
+        straddling = sorted(loc for loc, found in parts_of.items() if len(found) > 1)
+        if straddling != sorted(packing["split_loc_examples"]) or not straddling:
+            raise SystemExit(f"Locs straddling parts ({label}): {straddling}, reported {packing['split_loc_examples']}")
+        if sorted(r for part in files for r in part) != sorted(rows):
+            raise SystemExit(f"Packing ({label}) lost or changed rows")
+        if [p["rows"] for p in packing["part_fill"]] != [len(part) for part in files]:
+            raise SystemExit(f"Packing ({label}) fill report does not match the files: {packing['part_fill']}")
+        if packing["parts"] != len(files) or packing["parts"] < packing["min_parts"] or packing["locs"] != 60:
+            raise SystemExit(f"Unexpected packing result ({label}): {packing}")
+        if bool(packing["spilled_parts"]) != (label == "spill"):
+            raise SystemExit(f"Packing ({label}) spilled {packing['spilled_parts']} part(s)")
+        if sorted(p.name for p in out_dir.iterdir()) != [Path(p).name for p in res["paths"]]:
+            raise SystemExit(f"Packing left files behind: {sorted(p.name for p in out_dir.iterdir())}")
+
+    # Three locs of 2,000 rows fit in two parts of 3,000 only by splitting one: over max_parts it fails.
+    path = td_path / "unpackable.csv"
+    with path.open("w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["item", "loc", "locpriority"])
+        writer.writerows([f"SKU{i}", f"{3000 + i % 3}", "1"] for i in range(6_000))
+    out_dir = td_path / "pack-capped"
+    out_dir.mkdir()
+    try:
+        chunk_csv(input_csv=str(path), output_dir=str(out_dir), base_name="K", max_rows=3_000, max_parts=2, pack=True)
+    except CsvChunkerError as exc:
+        if "needs 3 files" not in str(exc):
+            raise SystemExit(f"Unexpected packing error: {exc}")
+    else:
+        raise SystemExit("Packing over max_parts did not fail")
+    if any(out_dir.iterdir()):
+        raise SystemExit("Failed packing left files behind")
+
+    # Export: numeric locs are packed as text, like the sort compares them.
+    fetched = [(str(i % 5), f"SKU{i}", 3000 + (i * 7) % 11) for i in range(12_000)]
+    out_dir = td_path / "pack-export"
+    out_dir.mkdir()
+    res = export_query_to_chunked_csv(
+        email="selftest@hdsupply.com", query="select 1;", output_dir=str(out_dir), base_name="K", max_rows=5_000,
+        arrow=True, pack=True, connection=_fake_connection(fetched),
+    )
+    files = [{r[1] for r in read_data_rows(Path(p))} for p in res["paths"]]
+    if res["rows_written"] != len(fetched) or sum(map(len, files)) != 11 or res["packing"]["split_locs"]:
+        raise SystemExit(f"Packed export is wrong: {res['packing']}")
+
+
+def check_timings(td_path: Path, input_csv: Path) -> None:
+    out_dir = td_path / "timings"
+    out_dir.mkdir()
+    res = chunk_csv(input_csv=str(input_csv), output_dir=str(out_dir), base_name="T", reader="csv", trace=True)
+    timings = res["timings"]
+    parts = timings["parts"]
+    if set(timings["phases"]) != {"validate", "read", "write"} or min(timings["phases"].values()) < 0:
+        raise SystemExit(f"Unexpected chunk phases: {timings['phases']}")
+    if [p["rows"] for p in parts] != [60_000, 60_000, 5] or sum(p["bytes"] for p in parts) == 0:
+        raise SystemExit(f"Unexpected part stats: {parts}")
+    if timings["batches"]["count"] == 0 or timings["batches"]["max_rows"] != 10_000:
+        raise SystemExit(f"Unexpected batch stats: {timings['batches']}")
+    trace = json.loads((out_dir / "T.trace.json").read_text(encoding="utf-8"))
+    if trace["timings"]["parts"] != parts:
+        raise SystemExit("Trace file does not match the result timings")
+
+
+def check_progress(td_path: Path, input_csv: Path) -> None:
+    reported = []
+    throttle = ProgressThrottle(reported.append, min_interval=0, min_delta=5)
+    throttle.start()
+    for done in range(0, 1_001, 7):
+        throttle.update(done, 1_000)
+    throttle.finish()
+    if reported != list(range(0, 100, 5)) + [100]:
+        raise SystemExit(f"Unexpected throttled progress: {reported}")
+
+    # Real runs: starts at 0, ends at 100, never goes backwards.
+    runs = {}
+    backends = available_backends()
+    for backend in backends + (["bytes"] if "numpy" in backends else []):
+        out_dir = td_path / f"progress-{backend}"
+        out_dir.mkdir()
+        runs[backend] = []
+        chunk_csv(
+            input_csv=str(input_csv),
+            output_dir=str(out_dir),
+            base_name="P",
+            reader=backend,
+            on_progress=runs[backend].append,
+        )
+    runs["export"] = []
+    out_dir = td_path / "progress-export"
+    out_dir.mkdir()
+    export_query_to_chunked_csv(
+        email="selftest@hdsupply.com",
+        query="select 1",
+        output_dir=str(out_dir),
+        base_name="SF",
+        connection=_fake_connection([("1", f"SKU{i}", "3001") for i in range(25_000)]),
+        on_progress=runs["export"].append,
+    )
+    for name, values in runs.items():
+        if values[0] != 0 or values[-1] != 100 or values != sorted(values) or len(values) > 102:
+            raise SystemExit(f"Bad progress sequence from {name}: {values}")
+
+
 def main() -> int:
     with tempfile.TemporaryDirectory() as td:
         td_path = Path(td)
@@ -58,6 +1126,97 @@ def main() -> int:
         if counts != [60_000, 60_000, 5]:
             raise SystemExit(f"Unexpected row counts: {counts}")
 
+        # Inline writing must produce byte-identical parts to the writer pool.
+        inline_dir = td_path / "inline"
+        inline_dir.mkdir()
+        chunk_csv(
+            input_csv=str(input_csv),
+            output_dir=str(inline_dir),
+            base_name="TEST",
+            writers=0,
+        )
+        for p in parts:
+            if (inline_dir / p.name).read_bytes() != p.read_bytes():
+                raise SystemExit(f"Inline writer output differs for {p.name}")
+
+        # Single-part naming: <base>.csv by default, <base>_001.csv when numbered.
+        small_csv = td_path / "small.csv"
+        small_csv.write_text("item,loc,locpriority\nSKU1,3001,1\n", encoding="utf-8")
+        for plain, expected in ((True, "SMALL.csv"), (False, "SMALL_001.csv")):
+            small_dir = td_path / f"small-{plain}"
+            small_dir.mkdir()
+            chunk_csv(
+                input_csv=str(small_csv),
+                output_dir=str(small_dir),
+                base_name="SMALL",
+                plain_single_file=plain,
+            )
+            names = [p.name for p in small_dir.iterdir()]
+            if names != [expected]:
+                raise SystemExit(f"Expected [{expected}], got {names}")
+
+        check_reader_backends(td_path)
+        print("reader-backends-ok")
+
+        check_output_codecs(td_path)
+        print("output-codecs-ok")
+
+        check_preflight(td_path, input_csv)
+        print("preflight-ok")
+
+        check_csv_encode()
+        print("csv-encode-ok")
+
+        check_atomic_parts(td_path)
+        print("atomic-parts-ok")
+
+        check_progress(td_path, input_csv)
+        print("progress-ok")
+
+        check_timings(td_path, input_csv)
+        print("timings-ok")
+
+        check_value_validation(td_path)
+        print("value-validation-ok")
+
+        check_snapshot_diff(td_path)
+        print("snapshot-diff-ok")
+
+        check_priority_rules(td_path)
+        print("priority-rules-ok")
+
+        check_dedupe(td_path)
+        print("dedupe-ok")
+
+        check_row_sort(td_path)
+        print("row-sort-ok")
+
+        check_loc_packing(td_path)
+        print("loc-packing-ok")
+
+        check_fake_snowflake(td_path)
+        print("fake-snowflake-ok")
+
+        check_fetch_sizing(td_path)
+        print("fetch-sizing-ok")
+
+        check_snowflake_session()
+        print("snowflake-session-ok")
+
+        check_result_cache(td_path)
+        print("result-cache-ok")
+
+        check_async_query(td_path)
+        print("async-query-ok")
+
+        if "numpy" in available_backends():
+            check_byte_splitting(td_path)
+            print("byte-splitting-ok")
+
+        if pyarrow_available():
+            check_arrow_export(td_path)
+            print("arrow-export-ok")
+
         print("selftest-ok")
         return 0
 